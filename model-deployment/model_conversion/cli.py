@@ -3,7 +3,16 @@ from typing import Literal, Optional
 
 import click
 
+from model_conversion.utils.artifact_registry import ArtifactRegistry
+from model_conversion.utils.cost_model import CostModel
+from model_conversion.utils.espdl_inspector import (
+    diff_espdl,
+    inspect_espdl,
+    inspect_espdl_dir,
+)
 from model_conversion.utils.onnx_converter import OnnxQuantizer
+from model_conversion.utils.sensitivity import SensitivityAnalyzer
+from model_conversion.utils.sweep import QuantizationSweep, load_sweep_configs
 from model_conversion.utils.yolo_converter import YoloConverter
 
 
@@ -30,6 +39,13 @@ def validate_output_dir(ctx, param, value):
     return path
 
 
+def load_dispatching_table(ctx, param, value):
+    """Load an optional YAML dispatching override table"""
+    if value is None:
+        return value
+    return SensitivityAnalyzer.load_dispatching_table(Path(value))
+
+
 def parse_imgsz(ctx, param, value):
     """Parse image size parameter - can be int or tuple"""
     if value is None:
@@ -65,6 +81,12 @@ def cli():
 @click.option("--nms/--no-nms", default=False, help="Add NMS module to ONNX model")
 @click.option("--batch", type=int, default=1, help="Batch size for export")
 @click.option("--device", default="cpu", help="Device to use for export (cpu, cuda, etc.)")
+@click.option(
+    "--registry-dir",
+    type=click.Path(file_okay=False, path_type=Path),
+    default=None,
+    help="Artifact registry reusing earlier exports of the same model and settings, and storing new exports",
+)
 @click.option("--verbose", "-v", is_flag=True, help="Enable verbose output")
 def convert_yolo(
     model: Path,
@@ -78,6 +100,7 @@ def convert_yolo(
     nms: bool,
     batch: int,
     device: str,
+    registry_dir: Optional[Path],
     verbose: bool,
 ):
     """
@@ -127,7 +150,8 @@ def convert_yolo(
             )
 
         # Perform conversion
-        converter.to_onnx(model, output)
+        registry = ArtifactRegistry(registry_dir) if registry_dir else None
+        converter.to_onnx(model, output, registry=registry)
         click.echo(f"Successfully converted {model.name} to ONNX format")
         click.echo(f"Output saved to: {output}")
 
@@ -152,28 +176,240 @@ def convert_yolo(
 @click.argument("calib-dataset-path", type=click.Path(exists=True, path_type=Path), callback=validate_path_exists)
 @click.argument("mixed-precision", type=click.BOOL, default=False)
 @click.option("--calib-steps", type=click.IntRange(min=8), default=8, help="Number of calibration steps")
+@click.option(
+    "--calib-tolerance",
+    type=click.FloatRange(min=0, min_open=True),
+    default=None,
+    help="Stop calibration once activation statistics converged within this tolerance, using at most CALIB_STEPS",
+)
 @click.option("--quant-bits", type=click.Choice([8, 16]), default=8, help="Number of bits used for quantization")
 @click.option("--image-size", type=click.INT, default=640, help="Expected image size of the ONNX model")
 @click.option("--device", type=click.Choice(["cpu", "cuda"], case_sensitive=True), default="cpu")
+@click.option("--num-workers", type=click.IntRange(min=1), default=4, help="Number of calibration decoding threads")
+@click.option("--prefetch", type=click.IntRange(min=1), default=8, help="Number of calibration images decoded ahead")
+@click.option(
+    "--dispatching-table",
+    type=click.Path(exists=True, path_type=Path, dir_okay=False),
+    default=None,
+    callback=load_dispatching_table,
+    help="YAML dispatching override table for mixed precision, e.g., created by the sensitivity command",
+)
+@click.option(
+    "--calib-selection",
+    type=click.Choice(["all", "diverse"]),
+    default="all",
+    help="Calibrate on all images or on a diverse subset of CALIB_STEPS images",
+)
 def quantize_onnx(
     onnx_path: Path,
     espdl_path: Path,
     calib_dataset_path: Path,
     mixed_precision: bool,
     calib_steps: int,
+    calib_tolerance: Optional[float],
     quant_bits: Literal[8, 16],
     image_size: int | tuple[int, int],
     device: Literal["cpu", "cuda"],
+    num_workers: int,
+    prefetch: int,
+    dispatching_table: Optional[dict[str, int]],
+    calib_selection: Literal["all", "diverse"],
 ):
-    quantizer = OnnxQuantizer(calib_dataset_path, image_size, device)
+    quantizer = OnnxQuantizer(calib_dataset_path, image_size, device, num_workers=num_workers, prefetch=prefetch)
+    if calib_selection == "diverse":
+        quantizer.select_calibration_subset(calib_steps)
+    if calib_tolerance is not None:
+        calib_steps = quantizer.converged_calibration_steps(onnx_path, calib_steps, calib_tolerance)
 
     if mixed_precision:
-        quantizer.quantize_mixed_precision(onnx_path, espdl_path, calib_steps, device)
+        quantizer.quantize_mixed_precision(onnx_path, espdl_path, calib_steps, device, dispatching_table)
     else:
         quantizer.quantize_default(onnx_path, espdl_path, calib_steps, quant_bits, device)
 
     click.echo(f"Quantized model stored under {espdl_path.as_posix()}")
 
 
+@cli.command()
+@click.argument("onnx-path", type=click.Path(exists=True, path_type=Path), callback=validate_path_exists)
+@click.argument("calib-dataset-path", type=click.Path(exists=True, path_type=Path), callback=validate_path_exists)
+@click.option("--budgets", default="4,8,16,32", help="Comma-separated numbers of calibration steps to compare")
+@click.option("--eval-images", type=click.IntRange(min=1), default=16, help="Number of held-out images")
+@click.option("--quant-bits", type=click.Choice([8, 16]), default=8, help="Number of bits used for quantization")
+@click.option("--image-size", type=click.INT, default=640, help="Expected image size of the ONNX model")
+@click.option("--device", type=click.Choice(["cpu", "cuda"], case_sensitive=True), default="cpu")
+def calib_report(
+    onnx_path: Path,
+    calib_dataset_path: Path,
+    budgets: str,
+    eval_images: int,
+    quant_bits: Literal[8, 16],
+    image_size: int,
+    device: Literal["cpu", "cuda"],
+):
+    """
+    Report the output quantization error per calibration budget for the first and for a diverse subset of images.
+    """
+    quantizer = OnnxQuantizer(calib_dataset_path, image_size, device)
+    report = quantizer.calibration_budget_report(
+        onnx_path, [int(budget) for budget in budgets.split(",")], num_eval_images=eval_images, quant_bits=quant_bits
+    )
+    click.echo(f"{'budget':>8} {'selection':>10} {'snr_error':>12}")
+    for row in report:
+        click.echo(f"{row['budget']:>8} {row['selection']:>10} {row['snr_error']:>12.5f}")
+
+
+@cli.command()
+@click.argument("onnx-path", type=click.Path(exists=True, path_type=Path), callback=validate_path_exists)
+@click.argument("calib-dataset-path", type=click.Path(exists=True, path_type=Path), callback=validate_path_exists)
+@click.argument("eval-dataset-path", type=click.Path(exists=True, path_type=Path), callback=validate_path_exists)
+@click.argument("output-path", type=click.Path(dir_okay=False, path_type=Path))
+@click.option("--target-snr-error", type=click.FloatRange(min=0), default=0.05, help="Maximum output SNR error")
+@click.option("--calib-steps", type=click.IntRange(min=8), default=8, help="Number of calibration steps")
+@click.option("--eval-images", type=click.IntRange(min=1), default=16, help="Number of images to measure SNR error")
+@click.option("--eval-split", default="val", help="Split of the shards used for evaluation")
+@click.option("--image-size", type=click.INT, default=640, help="Expected image size of the ONNX model")
+@click.option("--device", type=click.Choice(["cpu", "cuda"], case_sensitive=True), default="cpu")
+def sensitivity(
+    onnx_path: Path,
+    calib_dataset_path: Path,
+    eval_dataset_path: Path,
+    output_path: Path,
+    target_snr_error: float,
+    calib_steps: int,
+    eval_images: int,
+    eval_split: str,
+    image_size: int,
+    device: Literal["cpu", "cuda"],
+):
+    """
+    Search the smallest set of int16 layers meeting the target SNR error on the held-out images of EVAL_DATASET_PATH
+    and store it as YAML dispatching table.
+    """
+    quantizer = OnnxQuantizer(calib_dataset_path, image_size, device)
+    analyzer = SensitivityAnalyzer(quantizer, eval_dataset_path, num_eval_images=eval_images, eval_split=eval_split)
+    dispatching_table = analyzer.search(onnx_path, target_snr_error, calib_steps)
+    analyzer.save_dispatching_table(dispatching_table, output_path)
+    click.echo(f"{len(dispatching_table)} int16 layers stored under {output_path.as_posix()}")
+
+
+@cli.command()
+@click.argument("sweep-yaml", type=click.Path(exists=True, path_type=Path, dir_okay=False))
+@click.argument("onnx-path", type=click.Path(exists=True, path_type=Path), callback=validate_path_exists)
+@click.argument("calib-dataset-path", type=click.Path(exists=True, path_type=Path), callback=validate_path_exists)
+@click.argument("eval-shards-dir", type=click.Path(exists=True, path_type=Path), callback=validate_path_exists)
+@click.argument("output-dir", type=click.Path(path_type=Path), callback=validate_output_dir)
+@click.option("--eval-split", default="val", help="Split of the shards used for evaluation")
+@click.option("--eval-images", type=click.IntRange(min=1), default=None, help="Maximum number of evaluation images")
+@click.option("--image-size", type=click.INT, default=640, help="Expected image size of the ONNX model")
+@click.option("--workers", type=click.IntRange(min=1), default=4, help="Number of parallel quantization processes")
+@click.option(
+    "--latency-table",
+    type=click.Path(exists=True, path_type=Path, dir_okay=False),
+    default=None,
+    help="YAML latency table of the cost model, fitted to device measurements",
+)
+@click.option("--max-latency-ms", type=click.FloatRange(min=0), default=None, help="Reject slower configurations")
+def sweep(
+    sweep_yaml: Path,
+    onnx_path: Path,
+    calib_dataset_path: Path,
+    eval_shards_dir: Path,
+    output_dir: Path,
+    eval_split: str,
+    eval_images: Optional[int],
+    image_size: int,
+    workers: int,
+    latency_table: Optional[Path],
+    max_latency_ms: Optional[float],
+):
+    """
+    Quantize the model with all configurations of SWEEP_YAML in parallel and report mAP, size and latency.
+    """
+    configs = load_sweep_configs(sweep_yaml)
+    quantization_sweep = QuantizationSweep(
+        onnx_path,
+        calib_dataset_path,
+        eval_shards_dir,
+        image_size,
+        eval_split=eval_split,
+        num_eval_images=eval_images,
+        num_workers=workers,
+        cost_model=CostModel.from_yaml(latency_table) if latency_table else None,
+        max_latency_ms=max_latency_ms,
+    )
+    report = quantization_sweep.run(configs, output_dir)
+    click.echo(report.drop(columns="config").to_string(index=False))
+
+
+@cli.command()
+@click.argument("onnx-path", type=click.Path(exists=True, path_type=Path), callback=validate_path_exists)
+@click.option("--quant-bits", type=click.Choice([8, 16]), default=8, help="Number of bits used for quantization")
+@click.option(
+    "--dispatching-table",
+    type=click.Path(exists=True, path_type=Path, dir_okay=False),
+    default=None,
+    callback=load_dispatching_table,
+    help="YAML dispatching override table for mixed precision",
+)
+@click.option(
+    "--latency-table",
+    type=click.Path(exists=True, path_type=Path, dir_okay=False),
+    default=None,
+    help="YAML latency table of the cost model, fitted to device measurements",
+)
+@click.option("--per-layer/--no-per-layer", default=False, help="Print costs per layer")
+def estimate_cost(
+    onnx_path: Path,
+    quant_bits: Literal[8, 16],
+    dispatching_table: Optional[dict[str, int]],
+    latency_table: Optional[Path],
+    per_layer: bool,
+):
+    """
+    Estimate MACs, weight size, peak activation memory and ESP32-S3 latency of a model without quantizing it.
+    """
+    cost_model = CostModel.from_yaml(latency_table) if latency_table else CostModel()
+    cost = cost_model.estimate_onnx(onnx_path, quant_bits, dispatching_table)
+    if per_layer:
+        click.echo(cost.to_dataframe().to_string(index=False))
+    for key, value in cost.summary().items():
+        click.echo(f"{key}: {value:.2f}")
+    if not cost.fits_memory():
+        click.echo("❌ Peak activation memory exceeds the PSRAM of the board", err=True)
+
+
+@cli.command()
+@click.argument("espdl-path", type=click.Path(exists=True, path_type=Path), callback=validate_path_exists)
+@click.option(
+    "--diff",
+    "other_path",
+    type=click.Path(exists=True, path_type=Path, dir_okay=False),
+    default=None,
+    help="Second .espdl model to compare against",
+)
+@click.option("--per-layer/--no-per-layer", default=False, help="Print sizes, bit-widths and exponents per layer")
+def inspect_model(espdl_path: Path, other_path: Optional[Path], per_layer: bool):
+    """
+    Break down the size of an .espdl model, compare two models, or summarize all models of a directory.
+    """
+    if espdl_path.is_dir():
+        click.echo(inspect_espdl_dir(espdl_path).to_string(index=False))
+        return
+
+    summary = inspect_espdl(espdl_path)
+    if other_path is not None:
+        other = inspect_espdl(other_path)
+        click.echo(diff_espdl(summary, other).to_string(index=False))
+        for key, value in summary.summary().items():
+            click.echo(f"{key}: {value:.2f} -> {other.summary()[key]:.2f}")
+        return
+
+    if per_layer:
+        click.echo(summary.per_layer().to_string(index=False))
+    click.echo(summary.per_block().to_string(index=False))
+    for key, value in summary.summary().items():
+        click.echo(f"{key}: {value:.2f}")
+
+
 if __name__ == "__main__":
     cli()
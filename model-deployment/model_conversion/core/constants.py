@@ -4,6 +4,8 @@ DEVICE: Final[str] = 'cpu'
 TARGET_SOC: Final[str] = 'esp32s3'
 NUM_OF_BITS: Final[int] = 8
 CALIB_STEPS: Final[int] = 8
+SHARD_INDEX_FILE: Final[str] = 'index.json'
+PSRAM_BYTES: Final[int] = 8 * 1024 * 1024  # XIAO ESP32-S3 Sense
 
 IMAGE_SIZE: Final[int] = 640
 BATCH_SIZE: Final[int] = 1
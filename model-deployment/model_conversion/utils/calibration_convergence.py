@@ -0,0 +1,133 @@
+import logging
+from itertools import islice
+from pathlib import Path
+from typing import Callable, Iterable, Optional
+
+import numpy as np
+import onnx
+import onnxruntime as ort
+import torch
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+logger = logging.getLogger(__name__)
+
+# number of bins of the KL calibration histograms of PPQ for int8 (cf. TorchHistObserver)
+HIST_BINS = 4096
+
+
+def _activation_session(onnx_model_path: Path) -> tuple[ort.InferenceSession, list[str]]:
+    """Creates an onnxruntime session that returns all float activations of the model"""
+    model = onnx.shape_inference.infer_shapes(onnx.load(onnx_model_path.as_posix()))
+    outputs = {output.name for output in model.graph.output}
+    for value_info in model.graph.value_info:
+        if value_info.name not in outputs and value_info.type.tensor_type.elem_type == onnx.TensorProto.FLOAT:
+            model.graph.output.append(value_info)
+    session = ort.InferenceSession(model.SerializeToString(), providers=["CPUExecutionProvider"])
+    return session, [output.name for output in session.get_outputs()]
+
+
+def _converged_step(
+    changes: Callable[[list[np.ndarray]], list[float]],
+    activations: Iterable[list[np.ndarray]],
+    tolerance: float,
+    min_steps: int,
+    patience: int,
+) -> Optional[int]:
+    """First step after which all statistics changed at most by the tolerance for patience consecutive steps"""
+    stable_steps: Optional[np.ndarray] = None
+    for step, values in enumerate(activations, start=1):
+        change = np.asarray(changes(values))
+        if step == 1:
+            stable_steps = np.zeros(len(change), dtype=np.int64)
+            continue
+        stable_steps = np.where(change <= tolerance, stable_steps + 1, 0)  # type: ignore
+        if step >= min_steps and stable_steps.min(initial=patience) >= patience:
+            return step
+    return None
+
+
+def calibration_steps_until_convergence(
+    onnx_model_path: Path,
+    dataloader: Iterable[torch.Tensor],
+    max_steps: int,
+    tolerance: float = 0.01,
+    min_steps: int = 8,
+    patience: int = 2,
+) -> int:
+    """
+    Estimates the number of calibration steps after which the activation statistics of PPQ's KL calibration settled.
+
+    The FP32 model is run with onnxruntime on the calibration inputs. As in PPQ's two-phase calibration, the running
+    min/max range of every activation is tracked first, then the histograms of absolute values within the settled
+    ranges. A statistic counts as converged once its relative range change or the KL divergence of consecutive
+    histograms stayed within the tolerance for a number of consecutive steps.
+    :param onnx_model_path: Path to .onnx model file
+    :param dataloader: Calibration inputs of shape [1, C, H, W]
+    :param max_steps: Maximum number of calibration steps
+    :param tolerance: Maximum relative range change and histogram KL divergence per step
+    :param min_steps: Minimum number of calibration steps
+    :param patience: Number of consecutive steps within the tolerance until a statistic counts as converged
+    :return: Number of calibration steps covering both calibration phases
+    """
+    session, output_names = _activation_session(onnx_model_path)
+    input_name = session.get_inputs()[0].name
+
+    def inputs() -> Iterable[torch.Tensor]:
+        # PPQ iterates the calibration data repeatedly if it holds fewer images than calibration steps
+        while True:
+            empty = True
+            for x in dataloader:
+                empty = False
+                yield x
+            if empty:
+                raise ValueError("No calibration data found")
+
+    def activations() -> Iterable[list[np.ndarray]]:
+        for x in islice(inputs(), max_steps):
+            yield session.run(output_names, {input_name: x.cpu().numpy()})
+
+    # phase 1: running min/max ranges
+    ranges: dict[int, tuple[float, float]] = {}
+
+    def range_changes(values: list[np.ndarray]) -> list[float]:
+        changes = []
+        for idx, value in enumerate(values):
+            current = (float(value.min()), float(value.max()))
+            previous = ranges.get(idx, current)
+            current = (min(current[0], previous[0]), max(current[1], previous[1]))
+            width = max(current[1] - current[0], 1e-12)
+            changes.append((abs(current[0] - previous[0]) + abs(current[1] - previous[1])) / width)
+            ranges[idx] = current
+        return changes
+
+    range_steps = _converged_step(range_changes, activations(), tolerance, min_steps, patience) or max_steps
+
+    # phase 2: histograms of absolute values within the ranges seen so far, like TorchHistObserver
+    hist_scale = {idx: max(abs(low), abs(high), 1e-12) / HIST_BINS for idx, (low, high) in ranges.items()}
+    histograms: dict[int, np.ndarray] = {}
+
+    def histogram_changes(values: list[np.ndarray]) -> list[float]:
+        changes = []
+        for idx, value in enumerate(values):
+            bins = np.minimum(np.abs(value).ravel() / hist_scale[idx], HIST_BINS - 1).astype(np.int64)
+            current = histograms.get(idx, np.zeros(HIST_BINS, dtype=np.int64)) + np.bincount(bins, minlength=HIST_BINS)
+            if idx in histograms:
+                p = current / current.sum()
+                q = histograms[idx] / histograms[idx].sum()
+                changes.append(float(np.sum(p * np.log((p + 1e-10) / (q + 1e-10)))))
+            else:
+                changes.append(np.inf)
+            histograms[idx] = current
+        return changes
+
+    hist_steps = _converged_step(histogram_changes, activations(), tolerance, min_steps, patience) or max_steps
+
+    steps = max(range_steps, hist_steps)
+    if steps < max_steps:
+        logger.info(
+            f"Activation statistics converged after {steps} of at most {max_steps} calibration steps "
+            f"(ranges: {range_steps}, histograms: {hist_steps})"
+        )
+    else:
+        logger.info(f"Activation statistics did not converge within {max_steps} calibration steps, using all steps")
+    return steps
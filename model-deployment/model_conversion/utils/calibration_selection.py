@@ -0,0 +1,101 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Sequence
+
+import numpy as np
+from PIL import Image
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+logger = logging.getLogger(__name__)
+
+
+class CalibrationSetSelector:
+    """
+    Selects a small but diverse calibration subset from a directory of images.
+
+    Every image is described by cheap global statistics (color and luminance histograms plus a coarse luminance
+    layout). A greedy k-center search then picks the images that cover the descriptor space best, e.g., night, rain
+    and empty racks are picked before the hundredth daylight frame of the same rack.
+    """
+
+    def __init__(self, hist_bins: int = 16, grid_size: int = 4, thumbnail_size: int = 64, num_workers: int = 4) -> None:
+        """
+        :param hist_bins: Number of histogram bins per color channel and for luminance
+        :param grid_size: Size of the coarse luminance grid describing the image layout
+        :param thumbnail_size: Images are downscaled to this size before computing descriptors
+        :param num_workers: Number of threads used for decoding images
+        """
+        self.hist_bins = hist_bins
+        self.grid_size = grid_size
+        self.thumbnail_size = thumbnail_size
+        self.num_workers = num_workers
+
+    def describe(self, image_path: Path) -> np.ndarray:
+        """
+        Computes the descriptor of a single image
+        :param image_path: Path to image file
+        :return: Descriptor vector
+        """
+        with Image.open(image_path) as img:
+            # JPEG draft mode decodes at a reduced scale, which is much cheaper than a full decode
+            img.draft("RGB", (self.thumbnail_size, self.thumbnail_size))
+            img = img.convert("RGB").resize((self.thumbnail_size, self.thumbnail_size), Image.Resampling.BILINEAR)
+            rgb = np.asarray(img, dtype=np.int32)
+            luminance = np.asarray(img.convert("L"), dtype=np.int32)
+
+        parts = []
+        for channel_values in (rgb[..., 0], rgb[..., 1], rgb[..., 2], luminance):
+            hist = np.bincount(channel_values.ravel() * self.hist_bins // 256, minlength=self.hist_bins)
+            parts.append(hist / hist.sum())
+
+        cell = self.thumbnail_size // self.grid_size
+        grid = luminance[: cell * self.grid_size, : cell * self.grid_size].astype(np.float32)
+        grid = grid.reshape(self.grid_size, cell, self.grid_size, cell).mean(axis=(1, 3)) / 255
+        parts.append(grid.ravel())
+        return np.concatenate(parts).astype(np.float32)
+
+    def compute_descriptors(self, image_paths: Sequence[Path]) -> np.ndarray:
+        """
+        Computes descriptors for all images in parallel
+        :param image_paths: Paths to image files
+        :return: Descriptor matrix of shape [N, D]
+        """
+        with ThreadPoolExecutor(max_workers=self.num_workers) as pool:
+            return np.stack(list(pool.map(self.describe, image_paths)))
+
+    @staticmethod
+    def k_center_order(descriptors: np.ndarray, budget: int) -> list[int]:
+        """
+        Greedy k-center (farthest point) selection. The search starts at the most typical image, i.e., the image
+        closest to the mean descriptor, and adds the image farthest from all selected images in each step.
+        The first k indices are a k-center solution for every k <= budget.
+        :param descriptors: Descriptor matrix of shape [N, D]
+        :param budget: Number of images to select
+        :return: Indices of selected images in selection order
+        """
+        budget = min(budget, len(descriptors))
+        if budget <= 0:
+            return []
+        first = int(np.argmin(np.linalg.norm(descriptors - descriptors.mean(axis=0), axis=1)))
+        selected = [first]
+        min_dist = np.linalg.norm(descriptors - descriptors[first], axis=1)
+        while len(selected) < budget:
+            nxt = int(np.argmax(min_dist))
+            selected.append(nxt)
+            min_dist = np.minimum(min_dist, np.linalg.norm(descriptors - descriptors[nxt], axis=1))
+        return selected
+
+    def select(self, image_paths: Sequence[Path], budget: int) -> list[Path]:
+        """
+        Selects a maximally diverse subset of images
+        :param image_paths: Candidate images
+        :param budget: Number of images to select
+        :return: Selected image paths in selection order
+        """
+        if budget >= len(image_paths):
+            return list(image_paths)
+        descriptors = self.compute_descriptors(image_paths)
+        order = self.k_center_order(descriptors, budget)
+        logger.info(f"Selected {len(order)} of {len(image_paths)} images for calibration")
+        return [image_paths[i] for i in order]
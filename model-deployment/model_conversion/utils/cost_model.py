@@ -0,0 +1,244 @@
+import logging
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Any, Optional
+
+import numpy as np
+import pandas as pd
+import torch
+import yaml
+from ppq import BaseGraph, Operation, QuantableOperation, TargetPlatform, TorchExecutor
+from ppq.api import load_onnx_graph
+
+from model_conversion.core.constants import PSRAM_BYTES
+from model_conversion.utils.data import get_onnx_input_shape
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+logger = logging.getLogger(__name__)
+
+# Coarse ESP32-S3 defaults per op type and bit-width. Replace them by a latency table fitted to measurements of the
+# yolo11_detect project on the board (cf. CostModel.from_yaml).
+DEFAULT_LATENCY_TABLE: dict[str, dict[int, dict[str, float]]] = {
+    "Conv": {
+        8: {"ns_per_mac": 4.0, "ns_per_element": 0.0, "overhead_us": 30.0},
+        16: {"ns_per_mac": 10.0, "ns_per_element": 0.0, "overhead_us": 30.0},
+    },
+    "Gemm": {
+        8: {"ns_per_mac": 5.0, "ns_per_element": 0.0, "overhead_us": 30.0},
+        16: {"ns_per_mac": 12.0, "ns_per_element": 0.0, "overhead_us": 30.0},
+    },
+    "default": {
+        8: {"ns_per_mac": 0.0, "ns_per_element": 6.0, "overhead_us": 20.0},
+        16: {"ns_per_mac": 0.0, "ns_per_element": 10.0, "overhead_us": 20.0},
+        32: {"ns_per_mac": 0.0, "ns_per_element": 40.0, "overhead_us": 20.0},
+    },
+}
+
+
+def _num_bytes(num_bits: int) -> int:
+    for num_bytes in (1, 2, 4):
+        if num_bits <= 8 * num_bytes:
+            return num_bytes
+    return 8
+
+
+def _numel(shape: Optional[list]) -> int:
+    if not shape or any(not isinstance(dim, int) for dim in shape):
+        return 0
+    return int(np.prod(shape))
+
+
+@dataclass
+class LayerCost:
+    """Static cost of a single operation"""
+
+    name: str
+    op_type: str
+    num_bits: int
+    macs: int
+    weight_bytes: int
+    output_bytes: int
+    live_bytes: int
+    latency_ms: float
+
+
+@dataclass
+class GraphCost:
+    """Static cost of a graph"""
+
+    layers: list[LayerCost]
+
+    @property
+    def macs(self) -> int:
+        return sum(layer.macs for layer in self.layers)
+
+    @property
+    def weight_bytes(self) -> int:
+        return sum(layer.weight_bytes for layer in self.layers)
+
+    @property
+    def peak_activation_bytes(self) -> int:
+        return max((layer.live_bytes for layer in self.layers), default=0)
+
+    @property
+    def latency_ms(self) -> float:
+        return sum(layer.latency_ms for layer in self.layers)
+
+    def fits_memory(self, memory_bytes: int = PSRAM_BYTES) -> bool:
+        """Whether the peak of simultaneously live activations fits into the given memory"""
+        return self.peak_activation_bytes <= memory_bytes
+
+    def to_dataframe(self) -> pd.DataFrame:
+        return pd.DataFrame([asdict(layer) for layer in self.layers])
+
+    def summary(self) -> dict[str, Any]:
+        return {
+            "mmacs": self.macs / 1e6,
+            "weight_kb": self.weight_bytes / 1024,
+            "peak_activation_kb": self.peak_activation_bytes / 1024,
+            "latency_ms": self.latency_ms,
+        }
+
+
+class CostModel:
+    """
+    Offline latency and memory estimate of quantized graphs for the ESP32-S3.
+
+    The model walks the graph in execution order and computes per-layer MACs, weight bytes and activation sizes.
+    Activations are considered live from their producer until their last consumer, which yields the peak activation
+    memory of the schedule. Latency is estimated per op type and bit-width from a latency table of the form
+    ``{op_type: {bits: {ns_per_mac, ns_per_element, overhead_us}}}`` with a ``default`` entry for other op types.
+    """
+
+    def __init__(self, latency_table: Optional[dict[str, dict[int, dict[str, float]]]] = None) -> None:
+        """
+        :param latency_table: Latency table. Defaults to coarse ESP32-S3 estimates.
+        """
+        self.latency_table = latency_table or DEFAULT_LATENCY_TABLE
+
+    @classmethod
+    def from_yaml(cls, latency_table_path: Path) -> "CostModel":
+        """
+        Creates a cost model from a YAML latency table. Op types missing in the file fall back to the defaults.
+        :param latency_table_path: Path to .yaml latency table
+        """
+        with latency_table_path.open("r") as f:
+            raw = yaml.safe_load(f) or {}
+        latency_table = {**DEFAULT_LATENCY_TABLE}
+        for op_type, entries in raw.items():
+            latency_table[op_type] = {int(bits): dict(entry) for bits, entry in entries.items()}
+        return cls(latency_table)
+
+    def _latency_entry(self, op_type: str, num_bits: int) -> dict[str, float]:
+        entries = self.latency_table.get(op_type, self.latency_table["default"])
+        # use the entry of the closest bit-width if the table has no entry for num_bits
+        return entries[min(entries, key=lambda bits: abs(bits - num_bits))]
+
+    @staticmethod
+    def _macs(operation: Operation) -> int:
+        output_numel = _numel(operation.outputs[0].shape)
+        if operation.type == "Conv":
+            return output_numel * _numel(list(operation.inputs[1].shape or [])[1:])
+        if operation.type in {"Gemm", "MatMul"}:
+            input_shape = operation.inputs[0].shape or []
+            return output_numel * (input_shape[-1] if input_shape and isinstance(input_shape[-1], int) else 0)
+        if operation.type == "ConvTranspose":
+            weight_shape = operation.inputs[1].shape or []
+            return _numel(operation.inputs[0].shape) * _numel(list(weight_shape)[1:])
+        return 0
+
+    @staticmethod
+    def _num_bits(operation: Operation, bits_override: Optional[dict[str, int]], default_bits: int) -> int:
+        if isinstance(operation, QuantableOperation):
+            return operation.config.input_quantization_config[0].num_of_bits
+        if bits_override is not None:
+            return bits_override.get(operation.name, default_bits)
+        return 32
+
+    def estimate(
+        self, graph: BaseGraph, bits_override: Optional[dict[str, int]] = None, default_bits: int = 8
+    ) -> GraphCost:
+        """
+        Estimates the cost of a graph. Variable shapes must be known, e.g., after quantization or tracing.
+        :param graph: PPQ graph. Bit-widths are taken from the quantization configs of quantized operations.
+        :param bits_override: Bit-widths of operations of an unquantized graph
+        :param default_bits: Bit-width of unquantized operations not listed in bits_override
+        :return: Per-layer and total costs
+        """
+        schedule = graph.topological_sort()
+        position = {operation.name: idx for idx, operation in enumerate(schedule)}
+        bits = {op.name: self._num_bits(op, bits_override, default_bits) for op in schedule}
+
+        # activations are live from their producer (or the graph start) until their last consumer (or the graph end)
+        live_ranges = []
+        for var in graph.variables.values():
+            if var.is_parameter or (var.source_op is None and not var.dest_ops):
+                continue
+            producer = var.source_op
+            start = position[producer.name] if producer is not None else 0
+            end = max((position[op.name] for op in var.dest_ops), default=start)
+            if var.name in graph.outputs:
+                end = len(schedule) - 1
+            num_bits = bits[producer.name] if producer is not None else bits[var.dest_ops[0].name]
+            live_ranges.append((start, end, _numel(var.shape) * _num_bytes(num_bits)))
+
+        live_bytes = np.zeros(len(schedule), dtype=np.int64)
+        for start, end, num_bytes in live_ranges:
+            live_bytes[start : end + 1] += num_bytes
+
+        layers = []
+        for idx, operation in enumerate(schedule):
+            num_bits = bits[operation.name]
+            weight_bytes = 0
+            for pos, var in enumerate(operation.inputs):
+                if not var.is_parameter:
+                    continue
+                param_bits = num_bits
+                if isinstance(operation, QuantableOperation):
+                    param_bits = operation.config.input_quantization_config[pos].num_of_bits
+                weight_bytes += _numel(var.shape) * _num_bytes(param_bits)
+            output_bytes = sum(_numel(var.shape) for var in operation.outputs) * _num_bytes(num_bits)
+
+            macs = self._macs(operation)
+            entry = self._latency_entry(operation.type, num_bits)
+            latency_us = (
+                entry["overhead_us"]
+                + entry["ns_per_mac"] * macs / 1e3
+                + entry["ns_per_element"] * _numel(operation.outputs[0].shape) / 1e3
+            )
+            layers.append(
+                LayerCost(
+                    name=operation.name,
+                    op_type=operation.type,
+                    num_bits=num_bits,
+                    macs=macs,
+                    weight_bytes=weight_bytes,
+                    output_bytes=output_bytes,
+                    live_bytes=int(live_bytes[idx]),
+                    latency_ms=latency_us / 1e3,
+                )
+            )
+        return GraphCost(layers)
+
+    def estimate_onnx(
+        self,
+        onnx_model_path: Path,
+        num_bits: int = 8,
+        dispatching_override: Optional[dict[str, int]] = None,
+    ) -> GraphCost:
+        """
+        Estimates the cost of an .onnx model before quantization, e.g., to reject candidates early.
+        :param onnx_model_path: Path to .onnx model file
+        :param num_bits: Bit-width of all layers not listed in dispatching_override
+        :param dispatching_override: Mapping of operation names to int values of TargetPlatform
+        :return: Per-layer and total costs
+        """
+        graph = load_onnx_graph(onnx_import_file=onnx_model_path.as_posix())
+        executor = TorchExecutor(graph=graph, device="cpu")
+        executor.tracing_operation_meta(inputs=torch.zeros(get_onnx_input_shape(onnx_model_path)))
+        # int16 platforms of ESP-DL carry INT16 in their name
+        bits_override = {
+            op_name: 16 if "INT16" in TargetPlatform(platform).name else 8
+            for op_name, platform in (dispatching_override or {}).items()
+        }
+        return self.estimate(graph, bits_override=bits_override, default_bits=num_bits)
@@ -1,9 +1,14 @@
+import queue
+import threading
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
 from pathlib import Path
-from typing import Literal
+from typing import Iterator, Literal, Optional
 
+import onnx
 import torch
 from PIL import Image
-from torch.utils.data import Dataset
+from torch.utils.data import Dataset, IterableDataset
 from torchvision import transforms
 
 
@@ -11,11 +16,15 @@ class CalibrationDataset(Dataset):
     """Yolo11 calibration dataset"""
 
     def __init__(
-        self, image_dir: Path, img_size: int | tuple[int, int], device: Literal["cpu", "cuda"] = "cpu"
+        self,
+        image_dir: Path,
+        img_size: int | tuple[int, int],
+        device: Literal["cpu", "cuda"] = "cpu",
+        image_files: Optional[list[Path]] = None,
     ) -> None:
         self.image_dir = image_dir
         self.device = device
-        self.image_files = list(image_dir.glob("*.jpg"))
+        self.image_files = list(image_dir.glob("*.jpg")) if image_files is None else image_files
 
         self.transform = transforms.Compose(
             [
@@ -31,3 +40,111 @@ class CalibrationDataset(Dataset):
         img = Image.open(self.image_files[idx].as_posix()).convert('RGB')  # 0~255 hwc #RGB
         img = self.transform(img)
         return img  # type: ignore
+
+
+def get_onnx_input_shape(onnx_model_path: Path, batch_size: int = 1) -> list[int]:
+    """
+    Reads the input shape of the first graph input from an ONNX model without loading external weights.
+    Symbolic (dynamic) batch dimensions are replaced by the given batch size.
+    :param onnx_model_path: Path to .onnx model file
+    :param batch_size: Batch size used for a dynamic batch dimension
+    :return: Input shape of form [N, C, H, W]
+    """
+    model = onnx.load(onnx_model_path.as_posix(), load_external_data=False)
+    initializers = {initializer.name for initializer in model.graph.initializer}
+    graph_inputs = [graph_input for graph_input in model.graph.input if graph_input.name not in initializers]
+    if not graph_inputs:
+        raise ValueError(f"ONNX model {onnx_model_path.as_posix()} has no graph inputs")
+
+    dims = graph_inputs[0].type.tensor_type.shape.dim
+    shape = [dim.dim_value if dim.HasField("dim_value") and dim.dim_value > 0 else -1 for dim in dims]
+    if shape and shape[0] == -1:
+        shape[0] = batch_size
+    if -1 in shape:
+        raise ValueError(f"ONNX model input has dynamic dimensions other than the batch dimension: {shape}")
+    return shape
+
+
+class PrefetchingCalibrationLoader:
+    """
+    Calibration data feeder for PPQ that decodes images ahead of time in worker threads.
+
+    Yields tensors with a batch dimension of one in dataset order. Image decoding and resizing mostly release the GIL,
+    so a few threads keep PPQ busy without the overhead of DataLoader worker processes.
+    """
+
+    def __init__(
+        self, dataset: Dataset, num_workers: int = 4, prefetch: int = 8, device: Literal["cpu", "cuda"] = "cpu"
+    ) -> None:
+        """
+        :param dataset: Calibration dataset returning image tensors of shape [C, H, W]
+        :param num_workers: Number of decoding threads
+        :param prefetch: Maximum number of decoded images held ahead of the consumer
+        :param device: Device used for quantization. Tensors are pinned for faster transfers if cuda is used.
+        """
+        if num_workers < 1:
+            raise ValueError(f"At least one worker is required, received {num_workers}")
+        self.dataset = dataset
+        self.num_workers = num_workers
+        self.prefetch = max(prefetch, num_workers)
+        self.pin_memory = device == "cuda" and torch.cuda.is_available()
+
+    def __len__(self) -> int:
+        return len(self.dataset)  # type: ignore
+
+    def __iter__(self) -> Iterator[torch.Tensor]:
+        if isinstance(self.dataset, IterableDataset):
+            yield from self._iter_stream()
+        else:
+            yield from self._iter_indexed()
+
+    def _load(self, idx: int) -> torch.Tensor:
+        x = self.dataset[idx]
+        return self._batch(x)
+
+    def _batch(self, x: torch.Tensor) -> torch.Tensor:
+        x = x.unsqueeze(0)
+        return x.pin_memory() if self.pin_memory else x
+
+    def _iter_indexed(self) -> Iterator[torch.Tensor]:
+        # PPQ stops iterating after calib_steps, pending decodes are cancelled on close
+        pool = ThreadPoolExecutor(max_workers=self.num_workers, thread_name_prefix="calib-decode")
+        pending: deque[Future] = deque()
+        next_idx = 0
+        try:
+            while next_idx < len(self) or pending:
+                while next_idx < len(self) and len(pending) < self.prefetch:
+                    pending.append(pool.submit(self._load, next_idx))
+                    next_idx += 1
+                yield pending.popleft().result()
+        finally:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    def _iter_stream(self) -> Iterator[torch.Tensor]:
+        # streamed datasets (e.g., shards) are read sequentially, decoding runs in a single producer thread
+        samples: queue.Queue = queue.Queue(maxsize=self.prefetch)
+        stop = threading.Event()
+        end_of_stream = object()
+
+        def produce() -> None:
+            try:
+                for x in self.dataset:
+                    if stop.is_set():
+                        return
+                    samples.put(self._batch(x))
+            except Exception as e:  # forward errors to the consumer
+                samples.put(e)
+            samples.put(end_of_stream)
+
+        producer = threading.Thread(target=produce, name="calib-decode", daemon=True)
+        producer.start()
+        try:
+            while (item := samples.get()) is not end_of_stream:
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            stop.set()
+            # unblock the producer if it waits on a full queue
+            while not samples.empty():
+                samples.get_nowait()
@@ -0,0 +1,262 @@
+import logging
+import mmap
+import struct
+import zlib
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Optional
+
+import pandas as pd
+from ppq.parser.espdl.FlatBuffers.Dl.Model import Model
+from ppq.parser.espdl.FlatBuffers.Dl.TensorDataType import TensorDataType
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+logger = logging.getLogger(__name__)
+
+# file header written by ESP-PPQ: magic, encryption flag, data length, padding
+ESPDL_MAGIC = b"EDL2"
+ESPDL_HEADER = struct.Struct("<4sII4x")
+# raw data of initializers is stored as a vector of 16-byte aligned blocks
+ESPDL_BLOCK_BYTES = 16
+# vtable offset of the raw data vector of the Tensor table (cf. FlatBuffers/Dl/Tensor.py)
+_TENSOR_RAW_DATA_FIELD = 20
+
+_DTYPE_BITS = {
+    TensorDataType.FLOAT: 32,
+    TensorDataType.UINT8: 8,
+    TensorDataType.INT8: 8,
+    TensorDataType.UINT16: 16,
+    TensorDataType.INT16: 16,
+    TensorDataType.INT32: 32,
+    TensorDataType.INT64: 64,
+    TensorDataType.BOOL: 8,
+    TensorDataType.FLOAT16: 16,
+    TensorDataType.DOUBLE: 64,
+    TensorDataType.UINT32: 32,
+    TensorDataType.UINT64: 64,
+}
+_DTYPE_NAMES = {value: name for name, value in vars(TensorDataType).items() if not name.startswith("_")}
+
+
+def _block_name(layer: str) -> str:
+    # "/model.3/conv/Conv" belongs to block "model.3"
+    parts = [part for part in layer.split("/") if part]
+    return parts[0] if len(parts) > 1 else layer
+
+
+@dataclass
+class EspdlTensor:
+    """Initializer of an .espdl model"""
+
+    name: str
+    layer: str
+    block: str
+    dtype: str
+    num_bits: int
+    dims: tuple[int, ...]
+    exponents: tuple[int, ...]
+    data_bytes: int
+    stored_bytes: int
+    crc32: int
+
+
+@dataclass
+class EspdlSummary:
+    """Size breakdown of an .espdl model"""
+
+    path: Path
+    file_bytes: int
+    num_nodes: int
+    tensors: list[EspdlTensor]
+
+    @property
+    def weight_bytes(self) -> int:
+        return sum(tensor.stored_bytes for tensor in self.tensors)
+
+    @property
+    def padding_bytes(self) -> int:
+        return sum(tensor.stored_bytes - tensor.data_bytes for tensor in self.tensors)
+
+    @property
+    def graph_bytes(self) -> int:
+        """Bytes of the file not taken by initializer data, i.e., header, graph structure and test values"""
+        return self.file_bytes - self.weight_bytes
+
+    def to_dataframe(self) -> pd.DataFrame:
+        return pd.DataFrame([asdict(tensor) for tensor in self.tensors])
+
+    def per_layer(self) -> pd.DataFrame:
+        """Stored bytes, bit-width and exponents of the initializers per layer"""
+        rows: dict[str, dict] = {}
+        weights: dict[str, EspdlTensor] = {}
+        for tensor in self.tensors:
+            row = rows.setdefault(tensor.layer, {"layer": tensor.layer, "block": tensor.block, "stored_bytes": 0})
+            row["stored_bytes"] += tensor.stored_bytes
+            # the largest initializer of a layer is its weight, whose bit-width and exponent describe the layer
+            if tensor.layer not in weights or tensor.data_bytes > weights[tensor.layer].data_bytes:
+                weights[tensor.layer] = tensor
+        for layer, row in rows.items():
+            row["num_bits"] = weights[layer].num_bits
+            row["exponents"] = ",".join(str(exponent) for exponent in weights[layer].exponents)
+        return pd.DataFrame(list(rows.values()), columns=["layer", "block", "num_bits", "exponents", "stored_bytes"])
+
+    def per_block(self) -> pd.DataFrame:
+        """Stored bytes and share of the weight bytes per block, e.g., per module of a YOLO model"""
+        frame = self.to_dataframe()
+        if frame.empty:
+            return pd.DataFrame(columns=["block", "stored_bytes", "share"])
+        blocks = frame.groupby("block", sort=False)["stored_bytes"].sum().reset_index()
+        blocks["share"] = blocks["stored_bytes"] / max(self.weight_bytes, 1)
+        return blocks.sort_values("stored_bytes", ascending=False).reset_index(drop=True)
+
+    def summary(self) -> dict[str, float]:
+        return {
+            "file_kb": self.file_bytes / 1024,
+            "weight_kb": self.weight_bytes / 1024,
+            "padding_kb": self.padding_bytes / 1024,
+            "graph_kb": self.graph_bytes / 1024,
+            "num_nodes": self.num_nodes,
+            "num_tensors": len(self.tensors),
+        }
+
+
+def inspect_espdl(espdl_path: Path) -> EspdlSummary:
+    """
+    Parses the FlatBuffers structure of an .espdl model from a memory map. Only the table metadata is decoded, and
+    the checksums of the weights are computed on the mapped memory, so no tensor data is copied.
+    :param espdl_path: Path to .espdl model file
+    :return: Size breakdown of the model
+    """
+    with espdl_path.open("rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+        if len(buffer) < ESPDL_HEADER.size:
+            raise ValueError(f"{espdl_path.as_posix()} is too small to be an .espdl model")
+        magic, encrypted, data_length = ESPDL_HEADER.unpack_from(buffer)
+        if magic != ESPDL_MAGIC:
+            raise ValueError(f"{espdl_path.as_posix()} is not an .espdl model (magic {magic!r})")
+        if encrypted:
+            raise ValueError(f"{espdl_path.as_posix()} is encrypted and cannot be inspected")
+        if ESPDL_HEADER.size + data_length > len(buffer):
+            raise ValueError(f"{espdl_path.as_posix()} is truncated")
+
+        graph = Model.GetRootAs(buffer, ESPDL_HEADER.size).Graph()
+        consumers: dict[str, str] = {}
+        for node_idx in range(graph.NodeLength()):
+            node = graph.Node(node_idx)
+            node_name = node.Name().decode()
+            for input_idx in range(node.InputLength()):
+                consumers.setdefault(node.Input(input_idx).decode(), node_name)
+
+        tensors = []
+        view = memoryview(buffer)
+        try:
+            for tensor_idx in range(graph.InitializerLength()):
+                tensor = graph.Initializer(tensor_idx)
+                name = tensor.Name().decode()
+                layer = consumers.get(name, name)
+                dtype = tensor.DataType()
+                num_bits = _DTYPE_BITS.get(dtype, 0)
+                dims = tuple(tensor.Dims(j) for j in range(tensor.DimsLength()))
+                numel = 1
+                for dim in dims:
+                    numel *= dim
+
+                stored_bytes, crc32 = 0, 0
+                table = tensor._tab
+                offset = table.Offset(_TENSOR_RAW_DATA_FIELD)
+                if offset:
+                    start = table.Vector(offset)
+                    stored_bytes = table.VectorLen(offset) * ESPDL_BLOCK_BYTES
+                    with view[start : start + stored_bytes] as data:
+                        crc32 = zlib.crc32(data)
+
+                tensors.append(
+                    EspdlTensor(
+                        name=name,
+                        layer=layer,
+                        block=_block_name(layer),
+                        dtype=_DTYPE_NAMES.get(dtype, str(dtype)),
+                        num_bits=num_bits,
+                        dims=dims,
+                        exponents=tuple(tensor.Exponents(j) for j in range(tensor.ExponentsLength())),
+                        data_bytes=numel * num_bits // 8,
+                        stored_bytes=stored_bytes,
+                        crc32=crc32,
+                    )
+                )
+        finally:
+            view.release()
+        return EspdlSummary(path=espdl_path, file_bytes=len(buffer), num_nodes=graph.NodeLength(), tensors=tensors)
+
+
+def inspect_espdl_dir(espdl_dir: Path, pattern: str = "*.espdl") -> pd.DataFrame:
+    """
+    Summarizes all .espdl models of a directory, e.g., the per-epoch exports of a QAT run
+    :param espdl_dir: Directory searched recursively for models
+    :param pattern: Glob pattern of the model files
+    :return: Summary per model, sorted by path
+    """
+    rows = []
+    for espdl_path in sorted(espdl_dir.rglob(pattern)):
+        try:
+            summary = inspect_espdl(espdl_path)
+        except ValueError as e:
+            logger.warning(f"Skipping {espdl_path.as_posix()}: {e}")
+            continue
+        rows.append({"path": espdl_path.relative_to(espdl_dir).as_posix(), **summary.summary()})
+    return pd.DataFrame(rows)
+
+
+def diff_espdl(base: EspdlSummary, other: EspdlSummary, changed_only: bool = True) -> pd.DataFrame:
+    """
+    Compares the initializers of two .espdl models
+    :param base: Summary of the base model
+    :param other: Summary of the compared model
+    :param changed_only: Only report initializers whose data type, shape, exponents or data differ
+    :return: Per initializer bit-widths, exponents and stored bytes of both models and the size delta
+    """
+    base_tensors = {tensor.name: tensor for tensor in base.tensors}
+    other_tensors = {tensor.name: tensor for tensor in other.tensors}
+    rows = []
+    for name in list(base_tensors) + [name for name in other_tensors if name not in base_tensors]:
+        old: Optional[EspdlTensor] = base_tensors.get(name)
+        new: Optional[EspdlTensor] = other_tensors.get(name)
+        if old is not None and new is not None:
+            status = "unchanged"
+            if (old.dtype, old.dims, old.exponents) != (new.dtype, new.dims, new.exponents):
+                status = "modified"
+            elif old.crc32 != new.crc32:
+                status = "data"
+        else:
+            status = "removed" if new is None else "added"
+        if changed_only and status == "unchanged":
+            continue
+        rows.append(
+            {
+                "name": name,
+                "layer": (new or old).layer,  # type: ignore
+                "status": status,
+                "num_bits": old.num_bits if old else None,
+                "other_num_bits": new.num_bits if new else None,
+                "exponents": ",".join(map(str, old.exponents)) if old else None,
+                "other_exponents": ",".join(map(str, new.exponents)) if new else None,
+                "stored_bytes": old.stored_bytes if old else 0,
+                "other_stored_bytes": new.stored_bytes if new else 0,
+            }
+        )
+    frame = pd.DataFrame(
+        rows,
+        columns=[
+            "name",
+            "layer",
+            "status",
+            "num_bits",
+            "other_num_bits",
+            "exponents",
+            "other_exponents",
+            "stored_bytes",
+            "other_stored_bytes",
+        ],
+    )
+    frame[["num_bits", "other_num_bits"]] = frame[["num_bits", "other_num_bits"]].astype("Int64")
+    frame["delta_bytes"] = frame["other_stored_bytes"] - frame["stored_bytes"]
+    return frame
@@ -5,21 +5,22 @@ import numpy as np
 import pandas as pd
 import torchvision
 from pathlib import Path
-from typing import List, Dict, Tuple
+from typing import Callable, List, Dict, Optional, Tuple
 from collections import defaultdict
 from pandas.errors import EmptyDataError
 from ultralytics import YOLO
 from ultralytics.engine.results import Results
 from tqdm import tqdm
 
-from model_deployment.core.paths import (
+from model_conversion.core.paths import (
     CALIBRATION_IMAGE_DIR, BASE_MODEL_PRED_DIR, GROUND_TRUTH_CSV_DIR,
     QUANTIZED_MODEL_PRED_DIR
 )
-from model_deployment.core.constants import (
+from model_conversion.core.constants import (
     CONF_THRESHOLD, IOU_THRESHOLD, MAX_DETECTIONS, CLASS_NAMES, MODEL_MEAN,
     MODEL_STD, MODEL_INPUT_SHAPE
 )
+from model_conversion.utils.shards import iter_shard_samples
 
 
 class YoloDetector:
@@ -110,6 +111,9 @@ class ESPEvaluator:
         img_bgr = cv2.imread(image_path)
         assert img_bgr is not None, f"Image not found at {image_path}"
         img_rgb = cv2.cvtColor(img_bgr, cv2.COLOR_BGR2RGB)
+        return self.preprocess_image_for_esp_dl(img_rgb, model_input_shape, mean, std)
+
+    def preprocess_image_for_esp_dl(self, img_rgb, model_input_shape, mean, std):
         target_h, target_w = model_input_shape
         resized_img = cv2.resize(img_rgb, (target_w, target_h), interpolation=cv2.INTER_NEAREST)
         img_tensor = torch.from_numpy(resized_img).float()
@@ -175,6 +179,18 @@ class ESPEvaluator:
         gt_class_ids = df['class_id'].values
         return torch.tensor(gt_boxes, dtype=torch.float32), torch.tensor(gt_class_ids, dtype=torch.int64)
 
+    def load_ground_truth_from_yolo_label(self, label_text, model_input_shape):
+        """Converts YOLO label text to absolute boxes in the model input space (cf. GTLabelConverter)."""
+        rows = [list(map(float, line.split())) for line in label_text.splitlines() if len(line.split()) == 5]
+        if not rows:
+            return torch.tensor([]), torch.tensor([])
+        labels = torch.tensor(rows, dtype=torch.float32)
+        target_h, target_w = model_input_shape
+        xc, w = labels[:, 1] * target_w, labels[:, 3] * target_w
+        yc, h = labels[:, 2] * target_h, labels[:, 4] * target_h
+        gt_boxes = torch.stack([xc - w / 2, yc - h / 2, xc + w / 2, yc + h / 2], dim=1)
+        return gt_boxes, labels[:, 0].to(torch.int64)
+
     def calculate_iou(self, box1, box2):
         x_left, y_top = max(box1[0], box2[0]), max(box1[1], box2[1])
         x_right, y_bottom = min(box1[2], box2[2]), min(box1[3], box2[3])
@@ -312,6 +328,48 @@ class ESPEvaluator:
 
         return self.calculate_metrics_from_collected_data(all_predictions, all_ground_truths)
 
+    def iter_shard_eval_samples(self, shards_dir: Path, split: Optional[str] = None):
+        """
+        Decodes and preprocesses samples streamed from dataset shards.
+        :param shards_dir: Directory containing the shards exported by the model-training sub-repo
+        :param split: Split to read. All samples are used if not set.
+        :return: Iterator of (sample key, input tensor, ground truth boxes, ground truth class ids)
+        """
+        for key, image_bytes, label_text in iter_shard_samples(shards_dir, split):
+            img_bgr = cv2.imdecode(np.frombuffer(image_bytes, dtype=np.uint8), cv2.IMREAD_COLOR)
+            img_rgb = cv2.cvtColor(img_bgr, cv2.COLOR_BGR2RGB)
+            gt_boxes, gt_classes = self.load_ground_truth_from_yolo_label(label_text, self.input_shape)
+            input_tensor = self.preprocess_image_for_esp_dl(img_rgb, self.input_shape, self.model_mean, self.model_std)
+            yield key, input_tensor, gt_boxes, gt_classes
+
+    def evaluate_samples(self, executor: Callable, samples):
+        """
+        Evaluates a model with live inference on preprocessed samples.
+        :param executor: Callable mapping an input tensor to the six raw model outputs (e.g., PPQ TorchExecutor)
+        :param samples: Iterable of (sample key, input tensor, ground truth boxes, ground truth class ids)
+        """
+        all_predictions, all_ground_truths = defaultdict(list), defaultdict(list)
+        for key, input_tensor, gt_boxes, gt_classes in tqdm(samples, desc="Inference"):
+            for box, cls_id in zip(gt_boxes, gt_classes):
+                all_ground_truths[cls_id.item()].append([key, box.tolist()])
+
+            outputs = executor(input_tensor)
+            results = self.postprocess_for_esp_dl(outputs, self.conf_threshold, self.iou_threshold, self.max_detections)
+            for class_id, score, x1, y1, x2, y2 in results:
+                all_predictions[int(class_id)].append([key, [x1, y1, x2, y2], score])
+
+        return self.calculate_metrics_from_collected_data(all_predictions, all_ground_truths)
+
+    def evaluate_shards(self, executor: Callable, shards_dir: Path, split: Optional[str] = None):
+        """
+        Evaluates a model with live inference on samples streamed from dataset shards.
+        :param executor: Callable mapping an input tensor to the six raw model outputs (e.g., PPQ TorchExecutor)
+        :param shards_dir: Directory containing the shards exported by the model-training sub-repo
+        :param split: Split to evaluate on. All samples are used if not set.
+        """
+        print(f"\nEvaluating live inference on shards from '{shards_dir}'...")
+        return self.evaluate_samples(executor, self.iter_shard_eval_samples(shards_dir, split))
+
 
 class BoundingBoxVisualizer:
 
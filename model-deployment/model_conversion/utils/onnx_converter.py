@@ -1,14 +1,33 @@
 import logging
+import random
+import tempfile
 from pathlib import Path
-from typing import Any, Literal
+from typing import Any, Literal, Optional, Sequence
 
 import torch
-from ppq import BaseGraph, QuantizationSettingFactory
+from ppq import (
+    BaseGraph,
+    QuantizationSetting,
+    QuantizationSettingFactory,
+    TargetPlatform,
+)
 from ppq.api import espdl_quantize_onnx, get_target_platform
-from torch.utils.data import DataLoader
 
 from model_conversion.core.constants import TARGET_SOC
-from model_conversion.utils.data import CalibrationDataset
+from model_conversion.utils.calibration_convergence import (
+    calibration_steps_until_convergence,
+)
+from model_conversion.utils.calibration_selection import CalibrationSetSelector
+from model_conversion.utils.data import (
+    CalibrationDataset,
+    PrefetchingCalibrationLoader,
+    get_onnx_input_shape,
+)
+from model_conversion.utils.quantization_error import (
+    fp32_reference_outputs,
+    output_snr_error,
+)
+from model_conversion.utils.shards import ShardedCalibrationDataset, is_shards_dir
 
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
 logger = logging.getLogger(__name__)
@@ -20,26 +39,160 @@ class OnnxQuantizer:
         calib_data_path: Path,
         image_size: int | tuple[int, int],
         device: Literal["cpu", "cuda"] = "cpu",
-        **kwargs: Any,
+        num_workers: int = 4,
+        prefetch: int = 8,
+        calib_split: str = "train",
     ) -> None:
         """
-        Initialize calibration dataloader for PTQ
+        Initialize calibration data feeder for PTQ
 
-        :param calib_data_path: Path to calibration data directory
-        :param transform: torchvision transforms pipeline
-        :param kwargs: keyword arguments for PyTorch DataLoader
+        :param calib_data_path: Path to calibration data directory, either containing images or dataset shards
+        :param image_size: Image size of calibration images
+        :param device: Device used for quantization
+        :param num_workers: Number of threads decoding calibration images ahead of PPQ
+        :param prefetch: Maximum number of decoded calibration images held in memory
+        :param calib_split: Split of the shards used for calibration, ignored for image directories
         """
         self.device = device
-        self.calib_dataset = CalibrationDataset(calib_data_path, image_size, device)
-        self.calib_dataloader = DataLoader(
-            self.calib_dataset, batch_size=1, shuffle=False, num_workers=0, pin_memory=False, **kwargs
+        self.image_size = image_size
+        self.num_workers = num_workers
+        self.prefetch = prefetch
+        if is_shards_dir(calib_data_path):
+            self.calib_dataset = ShardedCalibrationDataset(calib_data_path, image_size, calib_split, device)
+        else:
+            self.calib_dataset = CalibrationDataset(calib_data_path, image_size, device)
+        self.calib_dataloader = PrefetchingCalibrationLoader(
+            self.calib_dataset, num_workers=num_workers, prefetch=prefetch, device=device
         )
-        # extract input shape, batch size = 1
-        x = self.calib_dataset[0]
-        if isinstance(x, (tuple, list)):
-            x = x[0]
-        x = x.unsqueeze(0)
-        self.input_shape = x.shape
+
+    def select_calibration_subset(self, budget: int) -> list[Path]:
+        """
+        Restricts the calibration data to a small, diverse subset of images (cf. CalibrationSetSelector).
+        Use the budget as number of calibration steps, every selected image is then seen exactly once.
+        :param budget: Number of calibration images to keep
+        :return: Selected image paths
+        """
+        if not isinstance(self.calib_dataset, CalibrationDataset):
+            raise ValueError("Calibration subset selection is only supported for image directories")
+        selected = CalibrationSetSelector(num_workers=self.num_workers).select(self.calib_dataset.image_files, budget)
+        self._set_calibration_images(selected)
+        return selected
+
+    def _set_calibration_images(self, image_files: list[Path]) -> None:
+        self.calib_dataset = CalibrationDataset(
+            self.calib_dataset.image_dir, self.image_size, self.device, image_files=image_files
+        )
+        self.calib_dataloader = PrefetchingCalibrationLoader(
+            self.calib_dataset, num_workers=self.num_workers, prefetch=self.prefetch, device=self.device
+        )
+
+    def converged_calibration_steps(
+        self, onnx_model_path: Path, max_steps: int, tolerance: float = 0.01, min_steps: int = 8
+    ) -> int:
+        """
+        Number of calibration steps after which the activation statistics converged, to be used as calibration_steps
+        (cf. calibration_steps_until_convergence)
+        :param onnx_model_path: Path to .onnx model file
+        :param max_steps: Maximum number of calibration steps
+        :param tolerance: Maximum relative range change and histogram KL divergence per step
+        :param min_steps: Minimum number of calibration steps
+        :return: Number of calibration steps
+        """
+        return calibration_steps_until_convergence(
+            onnx_model_path, self.calib_dataloader, max_steps, tolerance, min(min_steps, max_steps)
+        )
+
+    def calibration_budget_report(
+        self,
+        onnx_model_path: Path,
+        budgets: Sequence[int],
+        num_eval_images: int = 16,
+        quant_bits: Literal[8, 16] = 8,
+        seed: int = 0,
+    ) -> list[dict[str, Any]]:
+        """
+        Quantizes the model with increasing calibration budgets, once with the first images of the calibration
+        directory and once with a diverse subset, and measures the quantization error of the model outputs on
+        held-out images. The report shows how many calibration steps are actually needed.
+        :param onnx_model_path: Path to .onnx model file
+        :param budgets: Numbers of calibration images (= calibration steps) to evaluate
+        :param num_eval_images: Number of held-out images used to measure the quantization error
+        :param quant_bits: Number of bits for integer quantization
+        :param seed: Seed for drawing the held-out images
+        :return: One row per (budget, selection) with the mean output SNR error (noise power / signal power)
+        """
+        if not isinstance(self.calib_dataset, CalibrationDataset):
+            raise ValueError("Calibration budget reports are only supported for image directories")
+        self._check_file_path(onnx_model_path, ".onnx")
+
+        all_files = list(self.calib_dataset.image_files)
+        eval_files = random.Random(seed).sample(all_files, min(num_eval_images, len(all_files)))
+        candidates = [path for path in all_files if path not in eval_files] or all_files
+        selector = CalibrationSetSelector(num_workers=self.num_workers)
+        diverse = [
+            candidates[i] for i in selector.k_center_order(selector.compute_descriptors(candidates), max(budgets))
+        ]
+        selections = {"first": candidates, "diverse": diverse}
+
+        eval_dataset = CalibrationDataset(self.calib_dataset.image_dir, self.image_size, "cpu", image_files=eval_files)
+        eval_inputs = [eval_dataset[i].unsqueeze(0) for i in range(len(eval_dataset))]
+        output_names, references = fp32_reference_outputs(onnx_model_path, eval_inputs)
+
+        report = []
+        for budget in sorted(budgets):
+            for selection, image_files in selections.items():
+                self._set_calibration_images(image_files[:budget])
+                graph = self.quantize_graph(onnx_model_path, len(self.calib_dataset), quant_bits=quant_bits)
+                snr_error = output_snr_error(graph, eval_inputs, references, output_names, self.device)
+                row = {"budget": budget, "selection": selection, "snr_error": snr_error}
+                logger.info(f"Calibration budget {budget} ({selection}): output SNR error {snr_error:.5f}")
+                report.append(row)
+
+        self._set_calibration_images(all_files)
+        return report
+
+    def quantize_graph(
+        self,
+        onnx_model_path: Path,
+        calibration_steps: int = 8,
+        quant_bits: Literal[8, 16] = 8,
+        dispatching_override: Optional[dict[str, int]] = None,
+    ) -> BaseGraph:
+        """
+        Quantizes an .onnx model without exporting it, e.g., to measure quantization errors of different settings.
+        :param onnx_model_path: Import path to .onnx model file
+        :param calibration_steps: Number of calibration steps
+        :param quant_bits: Number of bits for integer quantization of layers not listed in dispatching_override
+        :param dispatching_override: Mapping of operation names to target platforms (int values of TargetPlatform)
+        returns: Quantized graph from PPQ
+        """
+        self._check_file_path(onnx_model_path, ".onnx")
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            return espdl_quantize_onnx(
+                onnx_import_file=onnx_model_path.as_posix(),
+                espdl_export_file=(Path(tmp_dir) / f"{onnx_model_path.stem}.espdl").as_posix(),
+                calib_dataloader=self.calib_dataloader,
+                calib_steps=calibration_steps,
+                input_shape=get_onnx_input_shape(onnx_model_path),
+                inputs=None,
+                target=TARGET_SOC,
+                num_of_bits=quant_bits,
+                collate_fn=self._collate_fn,
+                setting=self._dispatching_setting(quant_bits, dispatching_override),
+                device=self.device,
+                error_report=False,
+                skip_export=True,
+                verbose=0,
+            )
+
+    @staticmethod
+    def _dispatching_setting(
+        quant_bits: Literal[8, 16], dispatching_override: Optional[dict[str, int]]
+    ) -> QuantizationSetting:
+        quant_setting = QuantizationSettingFactory.espdl_setting(num_of_bits=quant_bits)
+        for op_name, platform in (dispatching_override or {}).items():
+            quant_setting.dispatching_table.append(op_name, TargetPlatform(platform))
+        return quant_setting
 
     @staticmethod
     def _check_file_path(file_path: Path, file_format: str) -> None:
@@ -95,7 +248,7 @@ class OnnxQuantizer:
             espdl_export_file=export_file_path.as_posix(),
             calib_dataloader=self.calib_dataloader,
             calib_steps=calibration_steps,
-            input_shape=self.input_shape,
+            input_shape=get_onnx_input_shape(onnx_model_path),
             inputs=None,
             target=TARGET_SOC,
             num_of_bits=quant_bits,
@@ -110,7 +263,7 @@ class OnnxQuantizer:
         return quantized_model
 
     def _collate_fn(self, batch: torch.Tensor) -> torch.Tensor:
-        return batch.to(self.device)
+        return batch.to(self.device, non_blocking=True)
 
     def quantize_mixed_precision(
         self,
@@ -118,29 +271,48 @@ class OnnxQuantizer:
         espdl_export_path: Path,
         calibration_steps: int = 8,
         device: Literal["cpu", "cuda"] = "cpu",
+        dispatching_override: Optional[dict[str, int]] = None,
+        weight_split_layers: Optional[list[str]] = None,
     ) -> BaseGraph:
-        """ """
+        """
+        Convert .onnx model to .espdl format using int8 quantization with selected int16 layers.
+        :param onnx_model_path: Import path to .onnx model file
+        :param espdl_export_path: Export path to .espdl model file
+        :param calibration_steps: Number of calibration steps. At least 8 steps are recommended.
+        :param device: Device used for quantization.
+        :param dispatching_override: Mapping of operation names to target platforms (int values of TargetPlatform),
+            e.g., the result of a sensitivity search. Defaults to three int16 layers of the YOLO11n backbone.
+        :param weight_split_layers: Layers for horizontal layer split. Defaults to the first two YOLO11n layers.
+        returns: Quantized graph from PPQ
+        """
         # validate paths
         self._check_file_path(onnx_model_path, ".onnx")
         self._check_file_path(espdl_export_path, ".espdl")
-        # Quantize the following layers with 16-bits
-        quant_setting = QuantizationSettingFactory.espdl_setting()
-        quant_setting.dispatching_table.append("/model.2/cv2/conv/Conv", get_target_platform(TARGET_SOC, 16))
-        quant_setting.dispatching_table.append("/model.3/conv/Conv", get_target_platform(TARGET_SOC, 16))
-        quant_setting.dispatching_table.append("/model.4/cv2/conv/Conv", get_target_platform(TARGET_SOC, 16))
+        if dispatching_override is None:
+            # Quantize the following layers with 16-bits
+            int16_platform = get_target_platform(TARGET_SOC, 16).value
+            dispatching_override = {
+                "/model.2/cv2/conv/Conv": int16_platform,
+                "/model.3/conv/Conv": int16_platform,
+                "/model.4/cv2/conv/Conv": int16_platform,
+            }
+        if weight_split_layers is None:
+            weight_split_layers = ["/model.0/conv/Conv", "/model.1/conv/Conv"]
+        quant_setting = self._dispatching_setting(8, dispatching_override)
 
         # Horizontal Layer Split Pass
-        quant_setting.weight_split = True
-        quant_setting.weight_split_setting.method = "balance"
-        quant_setting.weight_split_setting.value_threshold = 1.5
-        quant_setting.weight_split_setting.interested_layers = ["/model.0/conv/Conv", "/model.1/conv/Conv"]
+        if weight_split_layers:
+            quant_setting.weight_split = True
+            quant_setting.weight_split_setting.method = "balance"
+            quant_setting.weight_split_setting.value_threshold = 1.5
+            quant_setting.weight_split_setting.interested_layers = weight_split_layers
 
         quantized_model = espdl_quantize_onnx(
             onnx_import_file=onnx_model_path.as_posix(),
             espdl_export_file=espdl_export_path.as_posix(),
             calib_dataloader=self.calib_dataloader,
             calib_steps=calibration_steps,
-            input_shape=self.input_shape,
+            input_shape=get_onnx_input_shape(onnx_model_path),
             inputs=None,
             target=TARGET_SOC,
             collate_fn=self._collate_fn,
@@ -0,0 +1,51 @@
+from pathlib import Path
+from typing import Literal, Sequence
+
+import numpy as np
+import onnxruntime as ort
+import torch
+from ppq import BaseGraph, TorchExecutor
+
+
+def fp32_reference_outputs(
+    onnx_model_path: Path, inputs: Sequence[torch.Tensor]
+) -> tuple[list[str], list[list[np.ndarray]]]:
+    """
+    Runs the FP32 ONNX model with onnxruntime to obtain reference outputs for quantization error measurements
+    :param onnx_model_path: Path to .onnx model file
+    :param inputs: Input tensors of shape [1, C, H, W]
+    :return: Output names and reference outputs per input
+    """
+    session = ort.InferenceSession(onnx_model_path.as_posix(), providers=["CPUExecutionProvider"])
+    input_name = session.get_inputs()[0].name
+    output_names = [output.name for output in session.get_outputs()]
+    references = [session.run(output_names, {input_name: x.cpu().numpy()}) for x in inputs]
+    return output_names, references
+
+
+def output_snr_error(
+    graph: BaseGraph,
+    inputs: Sequence[torch.Tensor],
+    references: Sequence[Sequence[np.ndarray]],
+    output_names: list[str],
+    device: Literal["cpu", "cuda"] = "cpu",
+    executor: TorchExecutor | None = None,
+) -> float:
+    """
+    Mean SNR error (noise power / signal power) of the graph outputs w.r.t. FP32 reference outputs
+    :param graph: Quantized PPQ graph
+    :param inputs: Input tensors of shape [1, C, H, W]
+    :param references: Reference outputs per input (cf. fp32_reference_outputs)
+    :param output_names: Names of the graph outputs
+    :param device: Device used for execution
+    :param executor: Executor to reuse. A new TorchExecutor is created if not set.
+    :return: Mean SNR error over all inputs and outputs
+    """
+    executor = executor or TorchExecutor(graph=graph, device=device)
+    errors = []
+    for x, reference in zip(inputs, references):
+        outputs = executor.forward(inputs=x.to(device), output_names=output_names)
+        for output, ref in zip(outputs, reference):
+            noise = np.square(output.detach().cpu().numpy() - ref).sum()
+            errors.append(noise / max(float(np.square(ref).sum()), 1e-12))
+    return float(np.mean(errors))
@@ -0,0 +1,185 @@
+import logging
+import random
+from itertools import islice
+from pathlib import Path
+from typing import Optional, Sequence
+
+import yaml
+from ppq import QuantableOperation, TorchExecutor
+from ppq.api import get_target_platform
+from torch.utils.data import Dataset, IterableDataset
+
+from model_conversion.core.constants import TARGET_SOC
+from model_conversion.utils.data import CalibrationDataset
+from model_conversion.utils.onnx_converter import OnnxQuantizer
+from model_conversion.utils.quantization_error import (
+    fp32_reference_outputs,
+    output_snr_error,
+)
+from model_conversion.utils.shards import ShardedCalibrationDataset, is_shards_dir
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+logger = logging.getLogger(__name__)
+
+
+class SensitivityAnalyzer:
+    """
+    Data-driven selection of int16 layers for mixed-precision quantization.
+
+    The sensitivity of a layer is the output SNR error of the model when only this layer is quantized to int8. The
+    search then promotes the most sensitive layers to int16 until the output SNR error of the mixed-precision model
+    meets the target. Every int16 layer costs on-device latency, so the smallest such set is searched.
+    """
+
+    def __init__(
+        self,
+        quantizer: OnnxQuantizer,
+        eval_data_path: Path,
+        num_eval_images: int = 16,
+        eval_split: str = "val",
+        seed: int = 0,
+    ) -> None:
+        """
+        :param quantizer: Quantizer providing the calibration data
+        :param eval_data_path: Held-out images used to measure the output SNR error, either an image directory or
+            dataset shards. Must differ from the calibration data, otherwise the error of calibrated layers is
+            underestimated.
+        :param num_eval_images: Number of held-out images used to measure the output SNR error
+        :param eval_split: Split of the shards used for evaluation, ignored for image directories
+        :param seed: Seed for drawing the evaluation images
+        """
+        self.quantizer = quantizer
+        self.device = quantizer.device
+
+        dataset: Dataset
+        if is_shards_dir(eval_data_path):
+            dataset = ShardedCalibrationDataset(eval_data_path, quantizer.image_size, eval_split)
+        else:
+            dataset = CalibrationDataset(eval_data_path, quantizer.image_size)
+        self._check_held_out(dataset, quantizer.calib_dataset)
+
+        if isinstance(dataset, IterableDataset):
+            samples = list(islice(iter(dataset), num_eval_images))
+        else:
+            indices = random.Random(seed).sample(range(len(dataset)), min(num_eval_images, len(dataset)))
+            samples = [dataset[i] for i in indices]
+        self.eval_inputs = [sample.unsqueeze(0).cpu() for sample in samples]
+        if not self.eval_inputs:
+            raise ValueError(f"No evaluation images found in {eval_data_path.as_posix()}")
+
+    @staticmethod
+    def _check_held_out(eval_dataset: Dataset, calib_dataset: Dataset) -> None:
+        if isinstance(eval_dataset, ShardedCalibrationDataset) and isinstance(calib_dataset, ShardedCalibrationDataset):
+            same = (eval_dataset.shards_dir.resolve(), eval_dataset.split) == (
+                calib_dataset.shards_dir.resolve(),
+                calib_dataset.split,
+            )
+        elif isinstance(eval_dataset, CalibrationDataset) and isinstance(calib_dataset, CalibrationDataset):
+            same = bool(
+                {path.resolve() for path in eval_dataset.image_files}
+                & {path.resolve() for path in calib_dataset.image_files}
+            )
+        else:
+            same = False
+        if same:
+            raise ValueError("Evaluation images must be held out from the calibration data")
+
+    def _references(self, onnx_model_path: Path) -> tuple[list[str], list]:
+        return fp32_reference_outputs(onnx_model_path, self.eval_inputs)
+
+    def layer_sensitivity(
+        self, onnx_model_path: Path, calibration_steps: int = 8, op_types: Sequence[str] = ("Conv",)
+    ) -> dict[str, float]:
+        """
+        Measures the output SNR error when quantizing each layer alone
+        :param onnx_model_path: Path to .onnx model file
+        :param calibration_steps: Number of calibration steps
+        :param op_types: Operation types to analyze
+        :return: Output SNR error per layer, sorted from most to least sensitive
+        """
+        graph = self.quantizer.quantize_graph(onnx_model_path, calibration_steps, quant_bits=8)
+        output_names, references = self._references(onnx_model_path)
+        executor = TorchExecutor(graph=graph, device=self.device)
+
+        operations = [op for op in graph.operations.values() if isinstance(op, QuantableOperation)]
+        for operation in operations:
+            operation.dequantize()
+
+        sensitivity = {}
+        for operation in operations:
+            if operation.type not in op_types:
+                continue
+            operation.restore_quantize_state()
+            sensitivity[operation.name] = output_snr_error(
+                graph, self.eval_inputs, references, output_names, self.device, executor=executor
+            )
+            operation.dequantize()
+            logger.info(f"Sensitivity of {operation.name}: output SNR error {sensitivity[operation.name]:.5f}")
+
+        for operation in operations:
+            operation.restore_quantize_state()
+        return dict(sorted(sensitivity.items(), key=lambda item: item[1], reverse=True))
+
+    def search(
+        self,
+        onnx_model_path: Path,
+        target_snr_error: float,
+        calibration_steps: int = 8,
+        sensitivity: Optional[dict[str, float]] = None,
+    ) -> dict[str, int]:
+        """
+        Binary search for the smallest number of most sensitive layers to quantize with int16
+        :param onnx_model_path: Path to .onnx model file
+        :param target_snr_error: Maximum output SNR error of the mixed-precision model
+        :param calibration_steps: Number of calibration steps
+        :param sensitivity: Layer sensitivities (cf. layer_sensitivity). Computed if not set.
+        :return: Dispatching override table mapping layer names to int values of TargetPlatform
+        """
+        sensitivity = sensitivity or self.layer_sensitivity(onnx_model_path, calibration_steps)
+        ranking = list(sensitivity)
+        int16_platform = get_target_platform(TARGET_SOC, 16).value
+        output_names, references = self._references(onnx_model_path)
+
+        def evaluate(num_layers: int) -> float:
+            table = {op_name: int16_platform for op_name in ranking[:num_layers]}
+            graph = self.quantizer.quantize_graph(onnx_model_path, calibration_steps, 8, dispatching_override=table)
+            snr_error = output_snr_error(graph, self.eval_inputs, references, output_names, self.device)
+            logger.info(f"{num_layers} int16 layers: output SNR error {snr_error:.5f}")
+            return snr_error
+
+        if evaluate(0) <= target_snr_error:
+            return {}
+        low, high = 0, len(ranking)
+        if evaluate(high) > target_snr_error:
+            logger.warning(f"Target SNR error {target_snr_error} not reachable with int16 layers, using all layers")
+            return {op_name: int16_platform for op_name in ranking}
+
+        # invariant: low layers miss the target, high layers meet it
+        while high - low > 1:
+            mid = (low + high) // 2
+            if evaluate(mid) <= target_snr_error:
+                high = mid
+            else:
+                low = mid
+        return {op_name: int16_platform for op_name in ranking[:high]}
+
+    @staticmethod
+    def save_dispatching_table(dispatching_table: dict[str, int], output_path: Path) -> None:
+        """
+        Saves a dispatching override table as YAML, usable as dispatching_override of QuantizationArgs
+        :param dispatching_table: Mapping of layer names to int values of TargetPlatform
+        :param output_path: Path to .yaml file
+        """
+        output_path.parent.mkdir(parents=True, exist_ok=True)
+        with output_path.open("w") as f:
+            yaml.safe_dump({"dispatching_override": dispatching_table}, f, sort_keys=False)
+
+    @staticmethod
+    def load_dispatching_table(table_path: Path) -> dict[str, int]:
+        """
+        Loads a dispatching override table saved by save_dispatching_table
+        :param table_path: Path to .yaml file
+        :return: Mapping of layer names to int values of TargetPlatform
+        """
+        with table_path.open("r") as f:
+            return yaml.safe_load(f)["dispatching_override"] or {}
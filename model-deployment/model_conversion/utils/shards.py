@@ -0,0 +1,116 @@
+import io
+import json
+import random
+import tarfile
+from pathlib import Path
+from typing import Any, Iterator, Literal, Optional
+
+import torch
+from PIL import Image
+from torch.utils.data import IterableDataset, get_worker_info
+from torchvision import transforms
+
+from model_conversion.core.constants import SHARD_INDEX_FILE
+
+
+def is_shards_dir(path: Path) -> bool:
+    """Checks whether a directory contains dataset shards exported by the model-training sub-repo."""
+    return (path / SHARD_INDEX_FILE).is_file()
+
+
+def load_shard_index(shards_dir: Path) -> dict[str, Any]:
+    """Loads the index file of a shards directory."""
+    index_path = shards_dir / SHARD_INDEX_FILE
+    if not index_path.is_file():
+        raise FileNotFoundError(f"No shard index found at {index_path.as_posix()}")
+    with index_path.open("r") as index_file:
+        return json.load(index_file)
+
+
+def iter_shard_samples(shards_dir: Path, split: Optional[str] = None) -> Iterator[tuple[str, bytes, str]]:
+    """
+    Reads all shards sequentially and yields their samples
+    :param shards_dir: Directory containing the shards and the index file
+    :param split: Split to read (train, val or test). All samples are read if not set.
+    :return: Iterator of (sample key, encoded image bytes, YOLO label text)
+    """
+    index = load_shard_index(shards_dir)
+    keys = set(index["splits"][split]) if split else None
+    for shard in index["shards"]:
+        pending: dict[str, dict[str, bytes]] = {}
+        with tarfile.open(shards_dir / shard["name"], "r|") as tar:
+            for member in tar:
+                if not member.isfile():
+                    continue
+                key, suffix = member.name.rsplit(".", 1)
+                if keys is not None and key not in keys:
+                    continue
+                sample = pending.setdefault(key, {})
+                sample["label" if suffix == "txt" else "image"] = tar.extractfile(member).read()  # type: ignore
+                if len(sample) == 2:
+                    del pending[key]
+                    yield key, sample["image"], sample["label"].decode()
+
+
+class ShardedCalibrationDataset(IterableDataset):
+    """Yolo11 calibration dataset streamed from tar shards"""
+
+    def __init__(
+        self,
+        shards_dir: Path,
+        img_size: int | tuple[int, int],
+        split: str,
+        device: Literal["cpu", "cuda"] = "cpu",
+        shuffle_buffer: int = 0,
+        seed: int = 0,
+    ) -> None:
+        """
+        :param shards_dir: Directory containing the shards and the index file
+        :param img_size: Image size of calibration images
+        :param split: Split to read (train, val or test), so that calibration never sees evaluation images
+        :param device: Device used for quantization
+        :param shuffle_buffer: Size of the shuffle buffer. Samples are returned in shard order if 0.
+        :param seed: Seed for shuffling
+        """
+        self.shards_dir = shards_dir
+        self.device = device
+        self.split = split
+        self.shuffle_buffer = shuffle_buffer
+        self.seed = seed
+
+        index = load_shard_index(shards_dir)
+        if split not in index["splits"]:
+            raise ValueError(f"Split {split} not contained in shards, available: {list(index['splits'])}")
+        self.num_samples = len(index["splits"][split])
+
+        self.transform = transforms.Compose(
+            [
+                transforms.ToTensor(),
+                transforms.Resize((img_size, img_size) if isinstance(img_size, int) else img_size),
+            ]
+        )
+
+    def __len__(self) -> int:
+        return self.num_samples
+
+    def __iter__(self) -> Iterator[torch.Tensor]:
+        worker_info = get_worker_info()
+        rng = random.Random(self.seed)
+        buffer: list[torch.Tensor] = []
+        for i, (_, image_bytes, _) in enumerate(iter_shard_samples(self.shards_dir, self.split)):
+            # distribute samples over DataLoader workers
+            if worker_info is not None and i % worker_info.num_workers != worker_info.id:
+                continue
+            img = self.transform(Image.open(io.BytesIO(image_bytes)).convert("RGB"))
+            if self.shuffle_buffer <= 0:
+                yield img
+                continue
+            if len(buffer) < self.shuffle_buffer:
+                buffer.append(img)
+                continue
+            idx = rng.randrange(len(buffer))
+            buffer[idx], img = img, buffer[idx]
+            yield img
+
+        rng.shuffle(buffer)
+        yield from buffer
@@ -0,0 +1,293 @@
+import itertools
+import logging
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import asdict, dataclass, field
+from itertools import islice
+from pathlib import Path
+from typing import Any, Literal, Optional
+
+import numpy as np
+import pandas as pd
+import torch
+import torch.multiprocessing as mp
+import yaml
+from ppq import (
+    QuantizationSetting,
+    QuantizationSettingFactory,
+    TargetPlatform,
+    TorchExecutor,
+)
+from ppq.api import espdl_quantize_onnx
+
+from model_conversion.core.constants import TARGET_SOC
+from model_conversion.utils.cost_model import CostModel
+from model_conversion.utils.data import (
+    CalibrationDataset,
+    PrefetchingCalibrationLoader,
+    get_onnx_input_shape,
+)
+from model_conversion.utils.model_evaluation import ESPEvaluator
+from model_conversion.utils.sensitivity import SensitivityAnalyzer
+from model_conversion.utils.shards import ShardedCalibrationDataset, is_shards_dir
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+logger = logging.getLogger(__name__)
+
+# state shared with the sweep workers, set by _init_worker
+_WORKER_STATE: dict[str, Any] = {}
+
+
+@dataclass
+class SweepConfig:
+    """Single quantization configuration of a sweep"""
+
+    name: str
+    quant_bits: Literal[8, 16] = 8
+    calibration_steps: int = 8
+    dispatching_override: dict[str, int] = field(default_factory=dict)
+    weight_split_layers: list[str] = field(default_factory=list)
+    weight_split_value_threshold: float = 1.5
+
+    def quantization_setting(self) -> QuantizationSetting:
+        """Creates the espdl setting of this configuration"""
+        quant_setting = QuantizationSettingFactory.espdl_setting(num_of_bits=self.quant_bits)
+        for op_name, platform in self.dispatching_override.items():
+            quant_setting.dispatching_table.append(op_name, TargetPlatform(platform))
+        if self.weight_split_layers:
+            quant_setting.weight_split = True
+            quant_setting.weight_split_setting.method = "balance"
+            quant_setting.weight_split_setting.value_threshold = self.weight_split_value_threshold
+            quant_setting.weight_split_setting.interested_layers = self.weight_split_layers
+        return quant_setting
+
+
+def load_sweep_configs(sweep_yaml_path: Path) -> list[SweepConfig]:
+    """
+    Loads sweep configurations from YAML. Explicit configurations are listed under ``configs``, and ``grid`` maps
+    SweepConfig fields to lists of values, whose cartesian product is added. ``dispatching_table`` may point to a
+    YAML table created by the sensitivity command instead of an inline ``dispatching_override``.
+
+    Example::
+
+        grid:
+          quant_bits: [8, 16]
+          weight_split_layers: [[], ["/model.0/conv/Conv", "/model.1/conv/Conv"]]
+        configs:
+          - name: mixed
+            dispatching_table: dispatching_table.yaml
+
+    :param sweep_yaml_path: Path to sweep YAML file
+    :return: Sweep configurations
+    """
+    with sweep_yaml_path.open("r") as f:
+        raw = yaml.safe_load(f) or {}
+
+    raw_configs = list(raw.get("configs", []))
+    grid = raw.get("grid", {})
+    if grid:
+        keys = list(grid)
+        for values in itertools.product(*(grid[key] for key in keys)):
+            raw_configs.append(dict(zip(keys, values)))
+
+    configs = []
+    for idx, raw_config in enumerate(raw_configs):
+        raw_config = dict(raw_config)
+        table_path = raw_config.pop("dispatching_table", None)
+        if table_path:
+            table_path = Path(table_path)
+            if not table_path.is_absolute():
+                table_path = sweep_yaml_path.parent / table_path
+            raw_config["dispatching_override"] = SensitivityAnalyzer.load_dispatching_table(table_path)
+        raw_config.setdefault("name", f"config_{idx}")
+        configs.append(SweepConfig(**raw_config))
+
+    if len({config.name for config in configs}) != len(configs):
+        raise ValueError("Names of sweep configurations must be unique")
+    return configs
+
+
+def pareto_front(report: pd.DataFrame) -> pd.Series:
+    """
+    Marks configurations not dominated by another one w.r.t. maximal mAP, minimal size and minimal latency
+    :param report: Sweep report with columns mAP, size_kb and latency_ms
+    :return: Boolean series
+    """
+    objectives = np.stack([-report["mAP"], report["size_kb"], report["latency_ms"]], axis=1)
+    dominated = [any(np.all(other <= row) and np.any(other < row) for other in objectives) for row in objectives]
+    return pd.Series(np.logical_not(dominated), index=report.index)
+
+
+def _init_worker(state: dict[str, Any]) -> None:
+    # configs run concurrently, one thread each
+    torch.set_num_threads(1)
+    _WORKER_STATE.update(state)
+
+
+def _run_config(config: SweepConfig) -> dict[str, Any]:
+    state = _WORKER_STATE
+    calib_inputs: torch.Tensor = state["calib_inputs"]
+    output_dir: Path = state["output_dir"]
+    espdl_path = output_dir / f"{config.name}.espdl"
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        # PPQ overwrites the ONNX file with its simplified version, so every worker needs its own copy
+        onnx_path = Path(tmp_dir) / state["onnx_path"].name
+        shutil.copy(state["onnx_path"], onnx_path)
+        graph = espdl_quantize_onnx(
+            onnx_import_file=onnx_path.as_posix(),
+            espdl_export_file=espdl_path.as_posix(),
+            calib_dataloader=[calib_inputs[i : i + 1] for i in range(len(calib_inputs))],
+            calib_steps=min(config.calibration_steps, len(calib_inputs)),
+            input_shape=get_onnx_input_shape(onnx_path),
+            inputs=None,
+            target=TARGET_SOC,
+            num_of_bits=config.quant_bits,
+            setting=config.quantization_setting(),
+            device="cpu",
+            error_report=False,
+            skip_export=False,
+            export_test_values=False,
+            verbose=0,
+        )
+
+    executor = TorchExecutor(graph=graph, device="cpu")
+    evaluator = ESPEvaluator(input_shape=state["input_shape"])
+    samples = zip(state["eval_keys"], state["eval_inputs"], state["eval_gt_boxes"], state["eval_gt_classes"])
+    metrics = evaluator.evaluate_samples(
+        lambda x: executor.forward(inputs=x), ((key, x.unsqueeze(0), b, c) for key, x, b, c in samples)
+    )
+    cost = CostModel(state["latency_table"]).estimate(graph)
+    return {
+        "name": config.name,
+        "mAP": float(metrics["mAP"]),
+        "size_kb": espdl_path.stat().st_size / 1024,
+        "latency_ms": cost.latency_ms,
+        "peak_activation_kb": cost.peak_activation_bytes / 1024,
+        "config": asdict(config),
+    }
+
+
+class QuantizationSweep:
+    """
+    Runs quantization configurations in a process pool and reports mAP, model size and estimated latency.
+
+    Calibration and evaluation tensors are decoded once and shared with the workers through shared memory, so all
+    configurations are calibrated and evaluated on exactly the same images.
+    """
+
+    def __init__(
+        self,
+        onnx_model_path: Path,
+        calib_data_path: Path,
+        eval_shards_dir: Path,
+        image_size: int | tuple[int, int],
+        eval_split: Optional[str] = "val",
+        num_eval_images: Optional[int] = None,
+        num_workers: int = 4,
+        cost_model: Optional[CostModel] = None,
+        max_latency_ms: Optional[float] = None,
+        calib_split: str = "train",
+    ) -> None:
+        """
+        :param onnx_model_path: Path to .onnx model file
+        :param calib_data_path: Path to calibration data directory, either containing images or dataset shards
+        :param eval_shards_dir: Shards directory with labeled evaluation images
+        :param image_size: Image size of the model
+        :param eval_split: Split of the shards used for evaluation. All samples are used if not set.
+        :param num_eval_images: Maximum number of evaluation images. All images of the split are used if not set.
+        :param num_workers: Number of worker processes
+        :param cost_model: Cost model estimating the device latency. Defaults to the default latency table.
+        :param max_latency_ms: Configurations with a higher estimated latency are rejected before quantization
+        :param calib_split: Split of the shards used for calibration, ignored for image directories
+        """
+        self.onnx_model_path = onnx_model_path
+        self.calib_data_path = calib_data_path
+        self.eval_shards_dir = eval_shards_dir
+        self.image_size = (image_size, image_size) if isinstance(image_size, int) else image_size
+        self.eval_split = eval_split
+        self.num_eval_images = num_eval_images
+        self.num_workers = num_workers
+        self.cost_model = cost_model or CostModel()
+        self.max_latency_ms = max_latency_ms
+        self.calib_split = calib_split
+
+    def _load_calibration_inputs(self, num_images: int) -> torch.Tensor:
+        if is_shards_dir(self.calib_data_path):
+            dataset = ShardedCalibrationDataset(self.calib_data_path, self.image_size, self.calib_split)
+        else:
+            dataset = CalibrationDataset(self.calib_data_path, self.image_size)
+        loader = PrefetchingCalibrationLoader(dataset)
+        return torch.cat(list(islice(iter(loader), num_images)))
+
+    def _load_eval_state(self) -> dict[str, Any]:
+        evaluator = ESPEvaluator(input_shape=self.image_size)
+        samples = list(
+            islice(evaluator.iter_shard_eval_samples(self.eval_shards_dir, self.eval_split), self.num_eval_images)
+        )
+        if not samples:
+            raise ValueError(f"No evaluation samples found in {self.eval_shards_dir.as_posix()}")
+        keys, inputs, gt_boxes, gt_classes = zip(*samples)
+        return {
+            "eval_keys": list(keys),
+            "eval_inputs": torch.cat(inputs).share_memory_(),
+            "eval_gt_boxes": list(gt_boxes),
+            "eval_gt_classes": list(gt_classes),
+        }
+
+    def _within_latency_budget(self, config: SweepConfig) -> bool:
+        cost = self.cost_model.estimate_onnx(self.onnx_model_path, config.quant_bits, config.dispatching_override)
+        if cost.latency_ms > self.max_latency_ms:  # type: ignore
+            logger.info(f"Rejecting {config.name}: estimated latency {cost.latency_ms:.1f} ms")
+            return False
+        return True
+
+    def run(self, configs: list[SweepConfig], output_dir: Path) -> pd.DataFrame:
+        """
+        Runs all configurations and writes the exported models and the report to the output directory
+        :param configs: Sweep configurations
+        :param output_dir: Output directory
+        :return: Report sorted by mAP with a column marking the Pareto-optimal configurations
+        """
+        if self.max_latency_ms is not None:
+            configs = [config for config in configs if self._within_latency_budget(config)]
+            if not configs:
+                raise ValueError(f"All sweep configurations exceed the latency budget of {self.max_latency_ms} ms")
+
+        output_dir.mkdir(parents=True, exist_ok=True)
+        state = {
+            "onnx_path": self.onnx_model_path,
+            "output_dir": output_dir,
+            "input_shape": self.image_size,
+            "latency_table": self.cost_model.latency_table,
+            "calib_inputs": self._load_calibration_inputs(max(c.calibration_steps for c in configs)).share_memory_(),
+            **self._load_eval_state(),
+        }
+
+        rows = []
+        with ProcessPoolExecutor(
+            max_workers=min(self.num_workers, len(configs)),
+            mp_context=mp.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(state,),
+        ) as pool:
+            futures = {pool.submit(_run_config, config): config for config in configs}
+            for future in as_completed(futures):
+                try:
+                    row = future.result()
+                except Exception as e:
+                    logger.error(f"Sweep configuration {futures[future].name} failed: {e}")
+                    continue
+                logger.info(f"{row['name']}: mAP {row['mAP']:.4f}, {row['size_kb']:.1f} KB, {row['latency_ms']:.1f} ms")
+                rows.append(row)
+
+        if not rows:
+            raise RuntimeError("All sweep configurations failed")
+        report = pd.DataFrame(rows)
+        report["pareto"] = pareto_front(report)
+        report = report.sort_values("mAP", ascending=False).reset_index(drop=True)
+        report.drop(columns="config").to_csv(output_dir / "sweep_report.csv", index=False)
+        with (output_dir / "sweep_configs.yaml").open("w") as f:
+            yaml.safe_dump({row["name"]: row["config"] for row in rows}, f, sort_keys=False)
+        return report
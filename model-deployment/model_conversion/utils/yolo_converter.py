@@ -1,10 +1,11 @@
 import inspect
 import shutil
 from pathlib import Path
-from typing import Final
+from typing import Any, Final, Optional
 
 import onnx
 import torch
+import ultralytics
 import yaml
 from ultralytics import YOLO
 from ultralytics.engine.exporter import Exporter, arange_patch, try_export
@@ -13,6 +14,8 @@ from ultralytics.utils import LOGGER, colorstr
 from ultralytics.utils.checks import check_requirements
 from ultralytics.utils.torch_utils import get_latest_opset
 
+from model_conversion.utils.artifact_registry import ArtifactRegistry
+
 
 class EspDetect(Detect):
     def forward(self, x):
@@ -165,12 +168,21 @@ class YoloConverter:
 
         self.export_config = {k: getattr(self, k) for k in export_keys if getattr(self, k) is not None}
 
-    def to_onnx(self, torch_model_path: Path, onnx_export_path: Path) -> None:
+    @property
+    def registry_config(self) -> dict[str, Any]:
+        """Export settings identifying ONNX models in an artifact registry"""
+        return {**self.export_config, "ultralytics": ultralytics.__version__}
+
+    def to_onnx(
+        self, torch_model_path: Path, onnx_export_path: Path, registry: Optional[ArtifactRegistry] = None
+    ) -> None:
         """
         Exports an Ultralytics YOLO model to ONNX format
 
         :param torch_model_path: Import path to .pt model file
         :param onnx_export_path: Path to export directory
+        :param registry: Artifact registry. The ONNX model is taken from the registry if the same .pt model was
+            exported with the same settings before, and registered otherwise.
         """
         if not torch_model_path.exists():
             raise FileNotFoundError(f"No such file: {torch_model_path.as_posix()}")
@@ -181,6 +193,14 @@ class YoloConverter:
         if not onnx_export_path.is_dir():
             raise NotADirectoryError(f"{onnx_export_path.as_posix()} is not a directory")
 
+        torch_model_digest = None
+        if registry is not None:
+            torch_model_digest = registry.add(torch_model_path).digest
+            exported = registry.find(kind="onnx", parent=torch_model_digest, config=self.registry_config, limit=1)
+            if exported:
+                registry.materialize(exported[0].digest, onnx_export_path / f"{torch_model_path.stem}.onnx")
+                return
+
         # load .pt model from path
         model = EspYOLO(torch_model_path.as_posix())
         for module in model.modules():
@@ -197,6 +217,9 @@ class YoloConverter:
         # move .onnx model to provided export path
         shutil.move(str(export_path), str(destination_file))
 
+        if registry is not None:
+            registry.add(destination_file, config=self.registry_config, parents=[torch_model_digest])  # type: ignore
+
     @classmethod
     def from_config(cls, yml_config: Path | str) -> "YoloConverter":
         """
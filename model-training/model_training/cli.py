@@ -1,10 +1,16 @@
 from pathlib import Path
+from typing import Optional
 
 import click
+import yaml
 
-from model_training.core.schemas import QuantizationAwareTrainingConfig
-from model_training.qat import QuantizationAwareTrainingPipeline
+from model_training.core.constants import TXT_ENCODING
+from model_training.core.schemas import DataConfig
+from model_training.qat import run_qat_pipeline
 from model_training.trainer import Trainer
+from model_training.utils.artifact_registry import ArtifactRegistry
+from model_training.utils.distributed import launch
+from model_training.utils.shards import export_yolo_shards
 
 
 @click.group()
@@ -27,14 +33,81 @@ def train(config):
 
 
 @cli.command()
-@click.argument("config", type=click.Path(exists=True), required=True)
-def qat(config: Path):
+@click.argument("config", type=click.Path(exists=True, path_type=Path), required=True)
+@click.option(
+    "--nproc", type=click.IntRange(min=1), default=1, help="Number of data-parallel training processes (gloo backend)"
+)
+def qat(config: Path, nproc: int):
     """
     Run QAT job via CLI from a YAML config file
     """
-    train_config = QuantizationAwareTrainingConfig.from_yaml(config)
-    pipeline = QuantizationAwareTrainingPipeline(train_config)
-    try:
-        pipeline.run()
-    finally:
-        pipeline.finish_wandb()
+    launch(run_qat_pipeline, nproc, config)
+
+
+@cli.command()
+@click.argument("dataset-yaml", type=click.Path(exists=True, dir_okay=False, path_type=Path), required=True)
+@click.argument("output-dir", type=click.Path(file_okay=False, path_type=Path), required=True)
+@click.option("--shard-size-mb", type=click.IntRange(min=1), default=256, help="Target size of a single shard in MB")
+@click.option("--seed", type=int, default=0, help="Seed for the sample order within the shards")
+def export_shards(dataset_yaml: Path, output_dir: Path, shard_size_mb: int, seed: int):
+    """
+    Pack a YOLO dataset into tar shards for sequential reading
+    """
+    with dataset_yaml.open("r", encoding=TXT_ENCODING) as f:
+        data_config = DataConfig(**yaml.safe_load(f))
+    index_path = export_yolo_shards(data_config, output_dir, shard_size_mb=shard_size_mb, seed=seed)
+    click.echo(f"Shard index stored under {index_path.as_posix()}")
+
+
+@cli.command()
+@click.argument("registry-dir", type=click.Path(exists=True, file_okay=False, path_type=Path), required=True)
+@click.option("--kind", default=None, help="Artifact kind, e.g., espdl, native, onnx or pt")
+@click.option("--dataset", default=None, help="Name of the dataset (YAML file stem)")
+@click.option("--num-bits", type=click.Choice(["8", "16"]), default=None, help="Precision of quantized models")
+@click.option("--metric", default=None, help="Sort by this metric in descending order instead of newest first")
+def list_artifacts(
+    registry_dir: Path, kind: Optional[str], dataset: Optional[str], num_bits: Optional[str], metric: Optional[str]
+):
+    """
+    List the models of an artifact registry
+    """
+    registry = ArtifactRegistry(registry_dir)
+    artifacts = registry.find(kind=kind, dataset=dataset, num_bits=int(num_bits) if num_bits else None, order_by=metric)
+    for artifact in artifacts:
+        score = f"{metric}={artifact.metrics[metric]:.4f}" if metric else ""
+        click.echo(
+            f"{artifact.digest[:12]}  {artifact.kind:<6} {artifact.num_bits or '-':<3} "
+            f"{artifact.dataset or '-':<24} {artifact.name}  {score}"
+        )
+
+
+@cli.command()
+@click.argument("registry-dir", type=click.Path(exists=True, file_okay=False, path_type=Path), required=True)
+@click.option("--kind", default="espdl", help="Artifact kind, e.g., espdl, native, onnx or pt")
+@click.option("--dataset", default=None, help="Name of the dataset (YAML file stem)")
+@click.option("--num-bits", type=click.Choice(["8", "16"]), default=None, help="Precision of quantized models")
+@click.option("--metric", default="fitness", help="Metric to maximize")
+@click.option(
+    "--output", type=click.Path(dir_okay=False, path_type=Path), default=None, help="Place the model at this path"
+)
+def best_artifact(
+    registry_dir: Path,
+    kind: str,
+    dataset: Optional[str],
+    num_bits: Optional[str],
+    metric: str,
+    output: Optional[Path],
+):
+    """
+    Find the registered model with the highest metric, e.g., the best int8 model for a dataset
+    """
+    registry = ArtifactRegistry(registry_dir)
+    artifact = registry.best(metric=metric, kind=kind, dataset=dataset, num_bits=int(num_bits) if num_bits else None)
+    if artifact is None:
+        raise click.ClickException("No matching artifact found")
+    click.echo(f"{artifact.name} ({metric}={artifact.metrics[metric]:.4f}) sha256:{artifact.digest}")
+    click.echo((registry.materialize(artifact.digest, output) if output else artifact.path).as_posix())
+
+
+if __name__ == "__main__":
+    cli()
@@ -3,6 +3,9 @@ from typing import Final
 # system constants
 TXT_ENCODING: Final[str] = "utf-8"
 
+# dataset shards constants
+SHARD_INDEX_FILE: Final[str] = "index.json"
+
 # Weights & Biases constants
 WANDB_ENTITY: Final[str] = "mathun3003-unims"
 WANDB_PROJECT: Final[str] = "tinyaiot-runs"
@@ -41,20 +41,115 @@ class ValidationArgs(BaseModel):
 
 
 class QuantizationArgs(BaseModel):
-    calib_steps: int = Field(32, gt=0, description="Number of steps for calibration")
+    calib_steps: int = Field(
+        32, gt=0, description="Number of steps (batches) for calibration. Maximum with calib_tolerance."
+    )
+    calib_tolerance: Optional[float] = Field(
+        None,
+        gt=0,
+        description="Stop calibration once activation ranges and histograms change less than this tolerance per step",
+    )
+    calib_min_steps: int = Field(8, gt=1, description="Minimum number of calibration steps with calib_tolerance")
     num_bits: Literal[8, 16] = Field(8, description="Number of bits used for quantization")
     dispatching_override: Optional[dict[str, Any]] = Field(None, description="Override default dispatching settings")
+    calib_cache_dir: Optional[str] = Field(
+        None, description="Directory to cache activation statistics of calibration runs. No caching if not set."
+    )
 
     class Config:
         extra = "allow"
 
 
+class FreezeStage(BaseModel):
+    epoch: int = Field(..., ge=0, description="Epoch from which on the selected layers are frozen")
+    blocks: Optional[int] = Field(
+        None,
+        gt=0,
+        description="Freeze the first N blocks of the model, i.e., operations named /model.<i>/... with i < N",
+    )
+    layers: list[str] = Field([], description="Regular expressions matching names of operations to freeze")
+    fraction: Optional[float] = Field(
+        None,
+        gt=0,
+        le=1,
+        description="Freeze this fraction of the parameters with the smallest gradient sensitivity in earlier epochs",
+    )
+
+    class Config:
+        extra = "forbid"
+
+    @model_validator(mode="after")
+    def check_selection(self) -> "FreezeStage":
+        if self.blocks is None and not self.layers and self.fraction is None:
+            raise ValueError("A freeze stage needs blocks, layers or fraction")
+        return self
+
+
+class HardExampleSamplingArgs(BaseModel):
+    floor: float = Field(
+        0.1,
+        ge=0,
+        le=1,
+        description="Weight of uniform sampling mixed into the loss-proportional sampling probabilities",
+    )
+    skip_threshold: Optional[float] = Field(
+        None, ge=0, description="Skip images whose last recorded loss is below this threshold. Disabled if not set."
+    )
+    warmup_epochs: int = Field(1, ge=1, description="Number of epochs sampled uniformly to record the losses")
+
+    class Config:
+        extra = "forbid"
+
+
 class QuantizationAwareTrainingArgs(BaseModel):
     epochs: int = Field(..., gt=0, description="Number of training epochs")
     learning_rate: float = Field(3e-5, gt=0, description="Learning rate for training")
+    batch_size: int = Field(1, gt=0, description="Number of images per training and calibration step")
+    accumulation_steps: int = Field(
+        1, gt=0, description="Number of batches whose gradients are accumulated per optimizer step"
+    )
     device: Literal["cpu", "cuda"] = Field("cpu", description="Device used during training. Only cpu or cuda.")
     scheduling: Optional[Literal["linear"]] = Field(None, description="Learning Rate Scheduling method for training")
     scheduler_params: dict[str, Any] = Field({}, description="Learning Rate Scheduling parameters for training")
+    simulation_backend: Literal["ppq", "onnxruntime"] = Field(
+        "ppq", description="Backend simulating the quantized model during validation. onnxruntime runs a QDQ export."
+    )
+    teacher_sessions: int = Field(1, ge=1, description="Number of onnxruntime sessions of the FP32 teacher model")
+    teacher_threads: Optional[int] = Field(
+        None, ge=1, description="Number of intra-op threads per teacher session. Defaults to onnxruntime's choice."
+    )
+    teacher_cache_dir: Optional[str] = Field(
+        None, description="Directory to cache FP32 teacher outputs of the training images across epochs and runs"
+    )
+    teacher_cache_fp16: bool = Field(False, description="Whether to store cached teacher outputs as float16")
+    patience: Optional[int] = Field(
+        None, gt=0, description="Stop training after this number of epochs without validation improvement"
+    )
+    side_process_validation: bool = Field(
+        False, description="Whether to validate epochs in a separate process while the next epoch trains"
+    )
+    side_process_threads: Optional[int] = Field(
+        None,
+        ge=1,
+        description="Number of torch threads of the validation side process, taken from the training process. "
+        "Defaults to a quarter of the threads.",
+    )
+    async_export: bool = Field(True, description="Whether to export epoch models in the background during training")
+    keep_last_models: Optional[int] = Field(
+        None, ge=0, description="Number of most recent epochs whose models are kept. All models are kept if not set."
+    )
+    keep_best_models: int = Field(
+        1, ge=0, description="Number of epochs with the best validation metric whose models are kept additionally"
+    )
+    freeze_schedule: list[FreezeStage] = Field(
+        [], description="Stages freezing layers during training. Frozen layers are excluded from backpropagation."
+    )
+    step_timing: bool = Field(
+        False, description="Whether to measure the phases of training steps and log them per epoch to step_times.jsonl"
+    )
+    hard_example_sampling: Optional[HardExampleSamplingArgs] = Field(
+        None, description="Sample training images in proportion to their loss in earlier epochs. Disabled if not set."
+    )
 
     class Config:
         extra = "allow"
@@ -67,6 +162,13 @@ class BaseConfig(BaseModel):
     project_name: str = Field(..., description="Name of the model run")
     output_dir: str | PathLike = Field(..., description="Directory to save model runs")
     model: str | PathLike = Field(..., description="YOLO model name or path to weights")
+    loggers: list[Literal["local", "wandb"]] = Field(
+        ["local"],
+        description="Backends logging run metrics and artifacts. local writes JSON lines to the run directory.",
+    )
+    artifact_registry_dir: Optional[str] = Field(
+        None, description="Directory of the local artifact registry storing the best models. Disabled if not set."
+    )
 
 
 class TrainConfig(BaseConfig):
@@ -114,6 +216,13 @@ class QuantizationAwareTrainingConfig(BaseConfig):
     training_args: QuantizationAwareTrainingArgs = Field(..., description="Arguments for quantization-aware training")
     quantization_args: QuantizationArgs = Field(..., description="Quantization arguments relevant for QAT")
     num_workers: int = Field(0, description="Number of workers used during calibration and training")
+    image_cache_mb: Optional[int] = Field(
+        None, gt=0, description="Memory budget in MB for caching decoded images across epochs. Disabled if not set."
+    )
+    shards_dir: Optional[str] = Field(
+        None, description="Directory of dataset shards. If set, calibration and training data is streamed from shards."
+    )
+    shuffle_buffer: int = Field(256, ge=0, description="Shuffle buffer size used when streaming from shards")
     split: Optional[Literal["test", "val"]] = Field(None, description="Data split used for validation")
     save_metrics: bool = Field(True, description="Save metrics from model evaluations during training.")
 
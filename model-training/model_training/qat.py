@@ -1,36 +1,63 @@
+import csv
 import json
 import logging
-import os
+import shutil
+import tempfile
+from concurrent.futures import Future
 from datetime import datetime
 from pathlib import Path
-from typing import Any, Literal, Optional, Sequence
+from typing import Any, Literal, Optional
 
 # isort: off
-import onnxruntime as ort
-import ppq.lib as PFL
 import torch
 import yaml
-from ppq.core import TargetPlatform
 from ppq.executor import TorchExecutor
 from ppq.IR import BaseGraph, TrainableGraph
-from ppq.parser import NativeExporter
 from pydantic import ValidationError
 from torch import Tensor
-from torch.utils.data import DataLoader
+from torch.utils.data import DataLoader, Dataset, DistributedSampler, IterableDataset
 from tqdm import tqdm
 from ultralytics import YOLO
-from ultralytics.utils.metrics import DetMetrics
-import wandb
 # isort: on
 
-from model_training.core.constants import TXT_ENCODING, WANDB_PROJECT
+from model_training.core.constants import TXT_ENCODING
 from model_training.core.schemas import (
     DataConfig,
     QuantizationAwareTrainingArgs,
     QuantizationAwareTrainingConfig,
 )
-from model_training.utils.datasets import CalibrationDataset, TrainDataset
+from model_training.utils.artifact_registry import ArtifactRegistry
+from model_training.utils.datasets import (
+    CalibrationDataset,
+    IndexedDataset,
+    SharedImageCache,
+    TrainDataset,
+    ValidationDataset,
+)
+from model_training.utils.distributed import (
+    all_reduce_gradients,
+    all_reduce_mean,
+    barrier,
+    broadcast_graph_state,
+    broadcast_object,
+    is_distributed,
+    is_main_process,
+    main_process_first,
+)
+from model_training.utils.exports import AsyncModelExporter, export_models
+from model_training.utils.fast_validation import FastDetectionValidator
+from model_training.utils.freezing import LayerFreezer
 from model_training.utils.quantization import QuantizationSetup
+from model_training.utils.run_logging import RunLogger, create_run_logger
+from model_training.utils.sampling import LossWeightedSampler
+from model_training.utils.shards import ShardedImageDataset
+from model_training.utils.side_validation import SideProcessValidator
+from model_training.utils.step_timing import StepTimer
+from model_training.utils.teacher import (
+    TeacherOutputCache,
+    TeacherRuntime,
+    teacher_cache_path,
+)
 from model_training.utils.validators import QuantDetectionValidator
 
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
@@ -65,9 +92,12 @@ class QuantizationAwareTrainer:
         self.num_bits = num_bits
         self.epochs = training_arguments.epochs
         self.learning_rate = training_arguments.learning_rate
+        self.accumulation_steps = training_arguments.accumulation_steps
         self.device = training_arguments.device
         self.scheduling = training_arguments.scheduling
         self.scheduler_params = training_arguments.scheduler_params
+        self.simulation_backend = training_arguments.simulation_backend
+        self.async_export = training_arguments.async_export
 
         # PPQ graphs and native model files
         self._latest_native_model: Optional[Path] = None
@@ -76,19 +106,37 @@ class QuantizationAwareTrainer:
         # training state
         self._curr_epoch = 0
         self._curr_step = 0
-        self._best_pr = 0.0
+        self._best_fitness = 0.0
         self._best_metrics: list[dict[str, Any]] = []
         self._best_epoch = 0
+        self._epochs_without_improvement = 0
 
         # init QAT components
         self._executor = TorchExecutor(graph=self.ppq_graph, device=self.device)
         self._training_graph = TrainableGraph(self.ppq_graph)
-        self._loss_fn = torch.nn.MSELoss()
+        self._loss_fn = torch.nn.MSELoss(reduction="none")
+        self._teacher = TeacherRuntime(
+            onnx_model_path=self.onnx_model_path,
+            device=self.device,
+            num_sessions=training_arguments.teacher_sessions,
+            intra_op_threads=training_arguments.teacher_threads,
+        )
+        self._teacher_cache: Optional[TeacherOutputCache] = None
+        self._loss_sampler: Optional[LossWeightedSampler] = None
+        self._model_exporter = AsyncModelExporter(
+            num_bits=self.num_bits,
+            keep_last=training_arguments.keep_last_models,
+            keep_best=training_arguments.keep_best_models,
+        )
         self._lr_scheduler: Optional[torch.optim.lr_scheduler.LinearLR] = None
+        self._step_timer = StepTimer(enabled=training_arguments.step_timing, device=self.device)
 
         # set up optimizer and gradients for trainable parameters
         self._optimizer = self._get_optimizer()
         self._enable_gradients()
+        self._freezer = LayerFreezer(
+            self.ppq_graph, self._training_graph.state_dict(), training_arguments.freeze_schedule
+        )
 
     @property
     def current_epoch(self) -> int:
@@ -101,9 +149,19 @@ class QuantizationAwareTrainer:
         return self._curr_step
 
     @property
-    def best_precision_recall(self) -> float:
-        """Get best metric achieved so far."""
-        return self._best_pr
+    def best_fitness(self) -> float:
+        """Get best validation fitness achieved so far."""
+        return self._best_fitness
+
+    @property
+    def epochs_without_improvement(self) -> int:
+        """Get number of validated epochs since the best validation fitness."""
+        return self._epochs_without_improvement
+
+    @property
+    def best_epoch(self) -> int:
+        """Get epoch of the best validation fitness."""
+        return self._best_epoch
 
     @property
     def best_metrics(self) -> list[dict]:
@@ -118,6 +176,33 @@ class QuantizationAwareTrainer:
     def latest_espdl_model(self) -> Optional[Path]:
         return self._latest_espdl_model
 
+    @property
+    def teacher(self) -> TeacherRuntime:
+        return self._teacher
+
+    @property
+    def step_timer(self) -> StepTimer:
+        return self._step_timer
+
+    @property
+    def frozen_fraction(self) -> float:
+        """Get fraction of frozen parameter elements."""
+        return self._freezer.frozen_fraction
+
+    def use_teacher_cache(self, teacher_cache: TeacherOutputCache) -> None:
+        """
+        Reads FP32 predictions from a teacher output cache for batches of (index, image) pairs
+        :param teacher_cache: Cache of teacher outputs addressed by dataset index
+        """
+        self._teacher_cache = teacher_cache
+
+    def use_loss_sampler(self, loss_sampler: LossWeightedSampler) -> None:
+        """
+        Records the per-image losses of batches of (index, image) pairs in a loss-weighted sampler
+        :param loss_sampler: Sampler drawing the training images of the next epochs
+        """
+        self._loss_sampler = loss_sampler
+
     def _get_optimizer(self) -> torch.optim.Optimizer:
         optimizer = torch.optim.SGD(
             params=[{"params": self._training_graph.parameters()}],
@@ -146,66 +231,107 @@ class QuantizationAwareTrainer:
             raise IOError("No training data found.")
 
         progress_bar = tqdm(
-            train_dataloader, desc=f"Epoch {self._curr_epoch}", total=num_batches if num_batches > 0 else None
+            train_dataloader,
+            desc=f"Epoch {self._curr_epoch}",
+            total=num_batches if num_batches > 0 else None,
+            disable=not is_main_process(),
         )
 
+        self._freezer.apply(self._curr_epoch)
+        self._step_timer.start_epoch()
         for batch_idx, batch in enumerate(progress_bar):
-            data = batch.to(self.device)
-            _, loss = self._training_step(data)
+            self._step_timer.batch_ready()
+            with self._step_timer.phase("data"):
+                # indexed datasets return (index, image) pairs
+                indices, batch = batch if isinstance(batch, (list, tuple)) else (None, batch)
+                data = batch.to(self.device)
+            # accumulate gradients over several batches, the last batches of an epoch always update the parameters
+            optimizer_step = (batch_idx + 1) % self.accumulation_steps == 0 or batch_idx + 1 == num_batches
+            _, loss = self._training_step(data, indices, optimizer_step=optimizer_step)
             epoch_loss += loss
 
             # Update progress bar
             if num_batches > 0:
-                progress_bar.set_postfix({"Loss": f"{loss:.4f}"})
+                progress_bar.set_postfix({"Loss": f"{loss:.4f}", **self._step_timer.rolling_averages()})
+            self._step_timer.end_step()
 
         avg_loss = epoch_loss / (batch_idx + 1) if batch_idx >= 0 else 0.0
+        if self._teacher_cache:
+            self._teacher_cache.flush()
         self._curr_epoch += 1
 
         logger.info(f"Epoch {self._curr_epoch - 1} completed. Average Loss: {avg_loss:.4f}")
         return avg_loss
 
-    def _training_step(self, data: torch.Tensor) -> tuple[list[Tensor], Any]:
-        """Performs one training step one a given batch"""
+    def _training_step(
+        self, data: torch.Tensor, indices: Optional[Tensor] = None, optimizer_step: bool = True
+    ) -> tuple[list[Tensor], Any]:
+        """
+        Performs one training step one a given batch
+        :param data: Input batch of shape [N, C, H, W]
+        :param indices: Dataset indices of the batch, used to look up cached predictions and to record per-image losses
+        :param optimizer_step: Whether to update the parameters. Gradients are accumulated otherwise.
+        """
+        timer = self._step_timer
+
         # Forward pass through quantized model
-        quantized_predictions = self._executor.forward_with_gradient(data)
+        with timer.phase("student"):
+            quantized_predictions = self._executor.forward_with_gradient(data)
 
         # Forward pass through original FP32 model
-        fp32_predictions = self._get_fp32_predictions(data)
+        with timer.phase("teacher"):
+            fp32_predictions = self._get_fp32_predictions(data, indices)
 
         # Compute loss between quantized and FP32 predictions
-        total_loss = 0.0
-        for i, (quant_pred, fp32_pred) in enumerate(zip(quantized_predictions, fp32_predictions)):
-            fp32_tensor = torch.tensor(fp32_pred, device=self.device, dtype=torch.float32)
-            loss = self._loss_fn(quant_pred, fp32_tensor)
-            total_loss += loss
-
-        # Backward pass
-        total_loss.backward()  # type: ignore
-
-        # Optimizer step
-        self._optimizer.step()
-        self._training_graph.zero_grad()
-
-        # Update learning rate if scheduler is available
-        if self._lr_scheduler:
-            self._lr_scheduler.step()
+        with timer.phase("loss"):
+            # MSE per image and output, summed over the outputs
+            sample_losses = 0.0
+            for quant_pred, fp32_pred in zip(quantized_predictions, fp32_predictions):
+                loss = self._loss_fn(quant_pred, fp32_pred.to(self.device))
+                sample_losses += loss.flatten(1).mean(dim=1)
+            total_loss = sample_losses.mean()  # type: ignore
+            if self._loss_sampler is not None and indices is not None:
+                self._loss_sampler.record(indices, sample_losses)  # type: ignore
+
+        # Backward pass, the loss is averaged over the accumulated batches
+        with timer.phase("backward"):
+            (total_loss / self.accumulation_steps).backward()  # type: ignore
+
+        if optimizer_step:
+            with timer.phase("optimizer"):
+                # average the gradients of the data-parallel replicas
+                all_reduce_gradients(self._freezer.trainable_parameters)
+                self._freezer.update_sensitivity()
+                # Optimizer step
+                self._optimizer.step()
+                self._training_graph.zero_grad()
+
+            # Update learning rate if scheduler is available
+            if self._lr_scheduler:
+                with timer.phase("scheduler"):
+                    self._lr_scheduler.step()
 
         self._curr_step += 1
         return quantized_predictions, total_loss.item()  # type: ignore
 
-    def _get_fp32_predictions(self, data: torch.Tensor) -> Sequence[Any]:
+    def _get_fp32_predictions(self, data: torch.Tensor, indices: Optional[Tensor] = None) -> list[Tensor]:
         """Get predictions from original FP32 ONNX model.
 
         :param data: Input tensor
-        returns: List of FP32 model predictions
+        :param indices: Dataset indices of the batch, used to look up cached predictions
+        returns: List of FP32 model predictions, valid until the next call
         """
+        if self._teacher_cache is not None and indices is not None:
+            cached = self._teacher_cache.lookup(indices)
+            if cached is not None:
+                return cached
         try:
-            session = ort.InferenceSession(self.onnx_model_path.as_posix())
-            input_name = session.get_inputs()[0].name
-            numpy_data = data.cpu().numpy()
-            return session.run(None, {input_name: numpy_data})
+            predictions = self._teacher(data)
         except Exception as e:
             raise RuntimeError(f"Failed to run FP32 inference: {e}") from e
+        if self._teacher_cache is not None and indices is not None:
+            self._teacher_cache.store(indices, predictions)
+        return predictions
 
     def evaluate(self, save_metrics: bool, file_path: Optional[Path] = None):
         """
@@ -228,6 +354,7 @@ class QuantizationAwareTrainer:
                     "onnx_model_path": self.onnx_model_path,
                     "native_model_path": self.latest_native_model,
                     "num_bits": self.num_bits,
+                    "simulation_backend": self.simulation_backend,
                 }
             ),
             split="val",
@@ -240,40 +367,74 @@ class QuantizationAwareTrainer:
 
         return results
 
-    def save_model(self, espdl_path: Path, native_path: Path) -> None:
+    def save_model(
+        self, espdl_path: Path, native_path: Path, epoch: Optional[int] = None, await_metric: bool = False
+    ) -> Optional[Future]:
         """
         Saves intermediate espdl and native models during training.
         :param espdl_path: Path to espdl model file, including file name.
         :param native_path: Path to native model file, including file name.
+        :param epoch: Epoch of the models. If set and asynchronous export is enabled, a snapshot of the model is
+            exported in the background and the models are subject to the retention policy.
+        :param await_metric: Keep the models of the epoch at least until its metric is set (cf. update_metrics)
+        :return: Future of the background export, None if the models were saved synchronously
         """
+        if epoch is None or not self.async_export:
+            export_models(self.ppq_graph, self.num_bits, espdl_path, native_path)
+            self._latest_espdl_model = espdl_path
+            self._latest_native_model = native_path
+            return None
+
+        def set_latest_models(future: Future) -> None:
+            if future.exception() is None:
+                self._latest_espdl_model = espdl_path
+                self._latest_native_model = native_path
 
-        match self.num_bits:
-            case 8:
-                espdl_exporter = PFL.Exporter(platform=TargetPlatform.ESPDL_INT8)
-            case 16:
-                espdl_exporter = PFL.Exporter(platform=TargetPlatform.ESPDL_INT16)
-            case _:
-                raise IOError(f"Invalid number of bits: {self.num_bits}. Only 8 or 16 are supported for quantization.")
-        espdl_exporter.export(espdl_path.as_posix(), self.ppq_graph)
-        self._latest_espdl_model = espdl_path
-
-        native_exporter = NativeExporter()
-        native_exporter.export(native_path.as_posix(), self.ppq_graph)
-        self._latest_native_model = native_path
-
-    def update_metrics(self, scores: DetMetrics) -> bool:
+        future = self._model_exporter.submit(self.ppq_graph, epoch, espdl_path, native_path, await_metric)
+        future.add_done_callback(set_latest_models)
+        return future
+
+    def wait_for_exports(self) -> None:
+        """Blocks until all models submitted for background export are written"""
+        self._model_exporter.wait()
+
+    def close(self) -> None:
+        self._model_exporter.close()
+
+    def validate(self, validator: FastDetectionValidator) -> dict[str, float]:
         """
-        Keeps track of best metrics from model runs
-        :param scores: Detection Metrics from Ultralytics
+        Validates the current quantized model in-process
+        :param validator: Validator holding the validation set
+        :return: Validation metrics
         """
-        if scores:
-            # if Precision-Recall is the highest, keep track of best model results
-            if scores.curves_results[0] > self.best_precision_recall:
-                self._best_metrics = json.loads(scores.to_json())
-                self._best_epoch = self.current_epoch
-                return True
+        return validator(self._executor.forward, device=self.device)
+
+    def update_metrics(self, scores: dict[str, float], epoch: Optional[int] = None) -> bool:
+        """
+        Keeps track of best metrics from model runs. Epochs must be updated in order.
+        :param scores: Validation metrics including fitness
+        :param epoch: Validated epoch. Defaults to the last trained epoch.
+        :return: Whether the metrics are the best so far
+        """
+        epoch = self.current_epoch - 1 if epoch is None else epoch
+        # if fitness is the highest, keep track of best model results
+        if scores["fitness"] > self.best_fitness or not self._best_metrics:
+            self._best_fitness = scores["fitness"]
+            self._best_metrics = [scores]
+            self._best_epoch = epoch
+            self._epochs_without_improvement = 0
+            return True
+        self._epochs_without_improvement += 1
         return False
 
+    def set_model_metric(self, epoch: int, metric: float) -> None:
+        """
+        Ranks the exported models of an epoch for the retention policy
+        :param epoch: Epoch number
+        :param metric: Validation metric, higher is better
+        """
+        self._model_exporter.set_metric(epoch, metric)
+
 
 class QuantizationAwareTrainingPipeline:
     """Implements the full pipline for YOLO quantization-aware training."""
@@ -281,6 +442,10 @@ class QuantizationAwareTrainingPipeline:
     def __init__(self, config: QuantizationAwareTrainingConfig) -> None:
         """Initialize pipeline"""
         self.config = config
+        self.artifact_registry: Optional[ArtifactRegistry] = None
+        self._onnx_model_digest: Optional[str] = None
+        if config.artifact_registry_dir:
+            self._setup_artifact_registry(Path(config.artifact_registry_dir))
 
         self.model_path = Path(self.config.model)
         self.model_name = self.model_path.stem
@@ -298,8 +463,9 @@ class QuantizationAwareTrainingPipeline:
 
         # init model run meta data
         self.dataset_config: DataConfig = self._load_data_config()
-        self.run_name = self._generate_run_name()
-        self.wandb_run = self._init_wandb()
+        # data-parallel ranks share the run name of rank 0
+        self.run_name = broadcast_object(self._generate_run_name())
+        self.run_logger = self._init_run_logger()
 
     def run(self) -> None:
         logger.info("Starting QAT pipeline")
@@ -308,7 +474,19 @@ class QuantizationAwareTrainingPipeline:
         self._setup_quantization()
 
         logger.info("Running calibration")
-        self._calibrate()
+        # rank 0 fills the calibration cache for the other ranks, which render the statistics instead of calibrating
+        tmp_cache_dir = None
+        if is_distributed() and not self.quantization_setup.calib_cache_dir:  # type: ignore
+            tmp_cache_dir = broadcast_object(tempfile.mkdtemp(prefix="qat-calib-") if is_main_process() else None)
+            self.quantization_setup.calib_cache_dir = tmp_cache_dir  # type: ignore
+        with main_process_first():
+            self._calibrate()
+        # data-parallel replicas start from the calibration of rank 0
+        broadcast_graph_state(self.quantization_setup.graph)  # type: ignore
+        if tmp_cache_dir:
+            barrier()
+            if is_main_process():
+                shutil.rmtree(tmp_cache_dir, ignore_errors=True)
 
         logger.info("Configure training")
         self._initialize_trainer()
@@ -337,19 +515,36 @@ class QuantizationAwareTrainingPipeline:
         if self.quantization_setup is None:
             raise RuntimeError("Quantization setup must be completed before calibration")
 
-        calibration_dataset = CalibrationDataset(
-            path=Path(self.config.calib_dataset_path),
-            img_size=(self.input_shape[2], self.input_shape[3]),
-        )
+        calibration_dataset: Dataset
+        if self.config.shards_dir:
+            calibration_dataset = ShardedImageDataset(
+                shards_dir=Path(self.config.shards_dir),
+                split="train",
+                img_size=(self.input_shape[2], self.input_shape[3]),
+                shuffle_buffer=self.config.shuffle_buffer,
+            )
+        else:
+            calibration_dataset = CalibrationDataset(
+                path=Path(self.config.calib_dataset_path),
+                img_size=(self.input_shape[2], self.input_shape[3]),
+            )
+            if self.config.image_cache_mb:
+                # KL calibration iterates the calibration data twice
+                calibration_dataset = SharedImageCache(calibration_dataset, self.config.image_cache_mb)
 
         calibration_dataloader = DataLoader(
             calibration_dataset,
-            batch_size=1,  # only batch size of 1 is supported for calibration
-            shuffle=True,
+            batch_size=self.config.training_args.batch_size,
+            shuffle=not isinstance(calibration_dataset, IterableDataset),
             num_workers=self.config.num_workers,
+            # a fixed order, such that cached calibration statistics match those of a fresh calibration
+            generator=torch.Generator().manual_seed(0),
         )
 
-        calibration_pipeline = self.quantization_setup.create_calibration_pipeline()
+        calib_data_path = Path(self.config.shards_dir or self.config.calib_dataset_path)
+        calibration_pipeline = self.quantization_setup.create_calibration_pipeline(
+            calib_data_path, batch_size=self.config.training_args.batch_size
+        )
         self.quantization_setup.run_calibration(calibration_dataloader, calibration_pipeline)
 
     def _initialize_trainer(self) -> None:
@@ -376,53 +571,258 @@ class QuantizationAwareTrainingPipeline:
             raise SystemExit(1)
 
     def _run_training_loop(self) -> None:
-        training_dataset = TrainDataset(
-            path=Path(self.dataset_config.path),
-            img_size=(self.input_shape[2], self.input_shape[3]),
-            split=self.dataset_config.train,
-        )
+        training_dataset: Dataset
+        if self.config.shards_dir:
+            training_dataset = ShardedImageDataset(
+                shards_dir=Path(self.config.shards_dir),
+                split="train",
+                img_size=(self.input_shape[2], self.input_shape[3]),
+                shuffle_buffer=self.config.shuffle_buffer,
+            )
+        else:
+            training_dataset = TrainDataset(
+                path=Path(self.dataset_config.path),
+                img_size=(self.input_shape[2], self.input_shape[3]),
+                split=self.dataset_config.train,
+            )
+            if self.config.image_cache_mb:
+                training_dataset = SharedImageCache(training_dataset, self.config.image_cache_mb)
+        with main_process_first():
+            training_dataset = self._setup_teacher_cache(training_dataset)
+
+        # each data-parallel rank trains on its own part of the dataset
+        sampler: Optional[DistributedSampler | LossWeightedSampler] = None
+        if self.config.training_args.hard_example_sampling:
+            training_dataset, sampler = self._setup_loss_sampler(training_dataset)
+        if is_distributed() and sampler is None:
+            if isinstance(training_dataset, IterableDataset):
+                raise ValueError(
+                    "Data-parallel QAT requires equally sized rank shards, which shards_dir does not provide"
+                )
+            sampler = DistributedSampler(training_dataset, shuffle=True)
+
         training_dataloader = DataLoader(
             dataset=training_dataset,
-            batch_size=1,  # only batch_size=1 is supported
-            shuffle=True,
+            batch_size=self.config.training_args.batch_size,
+            shuffle=sampler is None and not isinstance(training_dataset, IterableDataset),
+            sampler=sampler,
             num_workers=self.config.num_workers,
         )
 
+        # only rank 0 exports, validates and logs
+        main_process = is_main_process()
         output_dir = self._create_output_dir(self.run_name)
+        validator = self._create_validator() if main_process else None
+        side_validator: Optional[SideProcessValidator] = None
+        if validator and self.config.training_args.side_process_validation:
+            # split the cores, such that validation and training do not compete for the same threads
+            num_threads = torch.get_num_threads()
+            side_threads = min(self.config.training_args.side_process_threads or num_threads // 4, num_threads - 1)
+            side_threads = max(side_threads, 1)
+            torch.set_num_threads(max(num_threads - side_threads, 1))
+            side_validator = SideProcessValidator(validator, device=self.device, num_threads=side_threads)
+            logger.info(f"Side process validates with {side_threads} threads, training uses {torch.get_num_threads()}")
+        pending_validations: list[tuple[int, Future]] = []
 
         logger.info(f"Start training for {self.config.training_args.epochs} epochs")
         for epoch in range(self.config.training_args.epochs):
-            epoch_loss = self.trainer.train_epoch(training_dataloader)  # type: ignore
-
-            epoch_model_name = f"qat_{self.model_name}_epoch_{epoch}"
-            espdl_path = output_dir / "espdl" / f"{epoch_model_name}.espdl"
-            native_path = output_dir / "native" / f"{epoch_model_name}.native"
-
-            self.trainer.save_model(espdl_path, native_path)  # type: ignore
-
-            # FIXME: model evaluation during training on validation dataset requires custom post-processing
-            # metrics_path = output_dir / "metrics" / f"{epoch_model_name}_metrics.csv"
-            # metrics = self.trainer.evaluate(self.config.save_metrics, metrics_path)
-
-            # if self.trainer.update_metrics(metrics):
-            #     best_espdl_model = output_dir / "espdl" / "best.espdl"
-            #     best_native_model = output_dir / "native" / "best.native"
-            #     self.trainer.save_model(best_espdl_model, best_native_model)
-            #
-            #     self._wandb_log_best_model(
-            #         epoch=epoch,
-            #         best_espdl_model_path=best_espdl_model,
-            #         best_native_model_path=best_native_model
-            #     )
-            #
-            # self._wandb_log_epoch(
-            #     epoch=epoch,
-            #     train_loss=epoch_loss,
-            #     val_metrics=metrics,
-            #     espdl_model_path=espdl_path,
-            #     native_model_path=native_path
-            # )
-            logger.info(f"Epoch: {epoch + 1}: Loss: {epoch_loss:.4f}")
+            if sampler:
+                sampler.set_epoch(epoch)
+            epoch_loss = all_reduce_mean(self.trainer.train_epoch(training_dataloader))  # type: ignore
+
+            if main_process:
+                espdl_path, native_path = self._epoch_model_paths(output_dir, epoch)
+
+                # keep the epoch's models until validated, they may become the best models
+                export = self.trainer.save_model(  # type: ignore
+                    espdl_path, native_path, epoch=epoch, await_metric=validator is not None
+                )
+
+                if side_validator:
+                    # validation results of earlier epochs are handled as they arrive
+                    pending_validations.append((epoch, side_validator.submit(native_path, after=export)))
+                elif validator:
+                    metrics = self.trainer.validate(validator)  # type: ignore
+                    self._handle_validation(epoch, metrics, output_dir)
+                while pending_validations and pending_validations[0][1].done():
+                    validated_epoch, validation = pending_validations.pop(0)
+                    self._handle_validation(validated_epoch, validation.result(), output_dir)
+
+                self._log_epoch(epoch=epoch, train_loss=epoch_loss, frozen_fraction=self.trainer.frozen_fraction)  # type: ignore
+                logger.info(f"Epoch: {epoch + 1}: Loss: {epoch_loss:.4f}")
+                if self.config.training_args.step_timing:
+                    self._save_step_times(epoch, output_dir / "step_times.jsonl")
+
+            # all ranks stop when rank 0 does
+            if broadcast_object(main_process and self._should_stop()):
+                break
+
+        # wait for the validations of the last epochs
+        for validated_epoch, validation in pending_validations:
+            self._handle_validation(validated_epoch, validation.result(), output_dir)
+        if side_validator:
+            side_validator.close()
+        self.trainer.close()  # type: ignore
+
+    def _epoch_model_paths(self, output_dir: Path, epoch: int) -> tuple[Path, Path]:
+        epoch_model_name = f"qat_{self.model_name}_epoch_{epoch}"
+        return output_dir / "espdl" / f"{epoch_model_name}.espdl", output_dir / "native" / f"{epoch_model_name}.native"
+
+    def _handle_validation(self, epoch: int, metrics: dict[str, float], output_dir: Path) -> None:
+        """
+        Tracks the validation metrics of an epoch, saves the best model and logs the metrics
+        :param epoch: Validated epoch
+        :param metrics: Validation metrics
+        :param output_dir: Output directory of the run
+        """
+        espdl_path, native_path = self._epoch_model_paths(output_dir, epoch)
+        if self.config.save_metrics:
+            self._save_metrics(metrics, output_dir / "metrics" / f"{native_path.stem}_metrics.csv")
+
+        if self.trainer.update_metrics(metrics, epoch):  # type: ignore
+            best_espdl_model = output_dir / "espdl" / "best.espdl"
+            best_native_model = output_dir / "native" / "best.native"
+            if epoch == self.trainer.current_epoch - 1:  # type: ignore
+                self.trainer.save_model(best_espdl_model, best_native_model)  # type: ignore
+            else:
+                # the model has been trained further, copy the models exported for the epoch
+                self.trainer.wait_for_exports()  # type: ignore
+                for path in espdl_path.parent.glob(f"{espdl_path.stem}.*"):
+                    shutil.copy(path, best_espdl_model.with_suffix(path.suffix))
+                shutil.copy(native_path, best_native_model)
+
+            if self.artifact_registry:
+                self._register_best_models(epoch, metrics, [best_espdl_model, best_native_model])
+            self._log_best_model(
+                epoch=epoch,
+                best_espdl_model_path=best_espdl_model,
+                best_native_model_path=best_native_model,
+            )
+        # rank the epoch's models for the retention policy after copying them
+        self.trainer.set_model_metric(epoch, metrics["fitness"])  # type: ignore
+
+        self.run_logger.log_metrics({"epoch": epoch, "val_metrics": metrics})
+        logger.info(f"Epoch: {epoch + 1}: Validation: {metrics}")
+
+    def _should_stop(self) -> bool:
+        patience = self.config.training_args.patience
+        if patience and self.trainer.best_metrics and self.trainer.epochs_without_improvement >= patience:  # type: ignore
+            logger.info(f"Stopping early, no improvement since epoch {self.trainer.best_epoch + 1}")  # type: ignore
+            return True
+        return False
+
+    def _create_validator(self) -> Optional[FastDetectionValidator]:
+        """Creates the in-process validator on the configured validation split, if any"""
+        if not self.config.split:
+            logger.info("No validation split configured, training without validation")
+            return None
+        split = getattr(self.dataset_config, self.config.split)
+        if split is None:
+            raise ValueError(f"Split {self.config.split} not defined in {self.config.dataset_yaml_file_path}")
+        validation_dataset = ValidationDataset(
+            path=Path(self.dataset_config.path),
+            split=split,
+            img_size=(self.input_shape[2], self.input_shape[3]),
+        )
+        return FastDetectionValidator(validation_dataset, batch_size=self.config.training_args.batch_size)
+
+    def _save_step_times(self, epoch: int, file_path: Path) -> None:
+        """Appends the step time summary of the last trained epoch to a JSONL file"""
+        summary = {
+            "epoch": epoch,
+            "frozen_fraction": self.trainer.frozen_fraction,  # type: ignore
+            **self.trainer.step_timer.epoch_summary(),  # type: ignore
+        }
+        with file_path.open("a", encoding=TXT_ENCODING) as f:
+            f.write(json.dumps(summary) + "\n")
+        logger.info(f"Epoch: {epoch + 1}: Step times: {summary}")
+
+    @staticmethod
+    def _save_metrics(metrics: dict[str, float], file_path: Path) -> None:
+        with file_path.open("w", encoding=TXT_ENCODING, newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=list(metrics))
+            writer.writeheader()
+            writer.writerow(metrics)
+
+    def _setup_teacher_cache(self, training_dataset: Dataset) -> Dataset:
+        """Enables the teacher output cache of the trainer and returns the training dataset yielding indices"""
+        training_args = self.config.training_args
+        if not training_args.teacher_cache_dir:
+            return training_dataset
+        if isinstance(training_dataset, IterableDataset):
+            logger.warning("Teacher outputs are cached by dataset index, which is not available for shards")
+            return training_dataset
+
+        img_size = (self.input_shape[2], self.input_shape[3])
+        dataset = training_dataset
+        while isinstance(dataset, (SharedImageCache, IndexedDataset)):
+            dataset = dataset.dataset
+        if not isinstance(dataset, TrainDataset):
+            raise TypeError(f"Teacher outputs can only be cached for a TrainDataset, received {type(dataset).__name__}")
+        img_paths = dataset.img_paths
+        cache_dir = teacher_cache_path(
+            cache_dir=Path(training_args.teacher_cache_dir),
+            onnx_model_path=Path(self.config.onnx_model_path),
+            img_paths=img_paths,
+            img_size=img_size,
+            fp16=training_args.teacher_cache_fp16,
+        )
+        teacher_cache = TeacherOutputCache(
+            cache_dir=cache_dir,
+            teacher=self.trainer.teacher,  # type: ignore
+            num_samples=len(training_dataset),  # type: ignore
+            input_shape=self.input_shape[1:],
+            fp16=training_args.teacher_cache_fp16,
+        )
+        self.trainer.use_teacher_cache(teacher_cache)  # type: ignore
+        return IndexedDataset(training_dataset)
+
+    def _setup_loss_sampler(self, training_dataset: Dataset) -> tuple[Dataset, Optional[LossWeightedSampler]]:
+        """Enables loss-weighted sampling of the training images and returns the dataset yielding indices"""
+        sampling_args = self.config.training_args.hard_example_sampling
+        if isinstance(training_dataset, IterableDataset):
+            logger.warning("Hard example sampling draws images by dataset index, which is not available for shards")
+            return training_dataset, None
+
+        if not isinstance(training_dataset, IndexedDataset):
+            training_dataset = IndexedDataset(training_dataset)
+        sampler = LossWeightedSampler(
+            num_samples=len(training_dataset),
+            floor=sampling_args.floor,  # type: ignore
+            skip_threshold=sampling_args.skip_threshold,  # type: ignore
+            warmup_epochs=sampling_args.warmup_epochs,  # type: ignore
+        )
+        self.trainer.use_loss_sampler(sampler)  # type: ignore
+        return training_dataset, sampler
+
+    def _setup_artifact_registry(self, registry_dir: Path) -> None:
+        """Resolves the ONNX model, which may reference a registered model as sha256:<digest>, and registers it"""
+        self.artifact_registry = ArtifactRegistry(registry_dir)
+        onnx_model_path = self.artifact_registry.resolve(self.config.onnx_model_path)
+        self.config.onnx_model_path = onnx_model_path.as_posix()
+        with main_process_first():
+            self._onnx_model_digest = self.artifact_registry.add(onnx_model_path).digest
+
+    def _register_best_models(self, epoch: int, metrics: dict[str, float], model_paths: list[Path]) -> None:
+        """
+        Stores the best models in the artifact registry, derived from the ONNX model
+        :param epoch: Epoch of the models
+        :param metrics: Validation metrics of the epoch
+        :param model_paths: Paths to the best .espdl and .native models
+        """
+        for model_path in model_paths:
+            artifact = self.artifact_registry.add(  # type: ignore
+                model_path,
+                name=f"qat_{self.model_name}_epoch_{epoch}",
+                run_name=self.run_name,
+                dataset=Path(self.config.dataset_yaml_file_path).stem,
+                num_bits=self.config.quantization_args.num_bits,
+                config=self.config.quantization_args.model_dump(mode="json"),
+                metadata={"epoch": epoch, "training_args": self.config.training_args.model_dump(mode="json")},
+                metrics=metrics,
+                parents=[self._onnx_model_digest],  # type: ignore
+            )
+            logger.info(f"Registered {model_path.name} of epoch {epoch + 1} as {artifact.digest[:12]}")
 
     def _generate_run_name(self) -> str:
         timestamp = datetime.now().strftime("%Y%m%d-%H%M%S")
@@ -435,75 +835,52 @@ class QuantizationAwareTrainingPipeline:
             (output_dir / sub_dir).mkdir(parents=True, exist_ok=True)
         return output_dir
 
-    @staticmethod
-    def _wandb_login() -> None:
-        wandb.login(anonymous="allow", key=os.environ["WANDB_API_KEY"], timeout=60)
-
-    def _init_wandb(self) -> wandb.sdk.wandb_run.Run:
-        return wandb.init(
-            project=WANDB_PROJECT,
-            name=self.run_name,
+    def _init_run_logger(self) -> RunLogger:
+        """Creates the logger of the configured backends, data-parallel ranks other than rank 0 do not log"""
+        return create_run_logger(
+            backends=self.config.loggers if is_main_process() else [],
+            log_dir=Path("qat-runs") / self.run_name / "logs",
+            run_name=self.run_name,
+            config=self.config.model_dump(mode="json"),
             tags=["QAT"],
-            config=self.config.model_dump(),
-            anonymous="allow",
-            force=True,
         )
 
-    def _wandb_log_epoch(
-        self,
-        epoch: int,
-        train_loss: float,
-        val_metrics: DetMetrics,
-        espdl_model_path: Path,
-        native_model_path: Path,
-    ) -> None:
+    def _log_epoch(self, epoch: int, train_loss: float, frozen_fraction: float) -> None:
         """
-        Logs epoch data to Weights & Biases
+        Logs epoch data to the run logger
         :param epoch: current epoch
         :param train_loss: current training loss
-        :param val_metrics: validation metrics
-        :param espdl_model_path: path to .espdl model file of the current epoch
-        :param native_model_path: path to .native model file of the current epoch
+        :param frozen_fraction: fraction of frozen parameter elements during the epoch
         """
-        wandb.log(
-            data={
-                "train_loss": train_loss,
-                "val_metrics": {
-                    "curves": {
-                        curve: curve_results
-                        for curve, curve_results in zip(val_metrics.curves, val_metrics.curves_results)
-                    },
-                    **val_metrics.results_dict,
-                }
-                if val_metrics
-                else {},
-            },
-            commit=True,
-        )
-        # log .espdl model
-        artifact = wandb.Artifact(espdl_model_path.stem, type="model", metadata=self.config.model_dump())
-        artifact.add_file(espdl_model_path.as_posix())
-        # log .native model
-        artifact.add_file(native_model_path.as_posix())
-        self.wandb_run.log_artifact(artifact, aliases=[f"epoch_{epoch}"])
-
-    def _wandb_log_best_model(self, epoch: int, best_espdl_model_path: Path, best_native_model_path: Path) -> None:
+        self.run_logger.log_metrics({"epoch": epoch, "train_loss": train_loss, "frozen_fraction": frozen_fraction})
+
+    def _log_best_model(self, epoch: int, best_espdl_model_path: Path, best_native_model_path: Path) -> None:
         """
-        Logs/overwrites the best-performing model of the current model run to Weights & Biases
+        Logs/overwrites the best-performing model of the current model run to the run logger
         :param epoch: current epoch
         :param best_espdl_model_path: path to best .espdl model file
         :param best_native_model_path: path to best .native model file
         """
-        # log .espdl model
-        artifact = wandb.Artifact(
+        self.run_logger.log_artifact(
             best_espdl_model_path.stem,
-            type="model",
-            metadata=self.config.model_dump(),
+            paths=[best_espdl_model_path, best_native_model_path],
+            aliases=["best", f"epoch_{epoch}"],
+            metadata=self.config.model_dump(mode="json"),
         )
-        artifact.add_file(best_espdl_model_path.as_posix())
-        artifact.add_file(best_native_model_path.as_posix())
-        self.wandb_run.log_artifact(best_espdl_model_path, aliases=["best", f"epoch_{epoch}"])
 
-    def finish_wandb(self) -> None:
-        wandb.finish()
-        logger.info(f"Training completed, view results under: {self.wandb_run.url}")
+    def finish_logging(self) -> None:
+        """Waits until the run logger has logged all records"""
+        self.run_logger.finish()
+        logger.info(f"Training completed, view results under: {', '.join(self.run_logger.locations) or None}")
+
+
+def run_qat_pipeline(config_path: Path) -> None:
+    """
+    Runs the QAT pipeline of a YAML config file. Used by the CLI, also as entry point of data-parallel processes.
+    :param config_path: Path to QAT config file
+    """
+    pipeline = QuantizationAwareTrainingPipeline(QuantizationAwareTrainingConfig.from_yaml(config_path))
+    try:
+        pipeline.run()
+    finally:
+        pipeline.finish_logging()
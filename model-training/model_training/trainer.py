@@ -1,19 +1,17 @@
 import logging
-import os
 from datetime import datetime
 from pathlib import Path
+from typing import Any
 
-# isort: off
-import wandb
-from wandb.integration.ultralytics import add_wandb_callback
 import yaml
 from pydantic import ValidationError
 from ultralytics import YOLO
 from ultralytics.data.split import autosplit
-# isort: on
 
 from model_training.core.constants import WANDB_PROJECT
 from model_training.core.schemas import DataConfig, DataSplitArgs, TrainConfig
+from model_training.utils.artifact_registry import ArtifactRegistry
+from model_training.utils.run_logging import RunLogger, create_run_logger
 
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
 logger = logging.getLogger(__name__)
@@ -40,7 +38,7 @@ class Trainer:
         self.run_name = self._generate_run_name()
         self.output_dir: Path = Path(self.run_config.output_dir) / self.run_name
 
-        self._init_wandb()
+        self.run_logger = self._init_run_logger()
         if self.run_config.data_split_args:
             self._split_dataset(split_args=self.run_config.data_split_args, data_path=self.data_config.path)
 
@@ -88,10 +86,36 @@ class Trainer:
         timestamp = datetime.now().strftime("%Y%m%d-%H%M%S")
         return f"{self.run_config.project_name}_{self.model_name}_{timestamp}"
 
-    def _init_wandb(self) -> None:
-        """Creates W&B session"""
-        wandb.login(anonymous="allow", key=os.environ["WANDB_API_KEY"])
-        add_wandb_callback(self.model, enable_model_checkpointing=True)
+    def _init_run_logger(self) -> RunLogger:
+        """
+        Creates the run logger of the configured backends and registers its Ultralytics callbacks. All backends, W&B
+        included, log from the background thread of the run logger, so logging never stalls a training step.
+        """
+        run_logger = create_run_logger(
+            backends=self.run_config.loggers,
+            log_dir=self.output_dir / "logs",
+            run_name=self.run_name,
+            config=self.run_config.model_dump(mode="json"),
+        )
+        self.model.add_callback("on_fit_epoch_end", self._log_epoch)
+        self.model.add_callback("on_train_end", self._log_best_model)
+        return run_logger
+
+    def _log_epoch(self, trainer: Any) -> None:
+        """
+        Ultralytics callback logging the losses and validation metrics of an epoch
+        :param trainer: Ultralytics trainer
+        """
+        losses = trainer.label_loss_items(trainer.tloss, prefix="train")
+        self.run_logger.log_metrics({"epoch": trainer.epoch, **losses, **trainer.metrics, **trainer.lr})
+
+    def _log_best_model(self, trainer: Any) -> None:
+        """
+        Ultralytics callback logging the best model as artifact
+        :param trainer: Ultralytics trainer
+        """
+        if trainer.best.exists():
+            self.run_logger.log_artifact(f"{self.run_name}_best", paths=[trainer.best], aliases=["best"])
 
     def _load_model(self) -> YOLO:
         """
@@ -136,7 +160,18 @@ class Trainer:
         result_logs = "\n".join(f"{metric}: {value}" for metric, value in metrics.results_dict.items())
         logger.info(result_logs)
 
-    @staticmethod
-    def finish_run() -> None:
-        """Log out from W&B session"""
-        wandb.finish()
+        if self.run_config.artifact_registry_dir:
+            registry = ArtifactRegistry(Path(self.run_config.artifact_registry_dir))
+            artifact = registry.add(
+                best_model_path,
+                name=f"{self.run_name}_best",
+                run_name=self.run_name,
+                dataset=Path(self.run_config.train_args.data).stem,
+                config=self.run_config.train_args.model_dump(mode="json"),
+                metrics=metrics.results_dict,
+            )
+            logger.info(f"Registered best model as {artifact.digest[:12]}")
+
+    def finish_run(self) -> None:
+        """Waits until the run logger has logged all records and closes its backends"""
+        self.run_logger.finish()
@@ -0,0 +1,187 @@
+import logging
+from math import ceil
+from typing import Any, Iterable, Optional
+
+import torch
+from ppq.executor import BaseGraphExecutor, RuntimeHook
+from ppq.quantization.observer import (
+    CalibrationHook,
+    TorchHistObserver,
+    TorchMinMaxObserver,
+)
+from ppq.quantization.optim.calibration import RuntimeCalibrationPass
+from tqdm import tqdm
+
+logger = logging.getLogger(__name__)
+
+# phase of TorchHistObserver in which histograms are collected
+_HIST_PHASE = "Collating Hist"
+
+
+def observer_keys(hook: CalibrationHook) -> dict[str, Any]:
+    """
+    Maps stable keys (operation name, input/output index) to the observers of a calibration hook
+    :param hook: Calibration hook of an operation observer
+    :return: Mapping of keys like "/model.0/conv/Conv/out0" to observers
+    """
+    operation = hook._operation
+    keys = {}
+    for prefix, configs in (
+        ("in", operation.config.input_quantization_config),
+        ("out", operation.config.output_quantization_config),
+    ):
+        for idx, config in enumerate(configs):
+            if config in hook._observer_table:
+                keys[f"{operation.name}/{prefix}{idx}"] = hook._observer_table[config]
+    return keys
+
+
+def range_change(previous: tuple[float, float], current: tuple[float, float]) -> float:
+    """Change of a value range relative to the width of the current range"""
+    width = max(current[1] - current[0], 1e-12)
+    return (abs(current[0] - previous[0]) + abs(current[1] - previous[1])) / width
+
+
+def histogram_change(previous: torch.Tensor, current: torch.Tensor, eps: float = 1e-10) -> float:
+    """KL divergence of the current from the previous normalized histogram"""
+    p = current.double() / max(current.sum().item(), 1)
+    q = previous.double() / max(previous.sum().item(), 1)
+    return torch.sum(p * torch.log((p + eps) / (q + eps))).item()
+
+
+class ConvergenceMonitor:
+    """Counts the consecutive steps in which the statistics of each observed tensor changed less than a tolerance"""
+
+    def __init__(self, tolerance: float, patience: int = 2) -> None:
+        """
+        :param tolerance: Maximum change per step of a converged statistic
+        :param patience: Number of consecutive steps within the tolerance until a statistic counts as converged
+        """
+        self.tolerance = tolerance
+        self.patience = patience
+        self._stable_steps: dict[str, int] = {}
+
+    def update(self, key: str, change: float) -> None:
+        self._stable_steps[key] = self._stable_steps.get(key, 0) + 1 if change <= self.tolerance else 0
+
+    @property
+    def converged(self) -> bool:
+        return bool(self._stable_steps) and min(self._stable_steps.values()) >= self.patience
+
+    @property
+    def num_pending(self) -> int:
+        return sum(steps < self.patience for steps in self._stable_steps.values())
+
+
+class AdaptiveRuntimeCalibrationPass(RuntimeCalibrationPass):
+    """
+    Runtime calibration pass that stops each calibration phase once the statistics of all observed tensors converged.
+
+    In the first phase, the running min/max range of every tensor is tracked, and in the second phase the KL
+    histograms. A phase stops as soon as every tracked statistic changed less than the tolerance for a number of
+    consecutive steps, but not before the minimum number of steps. calib_steps is the maximum number of steps. Without
+    a tolerance, the pass calibrates on the full number of steps like RuntimeCalibrationPass.
+    """
+
+    def __init__(
+        self,
+        method: str = "kl",
+        calib_steps: int = 32,
+        tolerance: Optional[float] = None,
+        min_steps: int = 8,
+        patience: int = 2,
+    ) -> None:
+        """
+        :param method: Calibration method
+        :param calib_steps: Maximum number of calibration steps
+        :param tolerance: Relative range change and histogram KL divergence per step below which a statistic counts
+            as converged. Early stopping is disabled if not set.
+        :param min_steps: Minimum number of calibration steps
+        :param patience: Number of consecutive steps within the tolerance until a statistic counts as converged
+        """
+        super().__init__(method=method, calib_steps=calib_steps)
+        self.tolerance = tolerance
+        self.min_steps = min_steps
+        self.patience = patience
+        self.steps_used: dict[str, int] = {}
+
+    def _statistics(self, hooks: dict[str, RuntimeHook]) -> Optional[dict[str, Any]]:
+        """Current statistics of all observers, or None if an observer's statistics cannot be tracked"""
+        statistics: dict[str, Any] = {}
+        observers = {
+            key: observer
+            for hook in hooks.values()
+            for key, observer in observer_keys(hook).items()  # type: ignore
+        }
+        collating_hist = any(
+            isinstance(observer, TorchHistObserver) and observer._phase == _HIST_PHASE
+            for observer in observers.values()
+        )
+        for key, observer in observers.items():
+            if type(observer) not in {TorchMinMaxObserver, TorchHistObserver}:
+                return None
+            if collating_hist:
+                # the second phase only updates histograms, ranges are fixed already
+                if isinstance(observer, TorchHistObserver) and observer._hist is not None:
+                    statistics[key] = observer._hist.clone()
+            elif observer._min_val_collector:
+                statistics[key] = (
+                    observer._min_val_collector[-1].min().item(),
+                    observer._max_val_collector[-1].max().item(),
+                )
+        return statistics
+
+    def calibrate(
+        self,
+        desc: str,
+        dataloader: Iterable,
+        executor: BaseGraphExecutor,
+        hooks: dict[str, RuntimeHook],
+        output_names: Optional[list[str]] = None,
+    ) -> None:
+        if self.tolerance is None:
+            super().calibrate(desc, dataloader, executor, hooks, output_names)
+            self.steps_used[desc] = self._calib_steps
+            return
+
+        def batches() -> Iterable:
+            for _ in range(ceil(self._calib_steps / len(dataloader))):  # type: ignore
+                yield from dataloader
+
+        monitor = ConvergenceMonitor(self.tolerance, self.patience)
+        previous: dict[str, Any] = {}
+        trackable = True
+        calib_step = 0
+        with tqdm(total=self._calib_steps, desc=desc) as progressing_bar:
+            for data in batches():
+                if self._collate_fn is not None:
+                    data = self._collate_fn(data)
+                executor.forward(inputs=data, hooks=hooks, output_names=output_names)
+                progressing_bar.update()
+                calib_step += 1
+                if calib_step >= self._calib_steps:
+                    break
+
+                statistics = self._statistics(hooks) if trackable else None
+                if statistics is None:
+                    if trackable:
+                        logger.warning(f"{desc}: statistics of an observer cannot be tracked, not stopping early")
+                    trackable = False
+                    continue
+                for key, value in statistics.items():
+                    if isinstance(value, tuple):
+                        # running range of the tensor
+                        if key in previous:
+                            value = (min(value[0], previous[key][0]), max(value[1], previous[key][1]))
+                            monitor.update(key, range_change(previous[key], value))
+                    elif key in previous:
+                        monitor.update(key, histogram_change(previous[key], value))
+                    previous[key] = value
+                if calib_step >= self.min_steps and monitor.converged:
+                    break
+
+        self.steps_used[desc] = calib_step
+        if calib_step < self._calib_steps:
+            logger.info(f"{desc}: statistics converged after {calib_step} of at most {self._calib_steps} steps")
+        else:
+            logger.info(f"{desc}: used all {calib_step} steps, {monitor.num_pending} tensors not converged")
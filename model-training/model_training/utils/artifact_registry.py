@@ -0,0 +1,392 @@
+import errno
+import hashlib
+import json
+import logging
+import os
+import shutil
+import sqlite3
+import time
+from contextlib import closing
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Optional, Sequence
+
+logger = logging.getLogger(__name__)
+
+# the model-deployment sub-repo reads and writes the same layout, cf. model_conversion.utils.artifact_registry
+REFERENCE_PREFIX = "sha256:"
+# increment on incompatible changes of the index, both sub-repos refuse to open registries of another version
+SCHEMA_VERSION = 1
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS artifacts (
+    digest TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    created REAL NOT NULL,
+    run_name TEXT,
+    dataset TEXT,
+    num_bits INTEGER,
+    config_digest TEXT,
+    metadata TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS artifacts_query ON artifacts (kind, dataset, num_bits);
+CREATE TABLE IF NOT EXISTS metrics (
+    digest TEXT NOT NULL REFERENCES artifacts (digest),
+    name TEXT NOT NULL,
+    value REAL NOT NULL,
+    PRIMARY KEY (digest, name)
+);
+CREATE INDEX IF NOT EXISTS metrics_ranking ON metrics (name, value);
+CREATE TABLE IF NOT EXISTS lineage (
+    child TEXT NOT NULL REFERENCES artifacts (digest),
+    parent TEXT NOT NULL,
+    PRIMARY KEY (child, parent)
+);
+CREATE INDEX IF NOT EXISTS lineage_parent ON lineage (parent);
+"""
+# Linux ioctl cloning a file (reflink) on copy-on-write file systems, e.g., Btrfs or XFS
+_FICLONE = 0x40049409
+
+
+def file_sha256(path: Path) -> str:
+    """
+    :param path: Path to file
+    :return: Hex sha256 digest of the file content
+    """
+    digest = hashlib.sha256()
+    with path.open("rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def config_sha256(config: dict[str, Any]) -> str:
+    """
+    :param config: JSON-serializable configuration, e.g., export or quantization arguments
+    :return: Hex sha256 digest of the canonical JSON of the configuration
+    """
+    return hashlib.sha256(json.dumps(config, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def link_file(source: Path, destination: Path, hardlink: bool = True) -> str:
+    """
+    Places a file at the destination without copying its content, if the file system allows it
+    :param source: Existing file
+    :param destination: Path of the new file, replaced if it exists
+    :param hardlink: Whether to fall back to a hardlink if the file system does not support reflinks
+    :return: How the file was placed, i.e., reflink, hardlink or copy
+    """
+    destination.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = destination.with_name(f".{destination.name}.{os.getpid()}.tmp")
+    try:
+        method = _reflink(source, tmp_path)
+        if method is None and hardlink:
+            try:
+                os.link(source, tmp_path)
+                method = "hardlink"
+            except OSError:
+                method = None
+        if method is None:
+            shutil.copyfile(source, tmp_path)
+            method = "copy"
+        os.replace(tmp_path, destination)
+    finally:
+        tmp_path.unlink(missing_ok=True)
+    return method
+
+
+def _reflink(source: Path, destination: Path) -> Optional[str]:
+    try:
+        import fcntl
+    except ImportError:
+        return None
+    with source.open("rb") as src, destination.open("wb") as dst:
+        try:
+            fcntl.ioctl(dst.fileno(), _FICLONE, src.fileno())
+            return "reflink"
+        except OSError as e:
+            if e.errno not in (errno.EOPNOTSUPP, errno.ENOTTY, errno.EXDEV, errno.EINVAL, errno.ENOSYS):
+                raise
+    destination.unlink()
+    return None
+
+
+@dataclass
+class Artifact:
+    digest: str
+    name: str
+    kind: str
+    size: int
+    created: float
+    path: Path
+    run_name: Optional[str] = None
+    dataset: Optional[str] = None
+    num_bits: Optional[int] = None
+    config_digest: Optional[str] = None
+    metadata: dict[str, Any] = field(default_factory=dict)
+    metrics: dict[str, float] = field(default_factory=dict)
+    parents: list[str] = field(default_factory=list)
+
+
+class ArtifactRegistry:
+    """
+    Local content-addressed store of model files with a SQLite metadata index.
+
+    Files are stored once per sha256 digest under blobs/sha256/, duplicates are not stored again. Stored blobs are
+    read-only and are reflinked into the store if the file system supports it, otherwise, e.g., on ext4, they are
+    copies of the registered files. The index records per artifact its
+    kind (file suffix), run, dataset, precision, the digest of the configuration that produced it, metrics and the
+    digests of the artifacts it was derived from, e.g., the ONNX model of a quantized model. Pipeline stages look up
+    derived artifacts by parent and configuration digest to reuse them instead of exporting again.
+    """
+
+    def __init__(self, root: Path) -> None:
+        """
+        :param root: Directory of the registry, created if it does not exist
+        """
+        self.root = Path(root)
+        self.blobs_dir = self.root / "blobs" / "sha256"
+        self.blobs_dir.mkdir(parents=True, exist_ok=True)
+        self.index_path = self.root / "index.sqlite"
+        with closing(self._connect()) as connection:
+            connection.executescript(_SCHEMA)
+            with connection:
+                connection.execute(
+                    "INSERT OR IGNORE INTO meta (key, value) VALUES ('schema_version', ?)", (str(SCHEMA_VERSION),)
+                )
+            row = connection.execute("SELECT value FROM meta WHERE key = 'schema_version'").fetchone()
+        if int(row["value"]) != SCHEMA_VERSION:
+            raise ValueError(
+                f"Artifact registry {self.root.as_posix()} has schema version {row['value']}, expected {SCHEMA_VERSION}"
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        # a connection per operation, so registries can be used from several threads and processes
+        connection = sqlite3.connect(self.index_path, timeout=30)
+        connection.row_factory = sqlite3.Row
+        return connection
+
+    def blob_path(self, digest: str) -> Path:
+        return self.blobs_dir / digest[:2] / digest
+
+    def add(
+        self,
+        path: Path,
+        kind: Optional[str] = None,
+        name: Optional[str] = None,
+        run_name: Optional[str] = None,
+        dataset: Optional[str] = None,
+        num_bits: Optional[int] = None,
+        config: Optional[dict[str, Any]] = None,
+        metadata: Optional[dict[str, Any]] = None,
+        metrics: Optional[dict[str, float]] = None,
+        parents: Sequence[str] = (),
+    ) -> Artifact:
+        """
+        Stores a file and indexes it. Adding content that is already registered merges the given metadata, metrics
+        and parents into the existing artifact.
+        :param path: File to register
+        :param kind: Artifact kind, defaults to the file suffix without dot, e.g., onnx or espdl
+        :param name: Artifact name, defaults to the file stem
+        :param run_name: Name of the run that produced the file
+        :param dataset: Name of the dataset the model was trained or calibrated on
+        :param num_bits: Precision of quantized models
+        :param config: Configuration that produced the file, e.g., export or quantization arguments
+        :param metadata: Further JSON-serializable information
+        :param metrics: Evaluation metrics
+        :param parents: Digests of the artifacts the file was derived from
+        :return: Registered artifact
+        """
+        path = Path(path)
+        digest = file_sha256(path)
+        blob_path = self.blob_path(digest)
+        if not blob_path.exists():
+            link_file(path, blob_path, hardlink=False)
+            blob_path.chmod(0o444)
+        else:
+            logger.debug(f"{path.as_posix()} is already stored as {digest}")
+
+        with closing(self._connect()) as connection, connection:
+            row = connection.execute("SELECT metadata FROM artifacts WHERE digest = ?", (digest,)).fetchone()
+            merged_metadata = {**(json.loads(row["metadata"]) if row else {}), **(metadata or {})}
+            connection.execute(
+                """
+                INSERT INTO artifacts (digest, name, kind, size, created, run_name, dataset, num_bits, config_digest,
+                    metadata)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (digest) DO UPDATE SET
+                    run_name = COALESCE(artifacts.run_name, excluded.run_name),
+                    dataset = COALESCE(artifacts.dataset, excluded.dataset),
+                    num_bits = COALESCE(artifacts.num_bits, excluded.num_bits),
+                    config_digest = COALESCE(artifacts.config_digest, excluded.config_digest),
+                    metadata = excluded.metadata
+                """,
+                (
+                    digest,
+                    name or path.stem,
+                    kind or path.suffix.lstrip("."),
+                    blob_path.stat().st_size,
+                    time.time(),
+                    run_name,
+                    dataset,
+                    num_bits,
+                    config_sha256(config) if config is not None else None,
+                    json.dumps(merged_metadata, sort_keys=True, default=str),
+                ),
+            )
+            connection.executemany(
+                "INSERT OR IGNORE INTO lineage (child, parent) VALUES (?, ?)",
+                [(digest, parent) for parent in parents],
+            )
+            self._set_metrics(connection, digest, metrics or {})
+        return self.get(digest)  # type: ignore
+
+    def set_metrics(self, digest: str, metrics: dict[str, float]) -> None:
+        """
+        Adds or overwrites metrics of an artifact
+        :param digest: Digest of the artifact
+        :param metrics: Evaluation metrics
+        """
+        with closing(self._connect()) as connection, connection:
+            self._set_metrics(connection, digest, metrics)
+
+    @staticmethod
+    def _set_metrics(connection: sqlite3.Connection, digest: str, metrics: dict[str, float]) -> None:
+        connection.executemany(
+            "INSERT OR REPLACE INTO metrics (digest, name, value) VALUES (?, ?, ?)",
+            [(digest, name, float(value)) for name, value in metrics.items()],
+        )
+
+    def get(self, digest: str) -> Optional[Artifact]:
+        """
+        :param digest: Full digest or a unique prefix of it
+        :return: Artifact, None if not registered
+        """
+        with closing(self._connect()) as connection:
+            rows = connection.execute(
+                "SELECT * FROM artifacts WHERE digest LIKE ? LIMIT 2", (digest.removeprefix(REFERENCE_PREFIX) + "%",)
+            ).fetchall()
+            if len(rows) > 1:
+                raise ValueError(f"Digest prefix {digest} is ambiguous")
+            return self._to_artifact(connection, rows[0]) if rows else None
+
+    def find(
+        self,
+        kind: Optional[str] = None,
+        dataset: Optional[str] = None,
+        num_bits: Optional[int] = None,
+        run_name: Optional[str] = None,
+        parent: Optional[str] = None,
+        config: Optional[dict[str, Any]] = None,
+        order_by: Optional[str] = None,
+        limit: Optional[int] = None,
+    ) -> list[Artifact]:
+        """
+        Queries artifacts by their index fields
+        :param kind: Artifact kind, e.g., espdl
+        :param dataset: Dataset name
+        :param num_bits: Precision of quantized models
+        :param run_name: Run name
+        :param parent: Digest of an artifact the results were derived from
+        :param config: Configuration the results were produced with
+        :param order_by: Metric to sort by in descending order. Artifacts without the metric are excluded.
+            Newest artifacts come first if not set.
+        :param limit: Maximum number of results
+        :return: Matching artifacts
+        """
+        conditions, params = [], []
+        for column, value in (("kind", kind), ("dataset", dataset), ("num_bits", num_bits), ("run_name", run_name)):
+            if value is not None:
+                conditions.append(f"a.{column} = ?")
+                params.append(value)
+        if config is not None:
+            conditions.append("a.config_digest = ?")
+            params.append(config_sha256(config))
+        if parent is not None:
+            conditions.append("a.digest IN (SELECT child FROM lineage WHERE parent = ?)")
+            params.append(parent)
+
+        query = "SELECT a.* FROM artifacts a"
+        if order_by is not None:
+            query += " JOIN metrics m ON m.digest = a.digest AND m.name = ?"
+            params.insert(0, order_by)
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        query += " ORDER BY m.value DESC, a.created DESC" if order_by is not None else " ORDER BY a.created DESC"
+        if limit is not None:
+            query += f" LIMIT {int(limit)}"
+
+        with closing(self._connect()) as connection:
+            return [self._to_artifact(connection, row) for row in connection.execute(query, params)]
+
+    def best(
+        self,
+        metric: str = "fitness",
+        kind: Optional[str] = "espdl",
+        dataset: Optional[str] = None,
+        num_bits: Optional[int] = None,
+    ) -> Optional[Artifact]:
+        """
+        :param metric: Metric to maximize
+        :param kind: Artifact kind
+        :param dataset: Dataset name
+        :param num_bits: Precision of quantized models
+        :return: Artifact with the highest metric, None if no artifact matches
+        """
+        results = self.find(kind=kind, dataset=dataset, num_bits=num_bits, order_by=metric, limit=1)
+        return results[0] if results else None
+
+    def resolve(self, reference: str | Path) -> Path:
+        """
+        Resolves a model reference of a run configuration
+        :param reference: File path, or sha256:<digest> with the full digest or a unique prefix of a registered model
+        :return: Path to the file, read-only for registered models
+        """
+        if not str(reference).startswith(REFERENCE_PREFIX):
+            return Path(reference)
+        artifact = self.get(str(reference))
+        if artifact is None:
+            raise FileNotFoundError(f"No artifact {reference} in registry {self.root.as_posix()}")
+        return artifact.path
+
+    def materialize(self, digest: str, destination: Path, hardlink: bool = False) -> Path:
+        """
+        Places a registered file at a destination, as reflink where possible and as copy otherwise, so the file can be
+        modified without touching the blob
+        :param digest: Digest of the artifact
+        :param destination: Path of the file
+        :param hardlink: Fall back to a hardlink instead of a copy. Only for read-only consumers, hardlinked files
+            share the read-only blob and writing to them corrupts the registry.
+        :return: Destination
+        """
+        artifact = self.get(digest)
+        if artifact is None:
+            raise FileNotFoundError(f"No artifact {digest} in registry {self.root.as_posix()}")
+        method = link_file(artifact.path, destination, hardlink=hardlink)
+        logger.info(f"Placed {artifact.kind} artifact {artifact.digest[:12]} at {destination.as_posix()} ({method})")
+        return destination
+
+    def _to_artifact(self, connection: sqlite3.Connection, row: sqlite3.Row) -> Artifact:
+        digest = row["digest"]
+        metrics = connection.execute("SELECT name, value FROM metrics WHERE digest = ?", (digest,)).fetchall()
+        parents = connection.execute("SELECT parent FROM lineage WHERE child = ?", (digest,)).fetchall()
+        return Artifact(
+            digest=digest,
+            name=row["name"],
+            kind=row["kind"],
+            size=row["size"],
+            created=row["created"],
+            path=self.blob_path(digest),
+            run_name=row["run_name"],
+            dataset=row["dataset"],
+            num_bits=row["num_bits"],
+            config_digest=row["config_digest"],
+            metadata=json.loads(row["metadata"]),
+            metrics={metric["name"]: metric["value"] for metric in metrics},
+            parents=[parent["parent"] for parent in parents],
+        )
@@ -0,0 +1,234 @@
+import hashlib
+import logging
+import tempfile
+from pathlib import Path
+from typing import Any, Callable, Iterable, Optional
+
+import numpy as np
+import torch
+from ppq.core import QuantizationProperty, QuantizationStates, empty_ppq_cache
+from ppq.executor import BaseGraphExecutor, RuntimeHook
+from ppq.IR import BaseGraph, QuantableOperation
+from ppq.quantization.observer import (
+    CalibrationHook,
+    OperationObserver,
+    TorchHistObserver,
+    TorchMinMaxObserver,
+)
+
+from model_training.core.constants import SHARD_INDEX_FILE
+from model_training.utils.adaptive_calibration import (
+    AdaptiveRuntimeCalibrationPass,
+    observer_keys,
+)
+
+logger = logging.getLogger(__name__)
+
+
+def file_digest(path: Path, digest: Optional[Any] = None) -> Any:
+    """
+    Feeds the content of a file into a hash object
+    :param path: Path to file
+    :param digest: Hash object to update. A new sha256 object is created if not set.
+    :return: Updated hash object
+    """
+    digest = digest or hashlib.sha256()
+    with path.open("rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest
+
+
+def calibration_set_digest(calib_data_path: Path) -> str:
+    """
+    Computes a digest of a calibration set. Shards are identified by their index and shard sizes, plain directories
+    by the names and contents of all contained files.
+    :param calib_data_path: Calibration dataset directory or shards directory
+    :return: Hex digest
+    """
+    digest = hashlib.sha256()
+    index_path = calib_data_path / SHARD_INDEX_FILE
+    if index_path.is_file():
+        file_digest(index_path, digest)
+        for shard_path in sorted(calib_data_path.glob("*.tar")):
+            digest.update(f"{shard_path.name}:{shard_path.stat().st_size}".encode())
+        return digest.hexdigest()
+
+    for path in sorted(p for p in calib_data_path.rglob("*") if p.is_file()):
+        digest.update(path.relative_to(calib_data_path).as_posix().encode())
+        file_digest(path, digest)
+    return digest.hexdigest()
+
+
+class CachedRuntimeCalibrationPass(AdaptiveRuntimeCalibrationPass):
+    """
+    Runtime calibration pass that stores the collected activation statistics (min/max and histograms) on disk.
+
+    Statistics are stored per observed quantization config and rendered by the PPQ observers of the current run.
+    Hence, a later quantization with the same ONNX graph and calibration set, but different bit-widths or dispatching,
+    reuses the statistics instead of executing the calibration images again. Weights are already quantized while
+    activations are observed, so reused statistics may deviate slightly from a full re-calibration where the
+    bit-width of a layer changed. int16 runs collect finer histograms, which are reduced for int8 runs but not the
+    other way round.
+    """
+
+    def __init__(
+        self,
+        cache_path: Path,
+        method: str = "kl",
+        calib_steps: int = 32,
+        tolerance: Optional[float] = None,
+        min_steps: int = 8,
+    ) -> None:
+        """
+        :param cache_path: Path to .npz statistics file
+        :param method: Calibration method. Only minmax and kl statistics can be cached.
+        :param calib_steps: Maximum number of calibration steps
+        :param tolerance: Convergence tolerance for early stopping (cf. AdaptiveRuntimeCalibrationPass)
+        :param min_steps: Minimum number of calibration steps with early stopping
+        """
+        super().__init__(method=method, calib_steps=calib_steps, tolerance=tolerance, min_steps=min_steps)
+        self.cache_path = cache_path
+        self._seen_hooks: dict[str, CalibrationHook] = {}
+
+    def calibrate(
+        self,
+        desc: str,
+        dataloader: Iterable,
+        executor: BaseGraphExecutor,
+        hooks: dict[str, RuntimeHook],
+        output_names: Optional[list[str]] = None,
+    ) -> None:
+        # phase 1 sees the hooks of all observers, phase 2 only those of two-phase observers
+        self._seen_hooks.update(hooks)  # type: ignore
+        super().calibrate(desc, dataloader, executor, hooks, output_names)
+
+    @empty_ppq_cache
+    def optimize(
+        self,
+        graph: BaseGraph,
+        dataloader: Iterable,
+        executor: BaseGraphExecutor,
+        calib_steps: int = 32,
+        collate_fn: Optional[Callable] = None,
+        **kwargs: Any,
+    ) -> None:
+        if self.cache_path.is_file() and self._render_from_cache(graph, executor):
+            logger.info(f"Calibration statistics loaded from {self.cache_path.as_posix()}")
+            return
+
+        self._seen_hooks = {}
+        super().optimize(graph, dataloader, executor, calib_steps=calib_steps, collate_fn=collate_fn, **kwargs)
+        self._save_statistics()
+
+    def _render_from_cache(self, graph: BaseGraph, executor: BaseGraphExecutor) -> bool:
+        """
+        Renders all INITIAL activation configs from cached statistics.
+        :return: Whether all configs could be rendered. Nothing is rendered otherwise.
+        """
+        with np.load(self.cache_path) as cache:
+            statistics = {name: cache[name] for name in cache.files}
+
+        observers = {}
+        for op_name, operation in graph.operations.items():
+            if not isinstance(operation, QuantableOperation):
+                continue
+            for config, var in operation.config_with_variable:
+                if not var.is_parameter:
+                    config.observer_algorithm = self._method
+            observer = OperationObserver(operation=executor._graph.operations[op_name], monitor_parameter=False)
+            observers.update(observer_keys(observer.hook))
+
+        for key, observer in observers.items():
+            if type(observer) not in {TorchMinMaxObserver, TorchHistObserver} or f"{key}/min" not in statistics:
+                logger.info(f"No cached calibration statistics for {key}, running calibration")
+                return False
+            if isinstance(observer, TorchHistObserver) and (
+                f"{key}/hist" not in statistics or len(statistics[f"{key}/hist"]) % observer._hist_bins != 0
+            ):
+                logger.info(f"No cached histogram with {observer._hist_bins} bins for {key}, running calibration")
+                return False
+
+        for key, observer in observers.items():
+            observer._min_val_collector = [torch.from_numpy(statistics[f"{key}/min"])]
+            observer._max_val_collector = [torch.from_numpy(statistics[f"{key}/max"])]
+            # the first render solves the histogram range, the second one renders the histogram (cf. TorchHistObserver)
+            observer.render_quantization_config()
+            if isinstance(observer, TorchHistObserver):
+                # finer histograms of int16 runs are reduced to the number of bins of the observer
+                hist = torch.from_numpy(statistics[f"{key}/hist"])
+                observer._hist = hist.reshape(observer._hist_bins, -1).sum(dim=1, dtype=torch.int32)
+                observer.render_quantization_config()
+            if observer._quant_cfg.state != QuantizationStates.ACTIVATED:
+                raise RuntimeError(f"Quantization config of {key} could not be rendered from cached statistics")
+        return True
+
+    def _save_statistics(self) -> None:
+        statistics: dict[str, np.ndarray] = {}
+        for hook in self._seen_hooks.values():
+            for key, observer in observer_keys(hook).items():  # type: ignore
+                if not isinstance(observer, TorchMinMaxObserver) or not observer._min_val_collector:
+                    continue
+                if observer._quant_cfg.policy.has_property(QuantizationProperty.PER_TENSOR):
+                    min_val = torch.cat(observer._min_val_collector, dim=0).min(dim=0, keepdim=True)[0]
+                    max_val = torch.cat(observer._max_val_collector, dim=0).max(dim=0, keepdim=True)[0]
+                else:
+                    min_val = torch.cat(observer._min_val_collector, dim=-1).min(dim=-1, keepdim=True)[0]
+                    max_val = torch.cat(observer._max_val_collector, dim=-1).max(dim=-1, keepdim=True)[0]
+                statistics[f"{key}/min"] = min_val.cpu().numpy()
+                statistics[f"{key}/max"] = max_val.cpu().numpy()
+                if isinstance(observer, TorchHistObserver) and observer._hist is not None:
+                    statistics[f"{key}/hist"] = observer._hist.cpu().numpy()
+        self._seen_hooks = {}
+
+        if self.cache_path.is_file():
+            # keep cached statistics of other configs and finer histograms, which serve more bit-widths
+            with np.load(self.cache_path) as cache:
+                cached = {name: cache[name] for name in cache.files}
+            for key in {name.rsplit("/", 1)[0] for name in cached}:
+                new_hist, cached_hist = statistics.get(f"{key}/hist", ()), cached.get(f"{key}/hist", ())
+                if f"{key}/min" not in statistics or len(cached_hist) > len(new_hist):
+                    statistics.pop(f"{key}/hist", None)
+                    statistics.update({name: cached[name] for name in cached if name.rsplit("/", 1)[0] == key})
+
+        self.cache_path.parent.mkdir(parents=True, exist_ok=True)
+        # write to a temporary file of this writer first such that concurrent runs never read a partial cache
+        with tempfile.NamedTemporaryFile(
+            dir=self.cache_path.parent, prefix=f".{self.cache_path.stem}.", suffix=".tmp.npz", delete=False
+        ) as tmp_file:
+            tmp_path = Path(tmp_file.name)
+            try:
+                np.savez(tmp_file, allow_pickle=False, **statistics)
+            except BaseException:
+                tmp_path.unlink(missing_ok=True)
+                raise
+        tmp_path.replace(self.cache_path)
+        logger.info(f"Calibration statistics of {len(statistics)} arrays cached at {self.cache_path.as_posix()}")
+
+
+def calibration_cache_path(
+    cache_dir: Path,
+    onnx_path: Path,
+    calib_data_path: Path,
+    method: str,
+    calib_steps: int,
+    tolerance: Optional[float] = None,
+    batch_size: int = 1,
+) -> Path:
+    """
+    Path of the statistics file for an ONNX graph and calibration set
+    :param cache_dir: Cache directory
+    :param onnx_path: Path to ONNX model file
+    :param calib_data_path: Calibration dataset directory or shards directory
+    :param method: Calibration method
+    :param calib_steps: Maximum number of calibration steps
+    :param tolerance: Convergence tolerance of early-stopping calibration
+    :param batch_size: Number of images per calibration step
+    :return: Path to .npz statistics file
+    """
+    onnx_digest = file_digest(onnx_path).hexdigest()[:16]
+    calib_digest = calibration_set_digest(calib_data_path)[:16]
+    steps = f"{calib_steps}" if tolerance is None else f"{calib_steps}-tol{tolerance:g}"
+    if batch_size > 1:
+        steps = f"{steps}-b{batch_size}"
+    return cache_dir / f"{onnx_digest}-{calib_digest}-{method}-{steps}.npz"
@@ -1,3 +1,4 @@
+import logging
 from pathlib import Path
 
 import numpy as np
@@ -6,6 +7,11 @@ from PIL import Image
 from torch.utils.data import Dataset
 from torchvision import transforms
 
+from model_training.core.constants import TXT_ENCODING
+from model_training.utils.shards import parse_yolo_label
+
+logger = logging.getLogger(__name__)
+
 
 class CalibrationDataset(Dataset):
     def __init__(self, path: Path, img_size: int | tuple[int, int] = 640):
@@ -65,8 +71,105 @@ class ValidationDataset(TrainDataset):
     def __init__(self, path: Path, split: str | int, img_size: int | tuple[int, int] = 640):
         super().__init__(path, split, img_size)
 
-        labels_dir = path / "labels"
-        if not (labels_dir.exists() and labels_dir.is_dir()):
-            raise NotADirectoryError(f"{labels_dir} does not exist or is not a directory")
+        self.labels_dir = path / "labels"
+        if not (self.labels_dir.exists() and self.labels_dir.is_dir()):
+            raise NotADirectoryError(f"{self.labels_dir} does not exist or is not a directory")
+
+    def __getitem__(self, idx: int) -> tuple[torch.Tensor, torch.Tensor]:  # type: ignore
+        """
+        :return: Image tensor and labels of shape [N, 5] with rows (class, x_center, y_center, width, height),
+            normalized. Images without label file have no labels.
+        """
+        img = super().__getitem__(idx)
+        label_path = self.labels_dir / f"{Path(self.img_paths[idx]).stem}.txt"
+        label_text = label_path.read_text(encoding=TXT_ENCODING) if label_path.is_file() else ""
+        return img, parse_yolo_label(label_text)
+
+
+class SharedImageCache(Dataset):
+    """
+    Wraps an image dataset and keeps its decoded and resized images in a bounded uint8 pool in shared memory.
+
+    The pool is allocated in the main process before DataLoader workers are started, hence all workers fill and read
+    the same memory. The first epoch decodes each image once, later epochs are served from the pool.
+    Slots are direct-mapped (``idx % capacity``). If the dataset does not fit into the memory budget,
+    an image evicts the image previously stored in its slot.
+    """
+
+    def __init__(self, dataset: Dataset, memory_budget_mb: int) -> None:
+        """
+        Init shared image cache
+        :param dataset: Dataset returning float image tensors of shape [C, H, W] with values in [0, 1]
+        :param memory_budget_mb: Upper bound for the size of the image pool in MB
+        """
+        super().__init__()
+        if memory_budget_mb <= 0:
+            raise ValueError(f"Memory budget must be positive, received {memory_budget_mb} MB")
+
+        self.dataset = dataset
+        num_images = len(dataset)  # type: ignore
+        if num_images == 0:
+            raise ValueError("Cannot cache an empty dataset")
+
+        # decode first image to learn the image shape, it is stored in the pool right away
+        first_img = self.dataset[0]
+        self.img_shape = tuple(first_img.shape)
+        img_bytes = int(np.prod(self.img_shape))
+
+        self.capacity = min(num_images, (memory_budget_mb * 1024**2) // img_bytes)
+        if self.capacity == 0:
+            raise ValueError(f"Memory budget of {memory_budget_mb} MB is too small for images of {self.img_shape}")
+
+        self._pool = torch.empty((self.capacity, *self.img_shape), dtype=torch.uint8).share_memory_()
+        # dataset index stored in each slot, -1 marks an empty slot or a slot that is being written
+        self._slot_owner = torch.full((self.capacity,), -1, dtype=torch.int64).share_memory_()
+        self._store(0, first_img)
+
+        logger.info(
+            f"Image cache holds {self.capacity}/{num_images} images "
+            f"({self.capacity * img_bytes / 1024**2:.1f} MB of {memory_budget_mb} MB budget)"
+        )
+
+    def __len__(self) -> int:
+        return len(self.dataset)  # type: ignore
+
+    def __getitem__(self, idx: int) -> torch.Tensor:
+        slot = idx % self.capacity
+        if self._slot_owner[slot].item() == idx:
+            img = self._pool[slot].float().div_(255)
+            # the slot might have been evicted by another worker while reading, re-check its owner
+            if self._slot_owner[slot].item() == idx:
+                return img
+
+        img = self.dataset[idx]
+        self._store(idx, img)
+        return img
+
+    @property
+    def cached_images(self) -> int:
+        """Number of images currently held in the pool."""
+        return int((self._slot_owner >= 0).sum().item())
+
+    def _store(self, idx: int, img: torch.Tensor) -> None:
+        """
+        Writes an image into its slot. The slot is marked as empty while writing, so concurrent readers fall back to
+        decoding instead of reading a partially written image.
+        """
+        slot = idx % self.capacity
+        self._slot_owner[slot] = -1
+        self._pool[slot].copy_(img.mul(255).round_().clamp_(0, 255).to(torch.uint8))
+        self._slot_owner[slot] = idx
+
+
+class IndexedDataset(Dataset):
+    """Wraps a map-style dataset and returns (index, sample) pairs, e.g., to look up per-sample data by index"""
+
+    def __init__(self, dataset: Dataset) -> None:
+        super().__init__()
+        self.dataset = dataset
+
+    def __len__(self) -> int:
+        return len(self.dataset)  # type: ignore
 
-        # TODO: load labels from directory
+    def __getitem__(self, idx: int) -> tuple[int, torch.Tensor]:
+        return idx, self.dataset[idx]
@@ -0,0 +1,143 @@
+import logging
+import os
+import socket
+from contextlib import contextmanager
+from typing import Any, Callable, Iterator, Sequence
+
+import torch
+import torch.distributed as dist
+import torch.multiprocessing as mp
+from ppq.IR import BaseGraph, QuantableOperation
+
+logger = logging.getLogger(__name__)
+
+
+def is_distributed() -> bool:
+    return dist.is_available() and dist.is_initialized()
+
+
+def get_rank() -> int:
+    return dist.get_rank() if is_distributed() else 0
+
+
+def get_world_size() -> int:
+    return dist.get_world_size() if is_distributed() else 1
+
+
+def is_main_process() -> bool:
+    """Whether this process exports, validates and logs, i.e., rank 0 or a non-distributed run"""
+    return get_rank() == 0
+
+
+@contextmanager
+def main_process_first() -> Iterator[None]:
+    """
+    Runs the enclosed block on rank 0 before the other ranks, e.g., to let rank 0 fill a file cache which the other
+    ranks read afterwards
+    """
+    if not is_main_process():
+        dist.barrier()
+    try:
+        yield
+    finally:
+        if is_main_process() and is_distributed():
+            dist.barrier()
+
+
+def barrier() -> None:
+    """Waits until all ranks reach this point"""
+    if is_distributed():
+        dist.barrier()
+
+
+def all_reduce_gradients(parameters: Sequence[torch.Tensor]) -> None:
+    """
+    Averages the gradients of the parameters over all ranks, using a single flattened buffer
+    :param parameters: Trainable parameters. Missing gradients count as zero.
+    """
+    if not is_distributed():
+        return
+    grads = [p.grad if p.grad is not None else torch.zeros_like(p) for p in parameters]
+    buffer = torch.cat([grad.flatten() for grad in grads])
+    dist.all_reduce(buffer, op=dist.ReduceOp.SUM)
+    buffer /= get_world_size()
+    offset = 0
+    for parameter, grad in zip(parameters, grads):
+        numel = grad.numel()
+        parameter.grad = buffer[offset : offset + numel].view_as(grad).clone()
+        offset += numel
+
+
+def all_reduce_mean(value: float) -> float:
+    """Averages a scalar, e.g., the epoch loss, over all ranks"""
+    if not is_distributed():
+        return value
+    tensor = torch.tensor([value], dtype=torch.float64)
+    dist.all_reduce(tensor, op=dist.ReduceOp.SUM)
+    return tensor.item() / get_world_size()
+
+
+def broadcast_object(obj: Any) -> Any:
+    """Sends a picklable object from rank 0 to all ranks"""
+    if not is_distributed():
+        return obj
+    objects = [obj]
+    dist.broadcast_object_list(objects, src=0)
+    return objects[0]
+
+
+def broadcast_graph_state(graph: BaseGraph) -> None:
+    """
+    Copies the parameters and the quantization scales and offsets of a PPQ graph from rank 0 to all ranks, so every
+    replica starts training from the same calibrated model
+    :param graph: Calibrated PPQ graph of this rank
+    """
+    if not is_distributed():
+        return
+    # iterate by name, all ranks have to issue the broadcasts in the same order
+    with torch.no_grad():
+        for name in sorted(graph.variables):
+            value = graph.variables[name].value
+            if graph.variables[name].is_parameter and isinstance(value, torch.Tensor) and value.is_floating_point():
+                dist.broadcast(value, src=0)
+        for name in sorted(graph.operations):
+            operation = graph.operations[name]
+            if not isinstance(operation, QuantableOperation):
+                continue
+            for config, _ in operation.config_with_variable:
+                for value in (config.scale, config.offset):
+                    if isinstance(value, torch.Tensor):
+                        dist.broadcast(value, src=0)
+
+
+def _free_port() -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _run_worker(rank: int, world_size: int, port: int, fn: Callable[..., Any], args: tuple) -> None:
+    os.environ["MASTER_ADDR"] = "127.0.0.1"
+    os.environ["MASTER_PORT"] = str(port)
+    # share the cores between the ranks instead of oversubscribing them
+    torch.set_num_threads(max(1, (os.cpu_count() or 1) // world_size))
+    dist.init_process_group(backend="gloo", rank=rank, world_size=world_size)
+    try:
+        fn(*args)
+    finally:
+        dist.destroy_process_group()
+
+
+def launch(fn: Callable[..., Any], nproc: int, *args: Any) -> None:
+    """
+    Runs a function data-parallel in nproc local processes connected by the gloo backend. The function is called
+    directly without distributed setup if nproc is 1.
+    :param fn: Picklable module-level function
+    :param nproc: Number of processes
+    :param args: Arguments of fn
+    """
+    if nproc <= 1:
+        fn(*args)
+        return
+    logger.info(f"Launching {nproc} data-parallel processes")
+    mp.spawn(_run_worker, args=(nproc, _free_port(), fn, args), nprocs=nproc, join=True)
@@ -0,0 +1,151 @@
+import logging
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from threading import Lock
+from typing import Literal, Optional
+
+import ppq.lib as PFL
+import torch
+from ppq.core import TargetPlatform
+from ppq.IR import BaseGraph
+from ppq.parser import NativeExporter
+
+logger = logging.getLogger(__name__)
+
+# the ESP-DL exporter keeps layout information in process-wide singletons, hence exports must not run concurrently
+_export_lock = Lock()
+
+
+def export_models(graph: BaseGraph, num_bits: Literal[8, 16], espdl_path: Path, native_path: Path) -> None:
+    """
+    Exports a quantized PPQ graph as .espdl and .native model
+    :param graph: Quantized PPQ graph
+    :param num_bits: Precision of quantized model
+    :param espdl_path: Path to espdl model file, including file name.
+    :param native_path: Path to native model file, including file name.
+    """
+    match num_bits:
+        case 8:
+            espdl_exporter = PFL.Exporter(platform=TargetPlatform.ESPDL_INT8)
+        case 16:
+            espdl_exporter = PFL.Exporter(platform=TargetPlatform.ESPDL_INT16)
+        case _:
+            raise IOError(f"Invalid number of bits: {num_bits}. Only 8 or 16 are supported for quantization.")
+    espdl_path.parent.mkdir(parents=True, exist_ok=True)
+    native_path.parent.mkdir(parents=True, exist_ok=True)
+    with _export_lock:
+        espdl_exporter.export(espdl_path.as_posix(), graph)
+        NativeExporter().export(native_path.as_posix(), graph)
+
+
+def snapshot_graph(graph: BaseGraph) -> BaseGraph:
+    """Copies a PPQ graph including its parameters and quantization configs, detached from autograd"""
+    with torch.no_grad():
+        return graph.copy(copy_value=True)
+
+
+@dataclass
+class EpochExport:
+    epoch: int
+    espdl_path: Path
+    native_path: Path
+
+    @property
+    def files(self) -> list[Path]:
+        # the ESP-DL exporter writes .info and .json files next to the .espdl model
+        return [*self.espdl_path.parent.glob(f"{self.espdl_path.stem}.*"), self.native_path]
+
+
+class AsyncModelExporter:
+    """
+    Exports the models of training epochs in a background thread, while the next epoch trains.
+
+    The graph is snapshotted when an export is submitted, so later parameter updates do not leak into the export.
+    Exports run one after another in submission order. After each export, a retention policy deletes the models of
+    older epochs: the models of the last keep_last epochs and of the keep_best epochs with the highest metric are kept.
+    Models awaiting their metric, e.g., from a pending validation, are kept until the metric is set.
+    """
+
+    def __init__(self, num_bits: Literal[8, 16], keep_last: Optional[int] = None, keep_best: int = 1) -> None:
+        """
+        :param num_bits: Precision of quantized model
+        :param keep_last: Number of most recent epochs whose models are kept. All models are kept if not set.
+        :param keep_best: Number of epochs with the highest metric whose models are kept in addition
+        """
+        self.num_bits = num_bits
+        self.keep_last = keep_last
+        self.keep_best = keep_best
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="model-export")
+        self._exports: dict[int, EpochExport] = {}
+        self._metrics: dict[int, float] = {}
+        self._awaiting_metric: set[int] = set()
+        self._futures: list[Future] = []
+        self._lock = Lock()
+
+    def submit(
+        self, graph: BaseGraph, epoch: int, espdl_path: Path, native_path: Path, await_metric: bool = False
+    ) -> Future:
+        """
+        Snapshots the graph and exports it in the background
+        :param graph: Quantized PPQ graph of the epoch
+        :param epoch: Epoch number
+        :param espdl_path: Path to espdl model file, including file name.
+        :param native_path: Path to native model file, including file name.
+        :param await_metric: Keep the models at least until the metric of the epoch is set
+        :return: Future resolving to the epoch's export once written
+        """
+        if await_metric:
+            with self._lock:
+                self._awaiting_metric.add(epoch)
+        snapshot = snapshot_graph(graph)
+        epoch_export = EpochExport(epoch=epoch, espdl_path=espdl_path, native_path=native_path)
+
+        def export() -> EpochExport:
+            export_models(snapshot, self.num_bits, espdl_path, native_path)
+            with self._lock:
+                self._exports[epoch] = epoch_export
+            self._apply_retention()
+            logger.info(f"Exported models of epoch {epoch} to {espdl_path.parent.parent.as_posix()}")
+            return epoch_export
+
+        future = self._executor.submit(export)
+        self._futures.append(future)
+        return future
+
+    def set_metric(self, epoch: int, metric: float) -> None:
+        """
+        Sets the validation metric of an epoch, which ranks the epoch for the keep_best retention
+        :param epoch: Epoch number
+        :param metric: Validation metric, higher is better
+        """
+        with self._lock:
+            self._metrics[epoch] = metric
+            self._awaiting_metric.discard(epoch)
+        # runs after all pending exports
+        self._executor.submit(self._apply_retention)
+
+    def _apply_retention(self) -> None:
+        if self.keep_last is None:
+            return
+        with self._lock:
+            epochs = sorted(self._exports)
+            keep = set(epochs[-self.keep_last :] if self.keep_last > 0 else []) | self._awaiting_metric
+            ranked = sorted((e for e in epochs if e in self._metrics), key=self._metrics.__getitem__, reverse=True)
+            keep.update(ranked[: self.keep_best])
+            removed = [self._exports.pop(epoch) for epoch in epochs if epoch not in keep]
+
+        for epoch_export in removed:
+            for path in epoch_export.files:
+                path.unlink(missing_ok=True)
+            logger.info(f"Removed models of epoch {epoch_export.epoch} by retention policy")
+
+    def wait(self) -> None:
+        """Blocks until all submitted exports are written, raising the first export error"""
+        futures, self._futures = self._futures, []
+        for future in futures:
+            future.result()
+
+    def close(self) -> None:
+        self.wait()
+        self._executor.shutdown(wait=True)
@@ -0,0 +1,191 @@
+import logging
+from typing import Callable, Sequence
+
+import numpy as np
+import torch
+import torchvision
+from torch.utils.data import Dataset
+from tqdm import tqdm
+from ultralytics.utils.metrics import ap_per_class
+
+logger = logging.getLogger(__name__)
+
+# defaults of Ultralytics' validation
+VAL_CONF_THRESHOLD = 0.001
+VAL_IOU_THRESHOLD = 0.7
+VAL_MAX_DETECTIONS = 300
+
+# IoU thresholds of mAP50-95
+IOU_THRESHOLDS = np.linspace(0.5, 0.95, 10)
+
+
+def decode_esp_dl_outputs(
+    outputs: Sequence[torch.Tensor],
+    conf_threshold: float = VAL_CONF_THRESHOLD,
+    iou_threshold: float = VAL_IOU_THRESHOLD,
+    max_detections: int = VAL_MAX_DETECTIONS,
+    strides: Sequence[int] = (8, 16, 32),
+    reg_max: int = 16,
+) -> list[torch.Tensor]:
+    """
+    Decodes the raw outputs of the ESP-DL YOLO head for a batch, like the ESP-DL postprocessing of the model-deployment
+    sub-repo: distribution focal loss boxes, sigmoid class scores and class-agnostic NMS.
+    :param outputs: Box and score outputs per stride (box0, score0, box1, score1, ...) of shape [N, C, H, W]
+    :param conf_threshold: Minimum class score of a detection
+    :param iou_threshold: IoU threshold of NMS
+    :param max_detections: Maximum number of detections per image
+    :param strides: Strides of the detection levels
+    :param reg_max: Number of bins of the box distributions
+    :return: Detections per image of shape [K, 6] with rows (x1, y1, x2, y2, score, class)
+    """
+    bins = torch.arange(reg_max, device=outputs[0].device, dtype=torch.float32)
+    all_boxes, all_scores = [], []
+    for stride, box_pred, cls_pred in zip(strides, outputs[0::2], outputs[1::2]):
+        batch_size, num_classes, height, width = cls_pred.shape
+        grid_y, grid_x = torch.meshgrid(torch.arange(height), torch.arange(width), indexing="ij")
+        centers = (torch.stack((grid_x.flatten(), grid_y.flatten()), dim=1).to(box_pred.device) + 0.5) * stride
+
+        box_pred = box_pred.permute(0, 2, 3, 1).reshape(batch_size, -1, 4, reg_max)
+        distances = torch.softmax(box_pred.float(), dim=-1).matmul(bins) * stride
+        all_boxes.append(torch.cat([centers - distances[..., :2], centers + distances[..., 2:]], dim=-1))
+        all_scores.append(torch.sigmoid(cls_pred.float()).permute(0, 2, 3, 1).reshape(batch_size, -1, num_classes))
+
+    boxes, scores = torch.cat(all_boxes, dim=1), torch.cat(all_scores, dim=1)
+    detections = []
+    for image_boxes, image_scores in zip(boxes, scores):
+        score, class_id = image_scores.max(dim=1)
+        mask = score > conf_threshold
+        image_boxes, score, class_id = image_boxes[mask], score[mask], class_id[mask]
+        keep = torchvision.ops.nms(image_boxes, score, iou_threshold)[:max_detections]
+        detections.append(torch.cat([image_boxes[keep], score[keep, None], class_id[keep, None].float()], dim=1))
+    return detections
+
+
+def match_predictions(detections: torch.Tensor, target_boxes: torch.Tensor, target_classes: torch.Tensor) -> np.ndarray:
+    """
+    Matches detections to targets of the same class greedily by IoU, for each IoU threshold (cf. Ultralytics'
+    DetectionValidator.match_predictions)
+    :param detections: Detections of shape [K, 6] with rows (x1, y1, x2, y2, score, class)
+    :param target_boxes: Target boxes of shape [M, 4] in xyxy format
+    :param target_classes: Target classes of shape [M]
+    :return: True positive matrix of shape [K, 10]
+    """
+    correct = np.zeros((len(detections), len(IOU_THRESHOLDS)), dtype=bool)
+    if len(detections) == 0 or len(target_boxes) == 0:
+        return correct
+    iou = torchvision.ops.box_iou(target_boxes, detections[:, :4])
+    iou = (iou * (target_classes[:, None] == detections[:, 5])).cpu().numpy()
+    for i, threshold in enumerate(IOU_THRESHOLDS):
+        matches = np.argwhere(iou >= threshold)
+        if len(matches) > 1:
+            matches = matches[iou[matches[:, 0], matches[:, 1]].argsort()[::-1]]
+            matches = matches[np.unique(matches[:, 1], return_index=True)[1]]
+            matches = matches[np.unique(matches[:, 0], return_index=True)[1]]
+        correct[matches[:, 1], i] = True
+    return correct
+
+
+class DetectionMetricAccumulator:
+    """Collects matched detections of a validation run and computes precision, recall and mAP"""
+
+    def __init__(self) -> None:
+        self._stats: list[tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]] = []
+
+    def update(self, detections: torch.Tensor, target_boxes: torch.Tensor, target_classes: torch.Tensor) -> None:
+        """
+        Adds the detections and targets of an image
+        :param detections: Detections of shape [K, 6] with rows (x1, y1, x2, y2, score, class)
+        :param target_boxes: Target boxes of shape [M, 4] in xyxy format, in the same pixel space as the detections
+        :param target_classes: Target classes of shape [M]
+        """
+        self._stats.append(
+            (
+                match_predictions(detections, target_boxes, target_classes),
+                detections[:, 4].cpu().numpy(),
+                detections[:, 5].cpu().numpy(),
+                target_classes.cpu().numpy(),
+            )
+        )
+
+    def compute(self) -> dict[str, float]:
+        """
+        :return: Ultralytics-style metrics: precision, recall, mAP50, mAP50-95 and fitness
+        """
+        tp, conf, pred_cls, target_cls = (np.concatenate(values) for values in zip(*self._stats))
+        if len(target_cls) == 0 or len(tp) == 0:
+            precision = recall = map50 = map50_95 = 0.0
+        else:
+            _, _, p, r, _, ap, *_ = ap_per_class(tp, conf, pred_cls, target_cls)
+            precision, recall = float(p.mean()), float(r.mean())
+            map50, map50_95 = float(ap[:, 0].mean()), float(ap.mean())
+        return {
+            "metrics/precision(B)": precision,
+            "metrics/recall(B)": recall,
+            "metrics/mAP50(B)": map50,
+            "metrics/mAP50-95(B)": map50_95,
+            "fitness": 0.1 * map50 + 0.9 * map50_95,
+        }
+
+
+class FastDetectionValidator:
+    """
+    Validates a quantized model in-process on a validation set held in memory.
+
+    The validation images are decoded and resized once and kept as uint8 tensor together with their labels. Each
+    validation run executes the model on batches of this tensor, decodes the raw outputs with the ESP-DL
+    postprocessing and accumulates the detection metrics, without exporting or reloading the model.
+    """
+
+    def __init__(
+        self,
+        dataset: Dataset,
+        batch_size: int = 8,
+        conf_threshold: float = VAL_CONF_THRESHOLD,
+        iou_threshold: float = VAL_IOU_THRESHOLD,
+        max_detections: int = VAL_MAX_DETECTIONS,
+    ) -> None:
+        """
+        :param dataset: Dataset returning image tensors [C, H, W] with values in [0, 1] and labels [N, 5] with
+            normalized rows (class, x_center, y_center, width, height), e.g., ValidationDataset
+        :param batch_size: Number of images per model execution
+        :param conf_threshold: Minimum class score of a detection
+        :param iou_threshold: IoU threshold of NMS
+        :param max_detections: Maximum number of detections per image
+        """
+        if len(dataset) == 0:  # type: ignore
+            raise ValueError("Validation dataset is empty")
+        self.batch_size = batch_size
+        self.conf_threshold = conf_threshold
+        self.iou_threshold = iou_threshold
+        self.max_detections = max_detections
+
+        images, self.target_boxes, self.target_classes = [], [], []
+        for idx in tqdm(range(len(dataset)), desc="Caching validation set"):  # type: ignore
+            img, labels = dataset[idx]
+            height, width = img.shape[1:]
+            images.append(img.mul(255).round_().to(torch.uint8))
+            xc, yc = labels[:, 1] * width, labels[:, 2] * height
+            w, h = labels[:, 3] * width, labels[:, 4] * height
+            self.target_boxes.append(torch.stack([xc - w / 2, yc - h / 2, xc + w / 2, yc + h / 2], dim=1))
+            self.target_classes.append(labels[:, 0])
+        self.images = torch.stack(images)
+        logger.info(f"Cached {len(self.images)} validation images ({self.images.nbytes / 1024**2:.1f} MB)")
+
+    def __call__(self, executor: Callable[[torch.Tensor], Sequence[torch.Tensor]], device: str = "cpu") -> dict:
+        """
+        Runs the validation
+        :param executor: Callable mapping an input batch to the raw model outputs, e.g., PPQ's TorchExecutor
+        :param device: Device of the model inputs
+        :return: Validation metrics
+        """
+        accumulator = DetectionMetricAccumulator()
+        with torch.no_grad():
+            for start in range(0, len(self.images), self.batch_size):
+                batch = self.images[start : start + self.batch_size].to(device).float().div_(255)
+                detections = decode_esp_dl_outputs(
+                    executor(batch), self.conf_threshold, self.iou_threshold, self.max_detections
+                )
+                for offset, image_detections in enumerate(detections):
+                    idx = start + offset
+                    accumulator.update(image_detections.cpu(), self.target_boxes[idx], self.target_classes[idx])
+        return accumulator.compute()
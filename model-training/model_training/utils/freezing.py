@@ -0,0 +1,110 @@
+import logging
+import math
+import re
+from typing import Sequence
+
+import torch
+from ppq.IR import BaseGraph
+
+from model_training.core.schemas import FreezeStage
+
+logger = logging.getLogger(__name__)
+
+# operations of the Ultralytics model blocks, e.g., /model.2/cv2/conv/Conv
+BLOCK_PATTERN = re.compile(r"^/?model\.(\d+)[/.]")
+
+
+class LayerFreezer:
+    """
+    Freezes trainable parameters of a QAT graph according to a schedule of freeze stages.
+
+    Frozen parameters do not require gradients anymore. Once the first layers of the network are frozen, autograd
+    does not propagate into them at all, which shortens the backward pass. Sensitivity-ranked stages freeze the
+    parameters whose gradients were smallest relative to their values in the steps before.
+    """
+
+    def __init__(self, graph: BaseGraph, parameters: dict[str, torch.Tensor], schedule: Sequence[FreezeStage]) -> None:
+        """
+        :param graph: Quantized PPQ graph
+        :param parameters: Trainable parameters by variable name, e.g., TrainableGraph.state_dict()
+        :param schedule: Freeze stages
+        """
+        self.parameters = parameters
+        self.schedule = sorted(schedule, key=lambda stage: stage.epoch)
+        self.frozen: set[str] = set()
+        self._operations = {name: [op.name for op in graph.variables[name].dest_ops] for name in parameters}
+        self._applied_stages: set[int] = set()
+        self.track_sensitivity = any(stage.fraction is not None for stage in self.schedule)
+        self._sensitivity = dict.fromkeys(parameters, 0.0)
+        self._num_elements = sum(tensor.numel() for tensor in parameters.values())
+
+    @property
+    def trainable_parameters(self) -> list[torch.Tensor]:
+        return [tensor for name, tensor in self.parameters.items() if name not in self.frozen]
+
+    @property
+    def frozen_fraction(self) -> float:
+        """Fraction of frozen parameter elements"""
+        frozen_elements = sum(self.parameters[name].numel() for name in self.frozen)
+        return frozen_elements / max(self._num_elements, 1)
+
+    def update_sensitivity(self) -> None:
+        """Accumulates the gradient magnitudes relative to the parameter magnitudes, call before optimizer steps"""
+        if not self.track_sensitivity:
+            return
+        with torch.no_grad():
+            for name, tensor in self.parameters.items():
+                if name not in self.frozen and tensor.grad is not None:
+                    ratio = tensor.grad.abs().mean() / (tensor.abs().mean() + 1e-12)
+                    self._sensitivity[name] += ratio.item()
+
+    def apply(self, epoch: int) -> list[str]:
+        """
+        Applies the freeze stages due at the start of an epoch
+        :param epoch: Epoch about to be trained
+        :return: Names of the newly frozen parameters
+        """
+        newly_frozen: list[str] = []
+        for idx, stage in enumerate(self.schedule):
+            if stage.epoch > epoch or idx in self._applied_stages:
+                continue
+            self._applied_stages.add(idx)
+            selected = self._select(stage)
+            for name in selected:
+                tensor = self.parameters[name]
+                tensor.requires_grad_(False)
+                tensor.grad = None
+            self.frozen.update(selected)
+            newly_frozen.extend(selected)
+
+        if newly_frozen:
+            logger.info(
+                f"Epoch {epoch}: froze {len(newly_frozen)} parameters, "
+                f"{100 * self.frozen_fraction:.1f}% of all parameter elements are frozen"
+            )
+        return newly_frozen
+
+    def _select(self, stage: FreezeStage) -> list[str]:
+        candidates = [name for name in self.parameters if name not in self.frozen]
+        selected = [name for name in candidates if self._matches(stage, self._operations[name])]
+
+        if stage.fraction is not None:
+            target_elements = math.ceil(stage.fraction * self._num_elements)
+            frozen_elements = sum(self.parameters[name].numel() for name in (*self.frozen, *selected))
+            # least sensitive first, parameters without recorded gradients count as insensitive
+            for name in sorted(set(candidates) - set(selected), key=self._sensitivity.__getitem__):
+                if frozen_elements >= target_elements:
+                    break
+                selected.append(name)
+                frozen_elements += self.parameters[name].numel()
+        return selected
+
+    @staticmethod
+    def _matches(stage: FreezeStage, operation_names: list[str]) -> bool:
+        for op_name in operation_names:
+            block = BLOCK_PATTERN.match(op_name)
+            if stage.blocks is not None and block and int(block.group(1)) < stage.blocks:
+                return True
+            if any(re.search(pattern, op_name) for pattern in stage.layers):
+                return True
+        return False
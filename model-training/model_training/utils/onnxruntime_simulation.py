@@ -0,0 +1,260 @@
+import logging
+import tempfile
+from pathlib import Path
+from typing import Optional, Sequence
+
+import numpy as np
+import onnx
+import onnxruntime as ort
+import torch
+from onnx import TensorProto, helper, numpy_helper
+from ppq.core import RoundingPolicy
+from ppq.executor import TorchExecutor
+from ppq.IR import BaseGraph, QuantableOperation
+from ppq.parser.onnxruntime_exporter import ONNXRUNTIMExporter
+
+logger = logging.getLogger(__name__)
+
+# ONNX Runtime implements int16 QuantizeLinear/DequantizeLinear in its contrib domain
+_CONTRIB_DOMAIN = "com.microsoft"
+
+
+def _rounding_policies(graph: BaseGraph) -> set[RoundingPolicy]:
+    return {
+        config.rounding
+        for operation in graph.operations.values()
+        if isinstance(operation, QuantableOperation)
+        for config, _ in operation.config_with_variable
+    }
+
+
+def _emulate_round_half_up(model: onnx.ModelProto) -> None:
+    """
+    QuantizeLinear rounds half to even, whereas ESP-DL rounds half up. The inputs of all QuantizeLinear nodes are
+    rounded half up on the grid of their scale beforehand, so QuantizeLinear sees exact grid points only. ESP-DL scales
+    are powers of two, hence the division and multiplication are exact.
+    """
+    half = numpy_helper.from_array(np.array(0.5, dtype=np.float32), name="ppq_round_half")
+    model.graph.initializer.append(half)
+    ranks = _tensor_ranks(model)
+
+    nodes = []
+    for idx, node in enumerate(model.graph.node):
+        if node.op_type == "QuantizeLinear":
+            x, scale = node.input[0], node.input[1]
+            prefix = f"ppq_round_{idx}"
+            axis = next((helper.get_attribute_value(attr) for attr in node.attribute if attr.name == "axis"), None)
+            if axis is not None and _tensor_size(model, scale) != 1:
+                rank = ranks.get(x)
+                if rank is None:
+                    logger.warning(f"Unknown rank of {x}, rounding of {node.name} is not emulated")
+                    nodes.append(node)
+                    continue
+                # broadcast per-channel scales, e.g., [C] -> [C, 1, 1] for axis 1 of NCHW tensors
+                axis = axis % rank
+                shape = numpy_helper.from_array(
+                    np.array([-1] + [1] * (rank - 1 - axis), dtype=np.int64), name=f"{prefix}_shape"
+                )
+                model.graph.initializer.append(shape)
+                nodes.append(
+                    helper.make_node("Reshape", [scale, shape.name], [f"{prefix}_scale"], name=f"{prefix}_scale")
+                )
+                scale = f"{prefix}_scale"
+            nodes.extend(
+                [
+                    helper.make_node("Div", [x, scale], [f"{prefix}_div"], name=f"{prefix}_div"),
+                    helper.make_node("Add", [f"{prefix}_div", half.name], [f"{prefix}_add"], name=f"{prefix}_add"),
+                    helper.make_node("Floor", [f"{prefix}_add"], [f"{prefix}_floor"], name=f"{prefix}_floor"),
+                    helper.make_node("Mul", [f"{prefix}_floor", scale], [f"{prefix}_mul"], name=f"{prefix}_mul"),
+                ]
+            )
+            node.input[0] = f"{prefix}_mul"
+        nodes.append(node)
+    del model.graph.node[:]
+    model.graph.node.extend(nodes)
+
+
+def _tensor_ranks(model: onnx.ModelProto) -> dict[str, int]:
+    """Ranks of the graph inputs, initializers and tensors with an inferred shape"""
+    inferred = onnx.shape_inference.infer_shapes(model)
+    ranks = {initializer.name: len(initializer.dims) for initializer in inferred.graph.initializer}
+    for value_info in [*inferred.graph.input, *inferred.graph.value_info, *inferred.graph.output]:
+        if value_info.type.tensor_type.HasField("shape"):
+            ranks[value_info.name] = len(value_info.type.tensor_type.shape.dim)
+    return ranks
+
+
+def _tensor_size(model: onnx.ModelProto, name: str) -> Optional[int]:
+    """Number of elements of an initializer, None if the tensor is no initializer"""
+    for initializer in model.graph.initializer:
+        if initializer.name == name:
+            return int(np.prod(initializer.dims))
+    return None
+
+
+def _legalize_integer_types(model: onnx.ModelProto) -> None:
+    """
+    Adapts the QDQ nodes of int16 layers, which PPQ exports with integer types unsupported by the default domain:
+    int32 activations are narrowed to int16, int16 nodes are moved to the contrib domain of ONNX Runtime, and int64
+    biases are dequantized ahead of time.
+    """
+    initializers = {initializer.name: initializer for initializer in model.graph.initializer}
+
+    def cast(name: str, dtype: type) -> None:
+        cast_values: np.ndarray = numpy_helper.to_array(initializers[name]).astype(dtype)
+        initializers[name].CopyFrom(numpy_helper.from_array(cast_values, name))
+
+    narrowed = {
+        node.output[0]
+        for node in model.graph.node
+        if node.op_type == "QuantizeLinear" and initializers[node.input[2]].data_type == TensorProto.INT32
+    }
+    for value_info in model.graph.value_info:
+        if value_info.name in narrowed:
+            value_info.type.tensor_type.elem_type = TensorProto.INT16
+
+    nodes = []
+    for node in model.graph.node:
+        if node.op_type == "QuantizeLinear" and node.output[0] in narrowed:
+            cast(node.input[2], np.int16)
+            node.domain = _CONTRIB_DOMAIN
+        elif node.op_type == "DequantizeLinear" and node.input[0] in narrowed:
+            cast(node.input[2], np.int16)
+            node.domain = _CONTRIB_DOMAIN
+        elif node.op_type == "DequantizeLinear" and node.input[0] in initializers:
+            values = numpy_helper.to_array(initializers[node.input[0]])
+            if values.dtype == np.int64:
+                scale = numpy_helper.to_array(initializers[node.input[1]])
+                zero_point = numpy_helper.to_array(initializers[node.input[2]])
+                dequantized = (values.astype(np.float32) - zero_point.astype(np.float32)) * scale
+                model.graph.initializer.append(numpy_helper.from_array(dequantized, node.output[0]))
+                continue
+            cast(node.input[2], values.dtype.type)
+            if values.dtype == np.int16:
+                node.domain = _CONTRIB_DOMAIN
+        nodes.append(node)
+    del model.graph.node[:]
+    model.graph.node.extend(nodes)
+
+    # drop integer tensors and quantization parameters of the dequantized biases
+    used = {name for node in nodes for name in node.input}
+    used.update(output.name for output in model.graph.output)
+    unused = [initializer for initializer in model.graph.initializer if initializer.name not in used]
+    for initializer in unused:
+        model.graph.initializer.remove(initializer)
+
+    if any(node.domain == _CONTRIB_DOMAIN for node in nodes) and all(
+        opset.domain != _CONTRIB_DOMAIN for opset in model.opset_import
+    ):
+        model.opset_import.append(helper.make_opsetid(_CONTRIB_DOMAIN, 1))
+
+
+def export_qdq_onnx(graph: BaseGraph, onnx_path: Path, exact_rounding: bool = True) -> Path:
+    """
+    Exports a calibrated PPQ graph as ONNX model with QuantizeLinear/DequantizeLinear nodes, carrying the scales and
+    zero points of the quantization configs. The graph itself is not modified.
+    :param graph: Calibrated PPQ graph
+    :param onnx_path: Path to the exported .onnx model file
+    :param exact_rounding: Emulate the round half up policy of ESP-DL in front of every QuantizeLinear node
+    :return: Path to the exported .onnx model file
+    """
+    onnx_path.parent.mkdir(parents=True, exist_ok=True)
+    # PPQ exporters modify the graph in-place
+    ONNXRUNTIMExporter().export(onnx_path.as_posix(), graph.copy())
+
+    model = onnx.load(onnx_path.as_posix())
+    _legalize_integer_types(model)
+    if exact_rounding and RoundingPolicy.ROUND_HALF_UP in _rounding_policies(graph):
+        _emulate_round_half_up(model)
+    onnx.save(model, onnx_path.as_posix())
+    return onnx_path
+
+
+class OnnxRuntimeExecutor:
+    """
+    Executes a calibrated PPQ graph with ONNX Runtime instead of PPQ's op-by-op TorchExecutor, e.g., for validation.
+
+    The graph is exported as QDQ ONNX model (cf. export_qdq_onnx). With exact rounding, the QDQ nodes are executed as
+    float operations, matching PPQ's fake quantization up to floating point accumulation order. Without it, ONNX
+    Runtime fuses the QDQ nodes into integer kernels, which is faster but rounds half to even.
+    """
+
+    def __init__(
+        self,
+        graph: BaseGraph,
+        device: str = "cpu",
+        exact_rounding: bool = True,
+        onnx_path: Optional[Path] = None,
+    ) -> None:
+        """
+        :param graph: Calibrated PPQ graph
+        :param device: Device used for execution, either cpu or cuda
+        :param exact_rounding: Match the rounding of PPQ exactly (cf. export_qdq_onnx)
+        :param onnx_path: Path to store the exported .onnx model. A temporary file is used if not set.
+        """
+        self.device = device
+        self.output_names = list(graph.outputs)
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            export_path = onnx_path or Path(tmp_dir) / "qdq_model.onnx"
+            export_qdq_onnx(graph, export_path, exact_rounding=exact_rounding)
+
+            options = ort.SessionOptions()
+            if exact_rounding:
+                # QDQ fusion would replace the emulated rounding by integer kernels
+                options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_BASIC
+            providers = ["CPUExecutionProvider"]
+            if device == "cuda":
+                providers.insert(0, "CUDAExecutionProvider")
+            self.session = ort.InferenceSession(export_path.as_posix(), sess_options=options, providers=providers)
+        self.input_names = [session_input.name for session_input in self.session.get_inputs()]
+
+    def forward(
+        self,
+        inputs: torch.Tensor | Sequence[torch.Tensor] | dict[str, torch.Tensor],
+        output_names: Optional[list[str]] = None,
+    ) -> list[torch.Tensor]:
+        """
+        Runs the model, with the same call signature as TorchExecutor.forward
+        :param inputs: Input tensor, list of input tensors or mapping of input names to tensors
+        :param output_names: Names of the requested outputs. All graph outputs are returned if not set.
+        :return: Output tensors
+        """
+        if isinstance(inputs, torch.Tensor):
+            inputs = [inputs]
+        if not isinstance(inputs, dict):
+            inputs = dict(zip(self.input_names, inputs))
+        feeds = {name: tensor.detach().cpu().numpy() for name, tensor in inputs.items()}
+        outputs = self.session.run(output_names or self.output_names, feeds)
+        return [torch.from_numpy(output).to(self.device) for output in outputs]
+
+    def __call__(
+        self,
+        inputs: torch.Tensor | Sequence[torch.Tensor] | dict[str, torch.Tensor],
+        output_names: Optional[list[str]] = None,
+    ) -> list[torch.Tensor]:
+        return self.forward(inputs, output_names)
+
+
+def parity_check(
+    graph: BaseGraph, executor: OnnxRuntimeExecutor, inputs: Sequence[torch.Tensor], device: str = "cpu"
+) -> dict[str, float]:
+    """
+    Compares the outputs of ONNX Runtime execution against PPQ's TorchExecutor
+    :param graph: Calibrated PPQ graph
+    :param executor: ONNX Runtime executor of the graph
+    :param inputs: Input tensors
+    :param device: Device used by the TorchExecutor
+    :return: Maximum absolute error per output
+    """
+    torch_executor = TorchExecutor(graph=graph, device=device)
+    errors = dict.fromkeys(executor.output_names, 0.0)
+    for x in inputs:
+        references = torch_executor.forward(inputs=x.to(device), output_names=executor.output_names)
+        outputs = executor.forward(x, output_names=executor.output_names)
+        for name, reference, output in zip(executor.output_names, references, outputs):
+            error = (reference.detach().cpu() - output.cpu()).abs().max().item()
+            errors[name] = max(errors[name], error)
+    for name, error in errors.items():
+        logger.info(f"ONNX Runtime parity of {name}: max abs error {error:.6f}")
+    return errors
@@ -27,6 +27,11 @@ from torch.utils.data import DataLoader
 
 from model_training.core.constants import TARGET_PLATFORM
 from model_training.core.schemas import QuantizationArgs
+from model_training.utils.adaptive_calibration import AdaptiveRuntimeCalibrationPass
+from model_training.utils.calibration_cache import (
+    CachedRuntimeCalibrationPass,
+    calibration_cache_path,
+)
 from model_training.utils.datasets import CalibrationDataset
 
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
@@ -45,6 +50,9 @@ class QuantizationSetup:
         self.num_bits = quantization_settings.num_bits
         self.calib_steps = quantization_settings.calib_steps
         self.dispatching_override = quantization_settings.dispatching_override
+        self.calib_cache_dir = quantization_settings.calib_cache_dir
+        self.calib_tolerance = quantization_settings.calib_tolerance
+        self.calib_min_steps = min(quantization_settings.calib_min_steps, self.calib_steps)
         self.graph: Optional[BaseGraph] = None
         self.executor: Optional[TorchExecutor] = None
         self.quantizer: Optional[PFL.Quantizer] = None
@@ -117,17 +125,48 @@ class QuantizationSetup:
 
         return self.executor
 
-    def create_calibration_pipeline(self) -> PFL.Pipeline:
-        """Create calibration pipeline."""
+    def create_calibration_pipeline(self, calib_data_path: Optional[Path] = None, batch_size: int = 1) -> PFL.Pipeline:
+        """
+        Create calibration pipeline.
+        :param calib_data_path: Calibration dataset directory. Activation statistics are cached per ONNX graph and
+            calibration set if given and a calibration cache directory is configured.
+        :param batch_size: Number of images per calibration step of the calibration dataloader
+        """
         if self.quantizer is None:
             raise ValueError("Quantizer must be initialized")
 
+        calibration_pass: RuntimeCalibrationPass
+        if self.calib_cache_dir and calib_data_path:
+            cache_path = calibration_cache_path(
+                Path(self.calib_cache_dir),
+                self.onnx_path,
+                calib_data_path,
+                "kl",
+                self.calib_steps,
+                self.calib_tolerance,
+                batch_size,
+            )
+            calibration_pass = CachedRuntimeCalibrationPass(
+                cache_path,
+                method="kl",
+                calib_steps=self.calib_steps,
+                tolerance=self.calib_tolerance,
+                min_steps=self.calib_min_steps,
+            )
+        else:
+            calibration_pass = AdaptiveRuntimeCalibrationPass(
+                method="kl",
+                calib_steps=self.calib_steps,
+                tolerance=self.calib_tolerance,
+                min_steps=self.calib_min_steps,
+            )
+
         return PFL.Pipeline(
             [
                 QuantizeSimplifyPass(),
                 QuantizeFusionPass(activation_type=self.quantizer.activation_fusion_types),
                 ParameterQuantizePass(),
-                RuntimeCalibrationPass(method="kl", calib_steps=self.calib_steps),
+                calibration_pass,
                 PassiveParameterQuantizePass(clip_visiblity=QuantizationVisibility.EXPORT_WHEN_ACTIVE),
                 QuantAlignmentPass(elementwise_alignment="Align to Output"),
             ]
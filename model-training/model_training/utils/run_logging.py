@@ -0,0 +1,278 @@
+import hashlib
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import Any, Literal, Optional, Sequence
+
+from model_training.core.constants import TXT_ENCODING, WANDB_PROJECT
+
+logger = logging.getLogger(__name__)
+
+RunLoggerBackend = Literal["local", "wandb"]
+
+
+class RunLogSink(ABC):
+    """Backend of a RunLogger. All methods are called from the logging thread, never from the training loop."""
+
+    def open(self) -> None:
+        """Sets up the backend, e.g., connects to a tracking server"""
+
+    @abstractmethod
+    def log_metrics(self, data: dict[str, Any]) -> None:
+        """
+        :param data: Metrics of a step or epoch
+        """
+
+    @abstractmethod
+    def log_artifact(self, artifact: dict[str, Any]) -> None:
+        """
+        :param artifact: Artifact record with name, type, aliases, metadata and files with their sha256 digest
+        """
+
+    def close(self) -> None:
+        """Flushes and releases the backend"""
+
+    @property
+    def location(self) -> str:
+        """Where the logged run can be viewed"""
+        return ""
+
+
+class LocalRunLogSink(RunLogSink):
+    """Appends metrics and artifact references as JSON lines to files in the run directory"""
+
+    def __init__(self, log_dir: Path, run_name: str, config: dict[str, Any], tags: Sequence[str] = ()) -> None:
+        """
+        :param log_dir: Directory of the log files
+        :param run_name: Name of the run
+        :param config: Run configuration, written to run.json
+        :param tags: Run tags
+        """
+        self.log_dir = log_dir
+        self.run_name = run_name
+        self.config = config
+        self.tags = list(tags)
+
+    def open(self) -> None:
+        self.log_dir.mkdir(parents=True, exist_ok=True)
+        run_info = {"run_name": self.run_name, "tags": self.tags, "start_time": time.time(), "config": self.config}
+        (self.log_dir / "run.json").write_text(json.dumps(run_info, indent=2, default=str), encoding=TXT_ENCODING)
+
+    def log_metrics(self, data: dict[str, Any]) -> None:
+        self._append(self.log_dir / "metrics.jsonl", {"time": time.time(), **data})
+
+    def log_artifact(self, artifact: dict[str, Any]) -> None:
+        self._append(self.log_dir / "artifacts.jsonl", {"time": time.time(), **artifact})
+
+    @staticmethod
+    def _append(file_path: Path, record: dict[str, Any]) -> None:
+        with file_path.open("a", encoding=TXT_ENCODING) as f:
+            f.write(json.dumps(record, default=str) + "\n")
+
+    @property
+    def location(self) -> str:
+        return self.log_dir.as_posix()
+
+
+class WandbRunLogSink(RunLogSink):
+    """Logs metrics and artifacts to Weights & Biases. Requires the wandb package and WANDB_API_KEY."""
+
+    def __init__(self, run_name: str, config: dict[str, Any], tags: Sequence[str] = ()) -> None:
+        """
+        :param run_name: Name of the W&B run
+        :param config: Run configuration
+        :param tags: Run tags
+        """
+        self.run_name = run_name
+        self.config = config
+        self.tags = list(tags)
+        self._run: Any = None
+
+    def open(self) -> None:
+        import wandb
+
+        wandb.login(anonymous="allow", key=os.environ.get("WANDB_API_KEY"), timeout=60)
+        self._run = wandb.init(
+            project=WANDB_PROJECT,
+            name=self.run_name,
+            tags=self.tags,
+            config=self.config,
+            anonymous="allow",
+            force=True,
+        )
+
+    def log_metrics(self, data: dict[str, Any]) -> None:
+        self._run.log(data=data, commit=True)
+
+    def log_artifact(self, artifact: dict[str, Any]) -> None:
+        import wandb
+
+        wandb_artifact = wandb.Artifact(artifact["name"], type=artifact["type"], metadata=artifact["metadata"])
+        for file in artifact["files"]:
+            wandb_artifact.add_file(file["path"])
+        self._run.log_artifact(wandb_artifact, aliases=artifact["aliases"])
+
+    def close(self) -> None:
+        if self._run is not None:
+            self._run.finish()
+
+    @property
+    def location(self) -> str:
+        return self._run.url if self._run is not None else ""
+
+
+class RunLogger:
+    """
+    Non-blocking logger of run metrics and artifacts.
+
+    Calls only enqueue records. A background thread hashes artifact files and forwards the records to the sinks, so
+    slow backends, e.g., uploads or network timeouts, never stall training. A sink that fails to open is disabled, the
+    others keep logging. A logger without sinks discards everything, e.g., on data-parallel ranks other than rank 0.
+    """
+
+    _STOP = object()
+
+    def __init__(self, sinks: Sequence[RunLogSink] = ()) -> None:
+        """
+        :param sinks: Backends receiving the records
+        """
+        self.sinks = list(sinks)
+        self._queue: queue.Queue = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        if self.sinks:
+            self._thread = threading.Thread(target=self._work, name="run-logger", daemon=True)
+            self._thread.start()
+
+    def log_metrics(self, data: dict[str, Any]) -> None:
+        """
+        :param data: Metrics of a step or epoch
+        """
+        if self._thread:
+            self._queue.put_nowait(("metrics", dict(data)))
+
+    def log_artifact(
+        self,
+        name: str,
+        paths: Sequence[Path],
+        artifact_type: str = "model",
+        aliases: Sequence[str] = (),
+        metadata: Optional[dict[str, Any]] = None,
+    ) -> None:
+        """
+        Records files as artifact, referenced by path and sha256 digest
+        :param name: Artifact name
+        :param paths: Files of the artifact
+        :param artifact_type: Artifact type
+        :param aliases: Artifact aliases, e.g., best
+        :param metadata: Artifact metadata, e.g., the run configuration
+        """
+        if self._thread:
+            artifact = {
+                "name": name,
+                "type": artifact_type,
+                "aliases": list(aliases),
+                "metadata": metadata or {},
+                "paths": [Path(path) for path in paths],
+            }
+            self._queue.put_nowait(("artifact", artifact))
+
+    def finish(self, timeout: Optional[float] = None) -> None:
+        """
+        Waits until the queued records are logged and closes the sinks
+        :param timeout: Maximum seconds to wait. Remaining records are dropped if the timeout expires.
+        """
+        if not self._thread:
+            return
+        self._queue.put_nowait((self._STOP, None))
+        self._thread.join(timeout)
+        if self._thread.is_alive():
+            logger.warning(f"Run logger did not finish within {timeout}s, {self._queue.qsize()} records dropped")
+        self._thread = None
+
+    @property
+    def locations(self) -> list[str]:
+        return [sink.location for sink in self.sinks if sink.location]
+
+    def _work(self) -> None:
+        sinks = []
+        for sink in self.sinks:
+            try:
+                sink.open()
+                sinks.append(sink)
+            except Exception:
+                logger.exception(f"Disabling run log backend {type(sink).__name__}, it failed to open")
+
+        while True:
+            kind, record = self._queue.get()
+            if kind is self._STOP:
+                break
+            try:
+                if kind == "artifact":
+                    record = self._reference_files(record)
+            except OSError:
+                logger.exception(f"Failed to read the files of artifact {record['name']}")
+                continue
+            for sink in sinks:
+                try:
+                    if kind == "metrics":
+                        sink.log_metrics(record)
+                    else:
+                        sink.log_artifact(record)
+                except Exception:
+                    logger.exception(f"Run log backend {type(sink).__name__} failed to log {kind}")
+
+        for sink in sinks:
+            try:
+                sink.close()
+            except Exception:
+                logger.exception(f"Run log backend {type(sink).__name__} failed to close")
+
+    @staticmethod
+    def _reference_files(artifact: dict[str, Any]) -> dict[str, Any]:
+        paths = artifact.pop("paths")
+        artifact["files"] = [
+            {"path": path.resolve().as_posix(), "sha256": _sha256(path), "bytes": path.stat().st_size} for path in paths
+        ]
+        return artifact
+
+
+def _sha256(path: Path) -> str:
+    # ppq-free variant of calibration_cache.file_digest, the YOLO trainer logs runs without ppq
+    digest = hashlib.sha256()
+    with path.open("rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def create_run_logger(
+    backends: Sequence[RunLoggerBackend],
+    log_dir: Path,
+    run_name: str,
+    config: dict[str, Any],
+    tags: Sequence[str] = (),
+) -> RunLogger:
+    """
+    Creates a run logger with the given backends
+    :param backends: Names of the backends, local writes JSON lines to log_dir, wandb logs to Weights & Biases
+    :param log_dir: Directory of the local backend
+    :param run_name: Name of the run
+    :param config: Run configuration
+    :param tags: Run tags
+    :return: Run logger
+    """
+    sinks: list[RunLogSink] = []
+    for backend in dict.fromkeys(backends):
+        match backend:
+            case "local":
+                sinks.append(LocalRunLogSink(log_dir, run_name, config, tags))
+            case "wandb":
+                sinks.append(WandbRunLogSink(run_name, config, tags))
+            case _:
+                raise NotImplementedError(f"No run log backend defined for {backend}")
+    return RunLogger(sinks)
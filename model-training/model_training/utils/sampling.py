@@ -0,0 +1,113 @@
+import logging
+import math
+from typing import Iterator, Optional
+
+import torch
+import torch.distributed as dist
+from torch.utils.data import Sampler
+
+from model_training.utils.distributed import get_rank, get_world_size, is_distributed
+
+logger = logging.getLogger(__name__)
+
+
+class LossWeightedSampler(Sampler[int]):
+    """
+    Samples training images in proportion to their last recorded student-teacher loss.
+
+    The first epochs (and images that were never trained on) are sampled uniformly. Later epochs draw as many images
+    as are eligible, with replacement, from p_i = floor / N + (1 - floor) * loss_i / sum(loss). Images with a loss
+    below the skip threshold are not eligible anymore. Data-parallel ranks draw the same sequence and take every
+    world_size-th image of it. Their recorded losses are merged when the next epoch is set.
+    """
+
+    def __init__(
+        self,
+        num_samples: int,
+        floor: float = 0.1,
+        skip_threshold: Optional[float] = None,
+        warmup_epochs: int = 1,
+        seed: int = 0,
+    ) -> None:
+        """
+        :param num_samples: Number of images of the training dataset
+        :param floor: Weight of uniform sampling mixed into the loss-proportional probabilities, in [0, 1]
+        :param skip_threshold: Images whose loss is below this threshold are skipped. Disabled if not set.
+        :param warmup_epochs: Number of epochs sampled uniformly
+        :param seed: Seed of the sample order
+        """
+        super().__init__()
+        if num_samples == 0:
+            raise ValueError("Cannot sample from an empty dataset")
+        self.num_samples = num_samples
+        self.floor = floor
+        self.skip_threshold = skip_threshold
+        self.warmup_epochs = warmup_epochs
+        self.seed = seed
+        self.rank, self.world_size = get_rank(), get_world_size()
+
+        # last recorded loss per image, NaN if never recorded
+        self.losses = torch.full((num_samples,), float("nan"), dtype=torch.float64)
+        self._loss_sums = torch.zeros(num_samples, dtype=torch.float64)
+        self._loss_counts = torch.zeros(num_samples, dtype=torch.float64)
+        self._epoch = 0
+        self._indices = self._draw()
+
+    def record(self, indices: torch.Tensor, losses: torch.Tensor) -> None:
+        """
+        Records the per-image losses of a training step
+        :param indices: Dataset indices of the batch
+        :param losses: Loss per image of the batch
+        """
+        indices = indices.cpu()
+        self._loss_sums.index_add_(0, indices, losses.detach().cpu().to(torch.float64))
+        self._loss_counts.index_add_(0, indices, torch.ones(len(indices), dtype=torch.float64))
+
+    def set_epoch(self, epoch: int) -> None:
+        """Merges the losses recorded since the last call (on all ranks) and draws the images of the epoch"""
+        if is_distributed():
+            dist.all_reduce(self._loss_sums, op=dist.ReduceOp.SUM)
+            dist.all_reduce(self._loss_counts, op=dist.ReduceOp.SUM)
+        recorded = self._loss_counts > 0
+        self.losses[recorded] = self._loss_sums[recorded] / self._loss_counts[recorded]
+        self._loss_sums.zero_()
+        self._loss_counts.zero_()
+
+        self._epoch = epoch
+        self._indices = self._draw()
+
+    def _draw(self) -> list[int]:
+        generator = torch.Generator().manual_seed(self.seed + self._epoch)
+        unseen = torch.isnan(self.losses)
+        if self._epoch < self.warmup_epochs or unseen.any():
+            indices = torch.randperm(self.num_samples, generator=generator)
+        else:
+            eligible = torch.ones(self.num_samples, dtype=torch.bool)
+            if self.skip_threshold is not None:
+                eligible = self.losses >= self.skip_threshold
+            num_eligible = int(eligible.sum())
+            if num_eligible == 0:
+                logger.warning("All images are below the loss skip threshold, sampling uniformly")
+                eligible[:] = True
+                num_eligible = self.num_samples
+
+            losses = torch.where(eligible, self.losses, torch.zeros_like(self.losses))
+            uniform = eligible.to(torch.float64) / num_eligible
+            proportional = losses / losses.sum() if losses.sum() > 0 else uniform
+            probabilities = self.floor * uniform + (1 - self.floor) * proportional
+            indices = torch.multinomial(probabilities, num_eligible, replacement=True, generator=generator)
+            logger.info(
+                f"Epoch {self._epoch}: sampling {num_eligible}/{self.num_samples} images by loss, "
+                f"{len(indices.unique())} distinct"
+            )
+
+        # pad to a multiple of the world size, so all ranks run the same number of steps
+        per_rank = math.ceil(len(indices) / self.world_size)
+        indices = torch.cat([indices, indices[: per_rank * self.world_size - len(indices)]])
+        return indices[self.rank :: self.world_size].tolist()
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(self._indices)
+
+    def __len__(self) -> int:
+        return len(self._indices)
@@ -0,0 +1,269 @@
+import io
+import json
+import logging
+import random
+import tarfile
+from pathlib import Path
+from typing import Any, Iterator, Optional
+
+import torch
+from PIL import Image
+from torch.utils.data import IterableDataset, get_worker_info
+from torchvision import transforms
+
+from model_training.core.constants import SHARD_INDEX_FILE, TXT_ENCODING
+from model_training.core.schemas import DataConfig
+
+logger = logging.getLogger(__name__)
+
+IMAGE_SUFFIXES = (".jpg", ".jpeg", ".png")
+
+
+def _resolve_split_images(dataset_dir: Path, split: str) -> list[Path]:
+    """
+    Resolves the images of a YOLO split, given either as .txt file or as directory relative to the dataset directory.
+    Image paths listed in .txt files are looked up in the images/ directory by file name (cf. TrainDataset).
+    """
+    split_path = dataset_dir / split
+    if split_path.is_file() and split_path.suffix == ".txt":
+        with split_path.open("r", encoding=TXT_ENCODING) as txt_file:
+            names = [Path(line.strip()).name for line in txt_file if line.strip()]
+        return [dataset_dir / "images" / name for name in names]
+    if split_path.is_dir():
+        return sorted(path for path in split_path.iterdir() if path.suffix.lower() in IMAGE_SUFFIXES)
+    raise FileNotFoundError(f"{split_path.as_posix()} is neither a .txt file nor a directory")
+
+
+def _label_path(image_path: Path) -> Path:
+    """Maps an image path to its YOLO label path (images/ -> labels/, suffix -> .txt)."""
+    parts = list(image_path.parts)
+    # replace the last occurrence of the images directory
+    for i in range(len(parts) - 1, -1, -1):
+        if parts[i] == "images":
+            parts[i] = "labels"
+            break
+    return Path(*parts).with_suffix(".txt")
+
+
+def export_yolo_shards(
+    data_config: DataConfig,
+    output_dir: Path,
+    shard_size_mb: int = 256,
+    seed: int = 0,
+) -> Path:
+    """
+    Packs a YOLO dataset (images, labels and split membership) into a few large tar shards.
+
+    Samples are stored as consecutive ``<key>.<ext>`` and ``<key>.txt`` members in random order, such that
+    sequential readers with a small shuffle buffer see a well-mixed stream. An index file maps shards and splits.
+
+    :param data_config: YOLO dataset config
+    :param output_dir: Directory to write shards and index to
+    :param shard_size_mb: Target size of a single shard in MB
+    :param seed: Seed for the sample order within the shards
+    :return: Path to the index file
+    """
+    dataset_dir = Path(data_config.path)
+    if not dataset_dir.is_dir():
+        raise NotADirectoryError(f"{dataset_dir.as_posix()} does not exist or is not a directory")
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    splits: dict[str, list[str]] = {}
+    image_paths: dict[str, Path] = {}
+    for split_name in ("train", "val", "test"):
+        split = getattr(data_config, split_name)
+        if not split:
+            continue
+        keys = []
+        for image_path in _resolve_split_images(dataset_dir, split):
+            if not image_path.exists():
+                logger.warning(f"Skipping missing image {image_path.as_posix()}")
+                continue
+            # samples are keyed by file stem, which must identify an image (an image may be part of several splits)
+            if image_paths.setdefault(image_path.stem, image_path) != image_path:
+                raise ValueError(
+                    f"Images {image_paths[image_path.stem].as_posix()} and {image_path.as_posix()} share the sample "
+                    f"key {image_path.stem}, rename one of them"
+                )
+            keys.append(image_path.stem)
+        splits[split_name] = keys
+
+    if not image_paths:
+        raise FileNotFoundError(f"No images found for dataset {dataset_dir.as_posix()}")
+
+    sample_keys = sorted(image_paths)
+    random.Random(seed).shuffle(sample_keys)
+
+    shard_size = shard_size_mb * 1024**2
+    shards: list[dict[str, Any]] = []
+    shard: Optional[tarfile.TarFile] = None
+    shard_info: dict[str, Any] = {}
+
+    def _add_member(name: str, data: bytes) -> None:
+        member = tarfile.TarInfo(name)
+        member.size = len(data)
+        shard.addfile(member, io.BytesIO(data))  # type: ignore
+
+    try:
+        for key in sample_keys:
+            if shard is None or shard_info["size"] >= shard_size:
+                if shard is not None:
+                    shard.close()
+                shard_info = {"name": f"shard-{len(shards):05d}.tar", "num_samples": 0, "size": 0}
+                shards.append(shard_info)
+                shard = tarfile.open(output_dir / shard_info["name"], "w")
+
+            image_path = image_paths[key]
+            label_path = _label_path(image_path)
+            image_bytes = image_path.read_bytes()
+            label_bytes = label_path.read_bytes() if label_path.exists() else b""
+
+            _add_member(f"{key}{image_path.suffix.lower()}", image_bytes)
+            _add_member(f"{key}.txt", label_bytes)
+            shard_info["num_samples"] += 1
+            shard_info["size"] += len(image_bytes) + len(label_bytes)
+    finally:
+        if shard is not None:
+            shard.close()
+
+    index_path = output_dir / SHARD_INDEX_FILE
+    index = {
+        "version": 1,
+        "num_samples": len(sample_keys),
+        "shards": shards,
+        "splits": splits,
+        "names": data_config.names,
+    }
+    with index_path.open("w", encoding=TXT_ENCODING) as index_file:
+        json.dump(index, index_file)
+
+    logger.info(f"Exported {len(sample_keys)} samples into {len(shards)} shards under {output_dir.as_posix()}")
+    return index_path
+
+
+def iter_shard_samples(shard_path: Path) -> Iterator[tuple[str, bytes, str]]:
+    """
+    Reads a tar shard sequentially and yields its samples
+    :param shard_path: Path to tar shard
+    :return: Iterator of (sample key, encoded image bytes, YOLO label text)
+    """
+    pending: dict[str, dict[str, bytes]] = {}
+    with tarfile.open(shard_path, "r|") as shard:
+        for member in shard:
+            if not member.isfile():
+                continue
+            key, suffix = member.name.rsplit(".", 1)
+            data = shard.extractfile(member).read()  # type: ignore
+            sample = pending.setdefault(key, {})
+            sample["label" if suffix == "txt" else "image"] = data
+            if len(sample) == 2:
+                del pending[key]
+                yield key, sample["image"], sample["label"].decode(TXT_ENCODING)
+
+
+def parse_yolo_label(label_text: str) -> torch.Tensor:
+    """
+    Parses YOLO label text into a tensor
+    :param label_text: Content of a YOLO label file
+    :return: Tensor of shape [N, 5] with rows (class, x_center, y_center, width, height), normalized
+    """
+    rows = [list(map(float, line.split())) for line in label_text.splitlines() if len(line.split()) == 5]
+    return torch.tensor(rows, dtype=torch.float32).reshape(-1, 5)
+
+
+class ShardedImageDataset(IterableDataset):
+    """
+    Streams images (and optionally labels) from tar shards created by ``export_yolo_shards``.
+
+    Shards are read sequentially and distributed over DataLoader workers. Samples are shuffled within a bounded
+    shuffle buffer, which replaces ``shuffle=True`` of map-style datasets.
+    """
+
+    def __init__(
+        self,
+        shards_dir: Path,
+        split: str,
+        img_size: int | tuple[int, int] = 640,
+        shuffle_buffer: int = 0,
+        with_labels: bool = False,
+        seed: int = 0,
+    ) -> None:
+        """
+        Init sharded dataset
+        :param shards_dir: Directory containing the shards and the index file
+        :param split: Split to read (train, val or test)
+        :param img_size: Image size of the returned tensors
+        :param shuffle_buffer: Size of the shuffle buffer. Samples are returned in shard order if 0.
+        :param with_labels: Whether to return (image, labels, key) tuples instead of images
+        :param seed: Seed for shuffling
+        """
+        super().__init__()
+        index_path = shards_dir / SHARD_INDEX_FILE
+        if not index_path.is_file():
+            raise FileNotFoundError(f"No shard index found at {index_path.as_posix()}")
+        with index_path.open("r", encoding=TXT_ENCODING) as index_file:
+            self.index = json.load(index_file)
+
+        self.shards_dir = shards_dir
+        self.shuffle_buffer = shuffle_buffer
+        self.with_labels = with_labels
+        self.seed = seed
+        self._epoch = 0
+
+        if split not in self.index["splits"]:
+            raise ValueError(f"Split {split} not contained in shards, available: {list(self.index['splits'])}")
+        self.keys = set(self.index["splits"][split])
+        self.num_samples = len(self.keys)
+
+        # same transform as CalibrationDataset
+        self.transform = transforms.Compose(
+            [
+                transforms.ToTensor(),
+                transforms.Resize((img_size, img_size) if isinstance(img_size, int) else img_size),
+                transforms.Normalize(mean=[0, 0, 0], std=[1, 1, 1]),
+            ]
+        )
+
+    def __len__(self) -> int:
+        return self.num_samples
+
+    def __iter__(self) -> Iterator[Any]:
+        worker_info = get_worker_info()
+        if worker_info is None:
+            rng = random.Random(self.seed + self._epoch)
+            shards = self.index["shards"]
+        else:
+            # DataLoader seeds workers differently for each epoch
+            rng = random.Random(worker_info.seed)
+            shards = self.index["shards"][worker_info.id :: worker_info.num_workers]
+        self._epoch += 1
+
+        shard_names = [shard["name"] for shard in shards]
+        if self.shuffle_buffer > 0:
+            rng.shuffle(shard_names)
+
+        buffer: list[Any] = []
+        for shard_name in shard_names:
+            for key, image_bytes, label_text in iter_shard_samples(self.shards_dir / shard_name):
+                if key not in self.keys:
+                    continue
+                sample = self._decode(key, image_bytes, label_text)
+                if self.shuffle_buffer <= 0:
+                    yield sample
+                    continue
+                if len(buffer) < self.shuffle_buffer:
+                    buffer.append(sample)
+                    continue
+                idx = rng.randrange(len(buffer))
+                buffer[idx], sample = sample, buffer[idx]
+                yield sample
+
+        rng.shuffle(buffer)
+        yield from buffer
+
+    def _decode(self, key: str, image_bytes: bytes, label_text: str) -> Any:
+        img = Image.open(io.BytesIO(image_bytes)).convert("RGB")
+        img = self.transform(img)
+        if self.with_labels:
+            return img, parse_yolo_label(label_text), key
+        return img
@@ -0,0 +1,89 @@
+import logging
+import multiprocessing
+from concurrent.futures import Future, ProcessPoolExecutor
+from pathlib import Path
+from typing import Optional
+
+import torch
+from ppq.api import load_native_graph
+from ppq.executor import TorchExecutor
+
+from model_training.utils.fast_validation import FastDetectionValidator
+
+logger = logging.getLogger(__name__)
+
+# validator of the side process, set by the process initializer
+_validator: Optional[FastDetectionValidator] = None
+_device = "cpu"
+
+
+def _init_worker(validator: FastDetectionValidator, device: str, num_threads: Optional[int]) -> None:
+    global _validator, _device
+    _validator, _device = validator, device
+    if num_threads:
+        torch.set_num_threads(num_threads)
+
+
+def _validate_native_model(native_path: Path) -> dict[str, float]:
+    graph = load_native_graph(native_path.as_posix())
+    executor = TorchExecutor(graph=graph, device=_device)
+    return _validator(executor.forward, device=_device)  # type: ignore
+
+
+class SideProcessValidator:
+    """
+    Validates exported .native models in a separate process, while training continues in the main process.
+
+    The validation set of the FastDetectionValidator is transferred to the side process once at start-up. Validation
+    runs are executed one after another in submission order, results are delivered through futures.
+    """
+
+    def __init__(
+        self, validator: FastDetectionValidator, device: str = "cpu", num_threads: Optional[int] = None
+    ) -> None:
+        """
+        :param validator: Validator holding the validation set
+        :param device: Device used for validation in the side process
+        :param num_threads: Number of torch threads of the side process. Defaults to torch's choice.
+        """
+        self._pool = ProcessPoolExecutor(
+            max_workers=1,
+            # CUDA and onnxruntime do not survive forking
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(validator, device, num_threads),
+        )
+
+    def submit(self, native_path: Path, after: Optional[Future] = None) -> Future:
+        """
+        Validates a .native model in the side process
+        :param native_path: Path to .native model file
+        :param after: Future of the export writing the model file. Validation starts once it is done.
+        :return: Future resolving to the validation metrics
+        """
+        result: Future = Future()
+
+        def forward(future: Future) -> None:
+            if future.exception() is not None:
+                result.set_exception(future.exception())  # type: ignore
+            else:
+                result.set_result(future.result())
+
+        def start(export: Optional[Future] = None) -> None:
+            if export is not None and export.exception() is not None:
+                result.set_exception(export.exception())  # type: ignore
+                return
+            try:
+                self._pool.submit(_validate_native_model, native_path).add_done_callback(forward)
+            except Exception as e:
+                # e.g., a broken pool, which would otherwise leave the result pending forever
+                result.set_exception(e)
+
+        if after is None:
+            start()
+        else:
+            after.add_done_callback(start)
+        return result
+
+    def close(self) -> None:
+        self._pool.shutdown(wait=True)
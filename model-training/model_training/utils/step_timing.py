@@ -0,0 +1,100 @@
+import logging
+import sys
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Iterator, Optional
+
+import torch
+
+logger = logging.getLogger(__name__)
+
+STEP_PHASES = ("data", "student", "teacher", "loss", "backward", "optimizer", "scheduler")
+
+
+def peak_rss_mb() -> Optional[float]:
+    """
+    :return: Peak resident set size of this process in MB, None if not available on the platform
+    """
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak / 1024**2 if sys.platform == "darwin" else peak / 1024
+
+
+class StepTimer:
+    """
+    Measures the wall-clock time of the phases of QAT training steps.
+
+    The data phase is the time between the end of a step and the arrival of the next batch, i.e., the time spent
+    waiting for the DataLoader. Rolling averages over the last steps are meant for the progress bar, epoch summaries
+    for the step time log. A disabled timer does not measure anything.
+    """
+
+    def __init__(self, enabled: bool = True, window: int = 20, device: str = "cpu") -> None:
+        """
+        :param enabled: Whether to measure
+        :param window: Number of steps of the rolling averages
+        :param device: Training device. CUDA is synchronized at the end of each phase to measure the kernels.
+        """
+        self.enabled = enabled
+        self.synchronize = enabled and device.startswith("cuda")
+        self._rolling: dict[str, deque[float]] = {phase: deque(maxlen=window) for phase in STEP_PHASES}
+        self._epoch_totals = dict.fromkeys(STEP_PHASES, 0.0)
+        self._current = dict.fromkeys(STEP_PHASES, 0.0)
+        self._num_steps = 0
+        self._step_end = time.perf_counter()
+
+    def start_epoch(self) -> None:
+        self._epoch_totals = dict.fromkeys(STEP_PHASES, 0.0)
+        self._num_steps = 0
+        self._step_end = time.perf_counter()
+
+    def batch_ready(self) -> None:
+        """Marks the arrival of the next batch, which ends the data phase"""
+        if self.enabled:
+            self._current = dict.fromkeys(STEP_PHASES, 0.0)
+            self._current["data"] = time.perf_counter() - self._step_end
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        """Measures the enclosed block as phase of the current step. Repeated phases of a step add up."""
+        if not self.enabled:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            if self.synchronize:
+                torch.cuda.synchronize()
+            self._current[name] += time.perf_counter() - start
+
+    def end_step(self) -> None:
+        if not self.enabled:
+            return
+        for phase, seconds in self._current.items():
+            self._rolling[phase].append(seconds)
+            self._epoch_totals[phase] += seconds
+        self._num_steps += 1
+        self._step_end = time.perf_counter()
+
+    def rolling_averages(self) -> dict[str, str]:
+        """
+        :return: Average milliseconds per phase over the last steps, formatted for the progress bar
+        """
+        return {phase: f"{1000 * sum(values) / len(values):.0f}ms" for phase, values in self._rolling.items() if values}
+
+    def epoch_summary(self) -> dict[str, float | int | None]:
+        """
+        :return: Number of steps, average milliseconds per phase and step, and peak RSS in MB of the current epoch
+        """
+        steps = max(self._num_steps, 1)
+        summary: dict[str, float | int | None] = {"steps": self._num_steps}
+        summary.update({f"{phase}_ms": 1000 * total / steps for phase, total in self._epoch_totals.items()})
+        summary["step_ms"] = 1000 * sum(self._epoch_totals.values()) / steps
+        summary["peak_rss_mb"] = peak_rss_mb()
+        return summary
@@ -0,0 +1,246 @@
+import hashlib
+import logging
+import queue
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator, Optional, Sequence
+
+import numpy as np
+import onnx
+import onnxruntime as ort
+import torch
+from onnx import numpy_helper
+
+from model_training.utils.calibration_cache import file_digest
+
+logger = logging.getLogger(__name__)
+
+BATCH_DIM_PARAM = "batch"
+
+
+def export_dynamic_batch_onnx(onnx_model_path: Path, output_path: Optional[Path] = None) -> onnx.ModelProto:
+    """
+    Makes the batch dimension of an ONNX model dynamic, e.g., for models exported with a fixed batch size of one.
+
+    The first dimension of all graph inputs and outputs is replaced by a symbolic dimension. Reshape targets with a
+    leading one copy the batch dimension of their input instead. Intermediate shapes are inferred again.
+    :param onnx_model_path: Path to ONNX model file
+    :param output_path: Path to store the converted .onnx model. The model is not saved if not set.
+    :return: ONNX model with dynamic batch dimension
+    """
+    model = onnx.load(onnx_model_path.as_posix())
+    for value in [*model.graph.input, *model.graph.output]:
+        dims = value.type.tensor_type.shape.dim
+        if dims:
+            dims[0].ClearField("dim_value")
+            dims[0].dim_param = BATCH_DIM_PARAM
+
+    initializers = {initializer.name: initializer for initializer in model.graph.initializer}
+    for node in model.graph.node:
+        if node.op_type == "Reshape" and node.input[1] in initializers:
+            shape = numpy_helper.to_array(initializers[node.input[1]]).copy()
+            if len(shape) > 1 and shape[0] == 1:
+                # 0 copies the dimension of the reshaped tensor
+                shape[0] = 0
+                initializers[node.input[1]].CopyFrom(numpy_helper.from_array(shape, node.input[1]))
+
+    del model.graph.value_info[:]
+    model = onnx.shape_inference.infer_shapes(model)
+    if output_path:
+        onnx.save(model, output_path.as_posix())
+    return model
+
+
+class _BoundSession:
+    """onnxruntime session with IO binding and output buffers per input shape"""
+
+    def __init__(self, session: ort.InferenceSession, device: str) -> None:
+        self.session = session
+        self.device = torch.device(device)
+        self.input_name = session.get_inputs()[0].name
+        self.output_names = [output.name for output in session.get_outputs()]
+        self.binding = session.io_binding()
+        self._buffers: dict[tuple[int, ...], list[tuple[torch.Tensor, np.dtype]]] = {}
+
+    def _output_buffers(self, inputs: torch.Tensor) -> list[tuple[torch.Tensor, np.dtype]]:
+        shape = tuple(inputs.shape)
+        if shape not in self._buffers:
+            # output shapes may depend on the input shape, e.g., for dynamic batch sizes
+            outputs = self.session.run(self.output_names, {self.input_name: inputs.cpu().numpy()})
+            self._buffers[shape] = [(torch.from_numpy(output).to(self.device), output.dtype) for output in outputs]
+        return self._buffers[shape]
+
+    def run(self, inputs: torch.Tensor) -> list[torch.Tensor]:
+        inputs = inputs.detach().to(self.device, dtype=torch.float32).contiguous()
+        buffers = self._output_buffers(inputs)
+        device_type, device_id = self.device.type, self.device.index or 0
+
+        self.binding.bind_input(
+            self.input_name, device_type, device_id, np.float32, list(inputs.shape), inputs.data_ptr()
+        )
+        for name, (buffer, dtype) in zip(self.output_names, buffers):
+            self.binding.bind_output(name, device_type, device_id, dtype, list(buffer.shape), buffer.data_ptr())
+        self.binding.synchronize_inputs()
+        self.session.run_with_iobinding(self.binding)
+        self.binding.synchronize_outputs()
+        return [buffer for buffer, _ in buffers]
+
+
+class TeacherRuntime:
+    """
+    Pool of onnxruntime sessions of the FP32 teacher model used for quantization-aware training.
+
+    The batch dimension of the model is made dynamic (cf. export_dynamic_batch_onnx), so mini-batches of any size are
+    supported. Every session is created once and runs with IO binding: inputs are read from and outputs written to
+    torch tensors directly, without copies. Output buffers are allocated once per input shape and reused by later calls
+    of the same session, so outputs are only valid until the next call and must be cloned if kept.
+    """
+
+    def __init__(
+        self,
+        onnx_model_path: Path,
+        device: str = "cpu",
+        num_sessions: int = 1,
+        intra_op_threads: Optional[int] = None,
+    ) -> None:
+        """
+        :param onnx_model_path: Path to FP32 ONNX model
+        :param device: Device of input and output tensors, either cpu or cuda
+        :param num_sessions: Number of sessions for concurrent callers
+        :param intra_op_threads: Number of threads per session. Defaults to onnxruntime's choice.
+        """
+        if num_sessions < 1:
+            raise ValueError(f"At least one teacher session is required, received {num_sessions}")
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if intra_op_threads:
+            options.intra_op_num_threads = intra_op_threads
+
+        providers = ["CPUExecutionProvider"]
+        if device == "cuda" and "CUDAExecutionProvider" in ort.get_available_providers():
+            providers.insert(0, "CUDAExecutionProvider")
+        elif device == "cuda":
+            logger.warning("CUDAExecutionProvider not available, running the teacher on cpu")
+            device = "cpu"
+
+        self.device = device
+        model = export_dynamic_batch_onnx(onnx_model_path).SerializeToString()
+        self._sessions: queue.Queue[_BoundSession] = queue.Queue()
+        for _ in range(num_sessions):
+            session = ort.InferenceSession(model, sess_options=options, providers=providers)
+            self._sessions.put(_BoundSession(session, device))
+        logger.info(f"Created {num_sessions} teacher session(s) for {onnx_model_path.as_posix()} on {device}")
+
+    @contextmanager
+    def _session(self) -> Iterator[_BoundSession]:
+        session = self._sessions.get()
+        try:
+            yield session
+        finally:
+            self._sessions.put(session)
+
+    def __call__(self, inputs: torch.Tensor) -> list[torch.Tensor]:
+        """
+        Runs the teacher model
+        :param inputs: Input tensor of shape [N, C, H, W]
+        :return: Output tensors on the teacher device, valid until the next call
+        """
+        with self._session() as session:
+            return session.run(inputs)
+
+
+def teacher_cache_path(
+    cache_dir: Path, onnx_model_path: Path, img_paths: Sequence[Path], img_size: tuple[int, int], fp16: bool
+) -> Path:
+    """
+    Directory of the cached teacher outputs for an ONNX model and an ordered list of training images
+    :param cache_dir: Cache directory
+    :param onnx_model_path: Path to FP32 ONNX model
+    :param img_paths: Image paths in dataset order, since outputs are stored by dataset index
+    :param img_size: Image size of the model inputs
+    :param fp16: Whether outputs are stored as float16
+    :return: Path to cache directory
+    """
+    onnx_digest = file_digest(onnx_model_path).hexdigest()[:16]
+    images_digest = hashlib.sha256()
+    for img_path in img_paths:
+        images_digest.update(f"{Path(img_path).as_posix()}:{Path(img_path).stat().st_size}\n".encode())
+    dtype = "fp16" if fp16 else "fp32"
+    return cache_dir / f"{onnx_digest}-{images_digest.hexdigest()[:16]}-{img_size[0]}x{img_size[1]}-{dtype}"
+
+
+class TeacherOutputCache:
+    """
+    Memory-mapped store of the FP32 teacher outputs of every training image, addressed by dataset index.
+
+    Without augmentation, the teacher returns identical outputs for an image in every epoch. Outputs are stored while
+    the first epoch runs, so later epochs (and later runs on the same model and images) read them from disk instead of
+    running the teacher. Each output is kept in an .npy file of shape [num_samples, *output_shape].
+    """
+
+    def __init__(
+        self, cache_dir: Path, teacher: TeacherRuntime, num_samples: int, input_shape: Sequence[int], fp16: bool = False
+    ) -> None:
+        """
+        :param cache_dir: Directory of the .npy files, cf. teacher_cache_path
+        :param teacher: Teacher runtime used to learn the output shapes
+        :param num_samples: Number of images of the training dataset
+        :param input_shape: Input shape of a single image [C, H, W]
+        :param fp16: Store outputs as float16, which halves the cache size
+        """
+        self.cache_dir = cache_dir
+        self.dtype = np.float16 if fp16 else np.float32
+        output_shapes = [tuple(output.shape[1:]) for output in teacher(torch.zeros(1, *input_shape))]
+
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        self._outputs = [
+            self._open(cache_dir / f"output_{idx}.npy", (num_samples, *shape), self.dtype)
+            for idx, shape in enumerate(output_shapes)
+        ]
+        # marks the images whose outputs are stored, written after the outputs
+        self._filled = self._open(cache_dir / "filled.npy", (num_samples,), np.bool_)
+        size_mb = sum(output.nbytes for output in self._outputs) / 1024**2
+        logger.info(
+            f"Teacher output cache at {cache_dir.as_posix()} holds {self.num_filled}/{num_samples} images "
+            f"({size_mb:.1f} MB)"
+        )
+
+    @staticmethod
+    def _open(path: Path, shape: tuple[int, ...], dtype: type) -> np.memmap:
+        if path.is_file():
+            array = np.load(path, mmap_mode="r+")
+            if array.shape == shape and array.dtype == dtype:
+                return array
+            logger.warning(f"Discarding teacher cache file {path.as_posix()} of shape {array.shape}")
+        return np.lib.format.open_memmap(path, mode="w+", dtype=dtype, shape=shape)
+
+    @property
+    def num_filled(self) -> int:
+        return int(self._filled.sum())
+
+    def lookup(self, indices: torch.Tensor) -> Optional[list[torch.Tensor]]:
+        """
+        Reads the stored outputs of a batch
+        :param indices: Dataset indices of the batch
+        :return: Float32 output tensors, or None if an output of the batch is not stored yet
+        """
+        idx = indices.cpu().numpy()
+        if not self._filled[idx].all():
+            return None
+        return [torch.from_numpy(output[idx].astype(np.float32)) for output in self._outputs]
+
+    def store(self, indices: torch.Tensor, outputs: Sequence[torch.Tensor]) -> None:
+        """
+        Stores the teacher outputs of a batch
+        :param indices: Dataset indices of the batch
+        :param outputs: Teacher outputs of shape [N, ...]
+        """
+        idx = indices.cpu().numpy()
+        for cached, output in zip(self._outputs, outputs):
+            cached[idx] = output.detach().cpu().numpy().astype(self.dtype)
+        self._filled[idx] = True
+
+    def flush(self) -> None:
+        for output in self._outputs:
+            output.flush()
+        self._filled.flush()
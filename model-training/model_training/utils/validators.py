@@ -1,11 +1,12 @@
 import json
 from pathlib import Path
-from typing import Any, Callable, Optional
+from typing import Any, Callable, Literal, Optional, Sequence
 
 import torch
 import torch.nn.functional as F
 from ppq.api import load_native_graph
 from ppq.executor import TorchExecutor
+from ppq.IR import BaseGraph
 from ultralytics import YOLO
 from ultralytics.data.utils import check_cls_dataset, check_det_dataset
 from ultralytics.models.yolo.detect.val import DetectionValidator
@@ -20,8 +21,52 @@ from ultralytics.utils.torch_utils import (
     smart_inference_mode,
 )
 
+from model_training.utils.calibration_cache import calibration_set_digest, file_digest
+from model_training.utils.onnxruntime_simulation import OnnxRuntimeExecutor
 from model_training.utils.quantization import quantize_yolo
 
+# quantized graph of the current model by (ONNX digest, number of bits, calibration set digest), cleared on change
+_quantized_graphs: dict[tuple[str, int, str], BaseGraph] = {}
+# resized validation batches of the current (dataset split, image size), cleared on change
+_validation_batches: dict[tuple[str, int], list[dict[str, Any]]] = {}
+
+
+def quantized_graph_key(onnx_model_path: Path, num_bits: int, calib_dataset_path: Path) -> tuple[str, int, str]:
+    """
+    :param onnx_model_path: Path to ONNX model file
+    :param num_bits: Number of bits used for quantization
+    :param calib_dataset_path: Path to calibration dataset
+    :return: Key of the quantized graph cache
+    """
+    return file_digest(onnx_model_path).hexdigest(), num_bits, calibration_set_digest(calib_dataset_path)
+
+
+def build_decode_head(
+    nc: int, device, strides: Sequence[float] = (8.0, 16.0, 32.0), ch: Sequence[int] = (32, 64, 128)
+) -> Detect:
+    """
+    Builds the Ultralytics detection head used to decode the raw box and class outputs of the ESP-DL YOLO graph.
+    Only the decoding (DFL and anchors) of the head is used, its convolutions are never executed.
+    :param nc: Number of classes of the dataset
+    :param device: Device of the graph outputs
+    :param strides: Strides of the detection levels
+    :param ch: Input channels per detection level
+    :return: Detection head in evaluation mode
+    """
+    detect_head = Detect(nc=nc, ch=list(ch))
+    detect_head.stride = torch.tensor(strides)
+    return detect_head.to(device).eval()
+
+
+def resize_validation_batch(batch: dict[str, Any], imgsz: int) -> dict[str, Any]:
+    """
+    Resizes the images of an Ultralytics validation batch to the model input size. Images stay uint8.
+    :param batch: Collated batch of an Ultralytics dataloader
+    :param imgsz: Model input size
+    :return: Batch with resized images
+    """
+    return {**batch, "img": F.interpolate(batch["img"], size=(imgsz, imgsz), mode="bilinear", align_corners=False)}
+
 
 class QuantizedModelValidator(DetectionValidator):
     def __init__(self, args=None, _callbacks=None) -> None:
@@ -36,39 +81,57 @@ class QuantizedModelValidator(DetectionValidator):
         self.jdict: list[Any] = []
         self.loss = 0
         self.training = False
+        self.decode_head: Optional[Detect] = None
 
     @staticmethod
-    def ppq_graph_init(quant_func: Callable, device, native_path: Optional[Path] = None, **kwargs):
+    def ppq_graph_init(
+        quant_func: Callable,
+        device,
+        native_path: Optional[Path] = None,
+        backend: Literal["ppq", "onnxruntime"] = "ppq",
+        **kwargs,
+    ):
         """
         Init ppq graph inference.
             # case 1: PTQ graph validation: ppq_graph = quant_func()
             # case 2: QAT graph validation:
                         utilize .native to load the graph
                         while training, the .native model is saved along with .espdl model
+        The graph is either simulated by PPQ's TorchExecutor or exported to a QDQ model executed by ONNX Runtime.
+        The graph quantized by quant_func is cached by ONNX model, number of bits and calibration set, so repeated
+        validations do not quantize again. Only the graph of the most recent model is kept.
         """
         if native_path:
             ppq_graph = load_native_graph(native_path.as_posix())
         else:
-            ppq_graph = quant_func(**kwargs, device=device)
-
+            if not kwargs.get("calib_dataset_path"):
+                raise ValueError("A calibration dataset is required to quantize the model for validation")
+            key = quantized_graph_key(
+                Path(kwargs["onnx_model_path"]), kwargs.get("num_of_bits", 8), Path(kwargs["calib_dataset_path"])
+            )
+            if key not in _quantized_graphs:
+                _quantized_graphs.clear()
+                _quantized_graphs[key] = quant_func(**kwargs, device=device)
+                # quantize_yolo simplifies the ONNX model in place, register the graph for the simplified model too
+                simplified_key = (file_digest(Path(kwargs["onnx_model_path"])).hexdigest(), *key[1:])
+                _quantized_graphs[simplified_key] = _quantized_graphs[key]  # type: ignore
+            ppq_graph = _quantized_graphs[key]
+
+        if backend == "onnxruntime":
+            return OnnxRuntimeExecutor(graph=ppq_graph, device=device)
         executor = TorchExecutor(graph=ppq_graph, device=device)
         return executor
 
     @staticmethod
-    def ppq_graph_inference(executor, task, inputs, device):
-        """ppq graph inference"""
+    def ppq_graph_inference(executor, task, inputs, decode_head: Detect):
+        """ppq graph inference, decoding the raw outputs with the given detection head"""
         graph_outputs = executor(inputs)
         if task == "detect":
             if len(graph_outputs) > 1:
                 x = [torch.cat((graph_outputs[i], graph_outputs[i + 1]), 1) for i in range(0, len(graph_outputs), 2)]
             else:
                 x = graph_outputs
-            detect_model = Detect(nc=80, ch=[32, 64, 128])
-            detect_model.stride = [8.0, 16.0, 32.0]
-            detect_model.to(device)
-
-            y = detect_model._inference(x)
-            return y
+            return decode_head._inference(x)
         else:
             raise NotImplementedError(f"{task} is not supported.")
 
@@ -79,6 +142,9 @@ class QuantizedModelValidator(DetectionValidator):
         native_model_path = self.args.get("native_model_path")
         onnx_model_path = self.args.get("onnx_model_path")
         num_bits = self.args.get("num_bits")
+        calib_dataset_path = self.args.get("calib_dataset_path")
+        espdl_model_path = self.args.get("espdl_model_path") or Path(onnx_model_path).with_suffix(".espdl")
+        simulation_backend = self.args.get("simulation_backend", "ppq")
 
         override_args = kwargs.get("args", {})
         override_args.update(dict(batch=1))
@@ -142,7 +208,16 @@ class QuantizedModelValidator(DetectionValidator):
                 self.args.rect = False  # set to false
 
             self.stride = model.stride  # used in get_dataloader() for padding
-            self.dataloader = self.dataloader or self.get_dataloader(self.data.get(self.args.split), 1)
+            # images are loaded, letterboxed and resized once per dataset split and image size
+            cache_key = (str(self.data.get(self.args.split)), imgsz)
+            if cache_key not in _validation_batches:
+                _validation_batches.clear()
+                self.dataloader = self.dataloader or self.get_dataloader(self.data.get(self.args.split), 1)
+                _validation_batches[cache_key] = [
+                    resize_validation_batch(batch, imgsz)
+                    for batch in TQDM(self.dataloader, desc="Caching validation set", total=len(self.dataloader))
+                ]
+            batches = _validation_batches[cache_key]
 
             model.eval()
             model.warmup(imgsz=(1, 3, imgsz, imgsz))  # warmup
@@ -154,7 +229,7 @@ class QuantizedModelValidator(DetectionValidator):
             Profile(device=self.device),
             Profile(device=self.device),
         )
-        bar = TQDM(self.dataloader, desc=self.get_desc(), total=len(self.dataloader))
+        bar = TQDM(batches, desc=self.get_desc(), total=len(batches))
         self.init_metrics(de_parallel(model))
         self.jdict = []  # empty before each val
 
@@ -162,20 +237,27 @@ class QuantizedModelValidator(DetectionValidator):
             quantize_yolo,
             device="cpu",
             native_path=native_model_path,
-            onnx_model_path=onnx_model_path,
+            backend=simulation_backend,
+            onnx_model_path=Path(onnx_model_path),
+            espdl_model_path=Path(espdl_model_path),
+            calib_dataset_path=calib_dataset_path and Path(calib_dataset_path),
             num_of_bits=num_bits,
         )
+        # decode head is built once, not per batch
+        if self.decode_head is None or self.decode_head.nc != self.data["nc"]:
+            self.decode_head = build_decode_head(self.data["nc"], "cpu")
 
         for batch_i, batch in enumerate(bar):
             self.run_callbacks("on_val_batch_start")
             self.batch_i = batch_i
-            batch["img"] = F.interpolate(batch["img"], size=(640, 640), mode="bilinear", align_corners=False)
+            # preprocessing replaces the cached images and labels in the batch dict
+            batch = dict(batch)
             # Preprocess
             with dt[0]:
                 batch = self.preprocess(batch)
             # Inference
             with dt[1]:
-                preds = self.ppq_graph_inference(executor, "detect", batch["img"], "cpu")
+                preds = self.ppq_graph_inference(executor, "detect", batch["img"], self.decode_head)
             # Loss
             with dt[2]:
                 if self.training:
@@ -192,7 +274,7 @@ class QuantizedModelValidator(DetectionValidator):
         self.speed = dict(
             zip(
                 self.speed.keys(),
-                (x.t / len(self.dataloader.dataset) * 1e3 for x in dt),
+                (x.t / sum(len(batch["im_file"]) for batch in batches) * 1e3 for x in dt),
             )
         )
         self.finalize_metrics()